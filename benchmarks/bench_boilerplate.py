@@ -0,0 +1,92 @@
+"""
+Measure how much --strip-boilerplate removes from crawled documentation.
+
+Serves two generated sites, one laid out like Sphinx (navigation sidebar,
+breadcrumbs, footer) and one like MkDocs Material (header, navigation,
+table of contents, previous/next links, footer), each with --pages pages
+of unique prose. Crawls each with and without a BoilerplateFilter and
+reports, per site, the tokens of the extracted pages before and after
+stripping and the crawl throughput in pages/second.
+
+    python benchmarks/bench_boilerplate.py --pages 200 --paragraphs 6
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+from benchmarks.mock_site import MockSiteServer  # noqa: E402
+
+WORDS = ("the client accepts a request and returns the response while the server keeps each session open until "
+         "its timeout expires so that retries reuse the connection pool configured for every handler").split()
+
+
+def prose(rng, sentences):
+    return " ".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+                    for _ in range(sentences))
+
+
+def make_site(theme, num_pages, paragraphs, seed=0):
+    rng = random.Random(seed)
+    sections = [f"Section {i}" for i in range(min(num_pages, 40))]
+    nav = "".join(f'<li><a href="/docs/page{i}.html">{title}</a></li>' for i, title in enumerate(sections))
+    pages = {}
+    for i in range(num_pages):
+        body = "".join(f"<h2>Part {p}</h2><p>{prose(rng, 4)}</p>" for p in range(paragraphs))
+        links = f'<a href="/docs/page{(i + 1) % num_pages}.html">Next</a> <a href="/docs/page{(i * 7 + 3) % num_pages}.html">See also</a>'
+        if theme == "sphinx":
+            html = (f'<div class="sphinxsidebar"><h3>Navigation</h3><ul>{nav}</ul><h3>Quick search</h3></div>'
+                    f'<div class="related">Example Project 2.1 documentation » Guide »</div>'
+                    f'<div class="body"><h1>Topic {i}</h1>{body}<p>{links}</p></div>'
+                    f'<div class="footer">© Copyright 2024, Example Authors. Created using Sphinx 7.2.6.</div>')
+        else:
+            toc = "".join(f"<li>Part {p}</li>" for p in range(paragraphs))
+            html = (f'<header>Example Project<span>Search</span><span>GitHub</span><span>v2.1</span></header>'
+                    f'<nav class="md-nav"><ul>{nav}</ul></nav><nav class="md-toc">Table of contents<ul>{toc}</ul></nav>'
+                    f'<article><h1>Topic {i}</h1>{body}<p>{links}</p></article>'
+                    f'<footer>Previous Next Copyright 2024 Example Authors Made with Material for MkDocs</footer>')
+        pages[f"/docs/page{i}.html"] = f"<html><head><title>Topic {i}</title></head><body>{html}</body></html>"
+    pages["/docs/"] = pages["/docs/page0.html"]
+    return pages
+
+
+def crawl(server, boilerplate=None):
+    start = time.perf_counter()
+    result = onefilellm.crawl_and_extract_text(server.base_url, max_depth=2, include_pdfs=False, ignore_epubs=True,
+                                               boilerplate=boilerplate)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=6)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    onefilellm.print = lambda *objects, **kwargs: None  # Silence the per-page progress lines
+
+    counter = onefilellm.TokenCounter()
+    counter.count("Load the encoder before timing anything")
+    print(f"{'site':<8} {'pages':>6} {'tokens':>9} {'stripped':>9} {'saved':>6} {'plain p/s':>10} {'strip p/s':>10}")
+    for theme in ("sphinx", "mkdocs"):
+        with MockSiteServer(make_site(theme, args.pages, args.paragraphs)) as server:
+            crawl(server)  # Warm up the worker processes
+            plain_seconds, plain = crawl(server)
+            boilerplate = onefilellm.BoilerplateFilter(counter)
+            strip_seconds, stripped = crawl(server, boilerplate)
+        pages = len(plain["processed_urls"])
+        if stripped["processed_urls"] != plain["processed_urls"]:
+            raise SystemExit("Stripping boilerplate changed the pages crawled")
+        saved = 1 - boilerplate.tokens_after / boilerplate.tokens_before
+        print(f"{theme:<8} {pages:>6} {boilerplate.tokens_before:>9} {boilerplate.tokens_after:>9} {saved:>6.0%} "
+              f"{pages / plain_seconds:>10.0f} {pages / strip_seconds:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compare the streaming compressor with the previous whole-tree preprocess_text.
+
+Builds a flattened <source> document of --files files (or uses --input),
+compresses it with the previous implementation and with preprocess_text at
+each job count, checks the outputs are byte-identical and reports MB/second
+and peak memory of each run.
+
+    python benchmarks/bench_compress.py --files 5000 --jobs 1 2 4
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+
+
+def old_preprocess_text(input_file, output_file):
+    # The previous implementation: whole-document ElementTree, four passes per text
+    stop_words = onefilellm.stop_words
+    with open(input_file, "r", encoding="utf-8") as input_file:
+        input_text = input_file.read()
+
+    def process_text(text):
+        text = re.sub(r"[\n\r]+", "\n", text)
+        text = re.sub(r"[^a-zA-Z0-9\s_.,!?:;@#$%^&*()+\-=[\]{}|\\<>`~'\"/]+", "", text)
+        text = re.sub(r"\s+", " ", text)
+        text = text.lower()
+        words = text.split()
+        words = [word for word in words if word not in stop_words]
+        return " ".join(words)
+
+    try:
+        root = ET.fromstring(input_text)
+        for elem in root.iter():
+            if elem.text:
+                elem.text = process_text(elem.text)
+            if elem.tail:
+                elem.tail = process_text(elem.tail)
+        tree = ET.ElementTree(root)
+        tree.write(output_file, encoding="utf-8", xml_declaration=True)
+    except ET.ParseError:
+        processed_text = process_text(input_text)
+        with open(output_file, "w", encoding="utf-8") as out_file:
+            out_file.write(processed_text)
+
+
+def build_document(path, num_files, file_size):
+    with open(onefilellm.__file__, encoding="utf-8") as f:
+        source = f.read()
+    with open(path, "w", encoding="utf-8") as out:
+        out.write('<source type="local_directory" path="synthetic">')
+        for i in range(num_files):
+            start = (i * 7919) % max(1, len(source) - file_size)
+            out.write(f'\n<file name="pkg{i // 100}/module_{i}.py">\n')
+            out.write(onefilellm.escape_xml(source[start:start + file_size]))
+            out.write('\n</file>')
+        out.write('\n</source>')
+
+
+def measure(target, *args):
+    # Run in a child process so peak RSS belongs to this run alone
+    def run(queue):
+        start = time.perf_counter()
+        target(*args)
+        queue.put((time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run, args=(queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--input", help="Compress an existing uncompressed_output.txt")
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--file-size", type=int, default=8192)
+    parser.add_argument("--jobs", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    directory = tempfile.mkdtemp()
+    try:
+        input_file = args.input or os.path.join(directory, "uncompressed_output.txt")
+        if not args.input:
+            build_document(input_file, args.files, args.file_size)
+        megabytes = os.path.getsize(input_file) / 1e6
+        print(f"{megabytes:.1f} MB input, {os.cpu_count()} CPUs available")
+
+        reference = os.path.join(directory, "reference.txt")
+        seconds, peak = measure(old_preprocess_text, input_file, reference)
+        with open(reference, "rb") as f:
+            expected = f.read()
+        print(f"{'compressor':<24} {'seconds':>8} {'MB/s':>7} {'peak MB':>8}")
+        print(f"{'whole tree (previous)':<24} {seconds:>8.2f} {megabytes / seconds:>7.1f} {peak:>8.0f}")
+
+        for jobs in args.jobs:
+            output = os.path.join(directory, f"compressed_{jobs}.txt")
+            seconds, peak = measure(onefilellm.preprocess_text, input_file, output, jobs)
+            with open(output, "rb") as f:
+                if f.read() != expected:
+                    raise SystemExit(f"Streaming output with {jobs} jobs differs from the previous implementation")
+            label = f"streaming, {jobs} jobs"
+            print(f"{label:<24} {seconds:>8.2f} {megabytes / seconds:>7.1f} {peak:>8.0f}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
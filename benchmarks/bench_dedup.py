@@ -0,0 +1,82 @@
+"""
+Measure what --dedup saves on a local folder with vendored copies.
+
+Generates --files source files and --copies vendored copies of the whole
+tree (as in third_party/ or node_modules-style checkouts that are not
+excluded), writes the folder with and without a Deduplicator and reports
+seconds, output size and tokens. Also reports how fast SimHash
+fingerprints pages of --page-words words for --dedup-near.
+
+    python benchmarks/bench_dedup.py --files 2000 --copies 2
+"""
+import argparse
+import io
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+
+WORDS = ["client", "option", "request", "server", "config", "token", "cache", "page", "returns", "accepts",
+         "value", "handler", "session", "timeout", "retry", "error"]
+
+
+def build_tree(root, num_files, copies):
+    rng = random.Random(0)
+    for i in range(num_files):
+        body = "".join(f"def {rng.choice(WORDS)}_{i}_{j}(value):\n    return value < {j} and value > {i}\n"
+                       for j in range(10))
+        for prefix in ["src"] + [f"third_party/copy{copy}/src" for copy in range(copies)]:
+            path = os.path.join(root, prefix, f"pkg{i // 100}", f"module_{i}.py")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--copies", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--page-words", type=int, default=2000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    directory = tempfile.mkdtemp()
+    try:
+        folder = os.path.join(directory, "tree")
+        build_tree(folder, args.files, args.copies)
+        counter = onefilellm.TokenCounter()
+        print(f"{args.files} files, {args.copies} vendored copies")
+        print(f"{'run':<10} {'seconds':>8} {'MB':>8} {'tokens':>10}")
+        for name, dedup in (("plain", None), ("dedup", onefilellm.Deduplicator(counter=counter))):
+            buffer = io.StringIO()
+            start = time.perf_counter()
+            onefilellm.write_local_folder(folder, buffer, dedup=dedup)
+            elapsed = time.perf_counter() - start
+            text = buffer.getvalue()
+            print(f"{name:<10} {elapsed:>8.2f} {len(text.encode('utf-8')) / 1e6:>8.2f} {counter.count(text):>10}")
+        print(f"saved: {len(dedup.duplicates)} files, {dedup.bytes_saved} bytes, {dedup.tokens_saved} tokens")
+
+        rng = random.Random(1)
+        pages = [" ".join(rng.choice(WORDS) for _ in range(args.page_words)) for _ in range(args.pages)]
+        near = onefilellm.Deduplicator(near=True)
+        start = time.perf_counter()
+        for index, page in enumerate(pages):
+            near.check(f"page{index}", page, page=True)
+        elapsed = time.perf_counter() - start
+        print(f"\nSimHash: {args.pages} pages of {args.page_words} words, {args.pages / elapsed:.0f} pages/s, "
+              f"{len(near.duplicates)} false near-duplicates")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Compare reading an old ref straight from the git object database with
+checking it out into a worktree and walking it.
+
+Builds a throwaway repository with --files files, tags it, then changes every
+file so the tag differs from the working tree.
+
+    python benchmarks/bench_git_ref.py --files 5000
+"""
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-C", repo, "-c", "user.name=bench", "-c", "user.email=bench@example.com", *args],
+                   check=True, capture_output=True)
+
+
+def build_repo(root, num_files, file_size):
+    repo = os.path.join(root, "repo")
+    os.makedirs(repo)
+    git(repo, "init", "-q")
+    body = ("def handler(request):\n    return {'status': 'ok'}\n" * (file_size // 48 + 1))[:file_size]
+    for i in range(num_files):
+        directory = os.path.join(repo, f"pkg{i // 100}", f"sub{i % 7}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module_{i}.py"), "w") as f:
+            f.write(body)
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "initial")
+    git(repo, "tag", "v1")
+    for dirpath, _, files in os.walk(repo):
+        if ".git" in dirpath:
+            continue
+        for name in files:
+            with open(os.path.join(dirpath, name), "a") as f:
+                f.write("# changed after v1\n")
+    return repo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--file-size", type=int, default=4096)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    root = tempfile.mkdtemp()
+    try:
+        repo = build_repo(root, args.files, args.file_size)
+
+        start = time.perf_counter()
+        worktree = os.path.join(root, "worktree")
+        git(repo, "worktree", "add", "-q", "--detach", worktree, "v1")
+        checkout_output = onefilellm.process_local_folder(worktree)
+        git(repo, "worktree", "remove", "--force", worktree)
+        checkout_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ref_output = onefilellm.process_local_git_ref(repo, "v1")
+        ref_seconds = time.perf_counter() - start
+
+        if checkout_output.count("<file ") != ref_output.count("<file "):
+            raise SystemExit("The two strategies emitted a different number of files")
+
+        print(f"{'strategy':<28} {'seconds':>8} {'files/s':>9}")
+        print(f"{'worktree checkout + walk':<28} {checkout_seconds:>8.2f} {args.files / checkout_seconds:>9.0f}")
+        print(f"{'git cat-file --batch':<28} {ref_seconds:>8.2f} {args.files / ref_seconds:>9.0f}")
+        print(f"speedup: {checkout_seconds / ref_seconds:.1f}x")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Compare sequential and concurrent GitHub repository fetching.
+
+Runs process_github_repo against a local mock of the GitHub contents API that
+adds a fixed delay to every request, for a range of worker counts.
+
+    python benchmarks/bench_github_fetch.py --files 400 --latency 0.02
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+from benchmarks.mock_github import MockGitHubServer, make_synthetic_repo  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every mock request")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    files = make_synthetic_repo(num_files=args.files)
+    baseline = None
+    print(f"{'workers':>8} {'seconds':>9} {'files/s':>9} {'speedup':>8}")
+    with MockGitHubServer(files, latency=args.latency) as server:
+        onefilellm.GITHUB_API_URL = server.api_url
+        for workers in args.workers:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                output = onefilellm.process_github_repo(server.repo_url, max_workers=workers)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = (output, elapsed)
+            elif output != baseline[0]:
+                raise SystemExit(f"Output with {workers} workers differs from the sequential run")
+            print(f"{workers:>8} {elapsed:>9.2f} {args.files / elapsed:>9.1f} {baseline[1] / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
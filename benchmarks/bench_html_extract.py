@@ -0,0 +1,70 @@
+"""
+Compare the crawler's HTML text extraction backends.
+
+Runs every extractor in onefilellm.HTML_EXTRACTORS over a corpus of saved
+HTML pages (every *.html / *.htm file under --corpus), or over a generated
+documentation site when no corpus is given, and reports pages/second and how
+many pages produce output different from the BeautifulSoup reference.
+
+    python benchmarks/bench_html_extract.py --corpus ~/saved-pages
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+from benchmarks.mock_site import make_docs_site  # noqa: E402
+
+
+def load_corpus(directory):
+    pages = {}
+    for dirpath, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.endswith((".html", ".htm")):
+                path = os.path.join(dirpath, name)
+                with open(path, "rb") as f:
+                    pages[path] = f.read()
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", help="Directory of saved HTML pages")
+    parser.add_argument("--pages", type=int, default=500, help="Generated pages when no corpus is given")
+    parser.add_argument("--paragraphs", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus per extractor")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.corpus:
+        pages = load_corpus(args.corpus)
+    else:
+        pages = {path: html.encode("utf-8")
+                 for path, html in make_docs_site(num_pages=args.pages, paragraphs=args.paragraphs).items()}
+    total_bytes = sum(len(page) for page in pages.values())
+    print(f"{len(pages)} pages, {total_bytes / 1e6:.1f} MB")
+
+    reference = {path: onefilellm.extract_html_beautifulsoup(page) for path, page in pages.items()}
+    print(f"{'extractor':<14} {'seconds':>8} {'pages/s':>9} {'MB/s':>7} {'different':>10}")
+    for name, extract in onefilellm.HTML_EXTRACTORS.items():
+        if name == "lxml" and not onefilellm.LXML_AVAILABLE:
+            print(f"{name:<14} not installed")
+            continue
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            results = {path: extract(page) for path, page in pages.items()}
+        elapsed = (time.perf_counter() - start) / args.repeat
+        different = [path for path in pages if results[path] != reference[path]]
+        print(f"{name:<14} {elapsed:>8.2f} {len(pages) / elapsed:>9.0f} {total_bytes / 1e6 / elapsed:>7.1f} "
+              f"{len(different):>10}")
+        for path in different[:5]:
+            print(f"  differs: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Compare reading large local files whole with streaming them from a memory map.
+
+Generates a folder with --files JSON files of --size-mb MB each (plus a
+binary file with a text extension) and writes its output to a hashing sink:
+
+  whole      the previous read: each file read, decoded and escaped as one string
+  streamed   write_local_folder without a size cap, large files streamed in chunks
+  capped     write_local_folder with the default --max-file-size
+
+Reports seconds and peak Python memory (tracemalloc; memory-mapped pages are
+not counted, as they are not Python objects) and checks the streamed output
+matches the whole read.
+
+    python benchmarks/bench_large_files.py --files 4 --size-mb 64
+"""
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+
+
+class HashingSink:
+    def __init__(self):
+        self.sha = hashlib.sha1()
+
+    def write(self, text):
+        self.sha.update(text.encode("utf-8"))
+
+
+def build_tree(root, num_files, size_mb):
+    os.makedirs(root)
+    record = b'{"id": 12345, "name": "value <tag> & more", "tags": ["a", "b"]},\r\n'
+    for i in range(num_files):
+        with open(os.path.join(root, f"data_{i}.json"), "wb") as f:
+            for _ in range(size_mb * 1024 * 1024 // len(record)):
+                f.write(record)
+    with open(os.path.join(root, "archive.txt"), "wb") as f:
+        f.write(b"PK\3\4\0\0" + os.urandom(1024 * 1024))
+
+
+def whole_read(folder, sink):
+    # The previous per-file read, with the same walk and document structure
+    writer = onefilellm.FragmentWriter(sink)
+    writer.write(f'<source type="local_directory" path="{onefilellm.escape_xml(folder)}">')
+    for file_path, relative_path in onefilellm.iter_local_folder_files(folder):
+        with open(file_path, "rb") as f:
+            data = f.read()
+        if b"\0" in data[:onefilellm.LOCAL_SNIFF_BYTES]:
+            continue
+        writer.write(f'<file name="{onefilellm.escape_xml(relative_path)}">')
+        writer.write(onefilellm.escape_xml(onefilellm.decode_text(data)))
+        writer.write('</file>')
+    writer.write('</source>')
+
+
+def measure(function, *args):
+    sink = HashingSink()
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args, sink)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, sink.sha.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=64)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    directory = tempfile.mkdtemp()
+    try:
+        folder = os.path.join(directory, "tree")
+        build_tree(folder, args.files, args.size_mb)
+        print(f"{args.files} files of {args.size_mb} MB")
+        print(f"{'read':<10} {'seconds':>8} {'peak MB':>8}")
+        results = {}
+        for name, function, function_args in (
+            ("whole", whole_read, (folder,)),
+            ("streamed", lambda folder, sink: onefilellm.write_local_folder(
+                folder, sink, limits=onefilellm.LocalFileLimits(0)), (folder,)),
+            ("capped", lambda folder, sink: onefilellm.write_local_folder(folder, sink), (folder,)),
+        ):
+            seconds, peak, results[name] = measure(function, *function_args)
+            print(f"{name:<10} {seconds:>8.2f} {peak / (1024 * 1024):>8.1f}")
+        if results["streamed"] != results["whole"]:
+            raise SystemExit("The streamed output differs from reading the files whole")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Measure incremental re-ingestion of a local folder with a LocalManifest.
+
+Generates a tree of --files files, then times a stat-only walk of it, a
+full run without a manifest, the first run with a manifest, a re-run with
+nothing changed and a re-run after --changed files were edited. Every
+run's output is checked against the run without a manifest.
+
+    python benchmarks/bench_local_manifest.py --files 50000 --changed 100
+"""
+import argparse
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+
+
+def build_tree(root, num_files, file_size):
+    line = "def handler(request):\n    return {'status': 'ok', 'value': 42}\n"
+    body = (line * (file_size // len(line) + 1))[:file_size]
+    paths = []
+    for i in range(num_files):
+        directory = os.path.join(root, f"pkg{i // 500}", f"sub{(i // 50) % 10}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"module_{i}.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(body)
+        # Old enough that the manifest trusts their stat on the next run
+        os.utime(path, (time.time() - 3600,) * 2)
+        paths.append(path)
+    return paths
+
+
+def stat_walk(folder):
+    for file_path, _ in onefilellm.iter_local_folder_files(folder):
+        os.stat(file_path)
+
+
+def ingest(folder, manifest=None):
+    buffer = io.StringIO()
+    onefilellm.write_local_folder(folder, buffer, manifest=manifest)
+    return buffer.getvalue()
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--file-size", type=int, default=2048)
+    parser.add_argument("--changed", type=int, default=100)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    directory = tempfile.mkdtemp()
+    try:
+        folder = os.path.join(directory, "tree")
+        paths = build_tree(folder, args.files, args.file_size)
+        manifest = onefilellm.LocalManifest(os.path.join(directory, "local_manifest.sqlite"))
+        print(f"{args.files} files of {args.file_size} bytes")
+        print(f"{'run':<28} {'seconds':>8} {'unchanged':>10} {'read':>7}")
+
+        seconds, _ = timed(stat_walk, folder)
+        print(f"{'stat walk':<28} {seconds:>8.2f}")
+        seconds, expected = timed(ingest, folder)
+        print(f"{'no manifest':<28} {seconds:>8.2f}")
+
+        def run(label):
+            unchanged, read = manifest.unchanged, manifest.read
+            seconds, output = timed(ingest, folder, manifest)
+            if output != ingest(folder):
+                raise SystemExit(f"{label}: output differs from a run without the manifest")
+            print(f"{label:<28} {seconds:>8.2f} {manifest.unchanged - unchanged:>10} {manifest.read - read:>7}")
+
+        if ingest(folder, manifest) != expected:
+            raise SystemExit("first run: output differs from a run without the manifest")
+        print(f"{'manifest, first run':<28} {'':>8} {manifest.unchanged:>10} {manifest.read:>7}")
+        run("manifest, nothing changed")
+        for path in paths[::max(1, len(paths) // max(1, args.changed))][:args.changed]:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("# edited\n")
+        run(f"manifest, {args.changed} files edited")
+        manifest.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Measure how local folder ingestion scales with --jobs.
+
+Generates a tree of source files (plus a share of notebooks, which go through
+the notebook converter) and reports files/second and MB/second for each job
+count, checking that every run produces identical output.
+
+    python benchmarks/bench_local_parallel.py --files 4000 --jobs 1 2 4 8
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+
+
+def build_tree(root, num_files, file_size, notebook_every):
+    total_bytes = 0
+    body = ("def handler(request):\n    return {'status': 'ok', 'items': [1, 2, 3]}\n" * (file_size // 64 + 1))[:file_size]
+    notebook = json.dumps({
+        "cells": [
+            {"cell_type": "markdown", "metadata": {}, "source": ["# Analysis\n", "Some notes."]},
+            {"cell_type": "code", "execution_count": 1, "metadata": {}, "outputs": [], "source": body.splitlines(True)},
+        ],
+        "metadata": {"language_info": {"name": "python"}},
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    })
+    for i in range(num_files):
+        directory = os.path.join(root, f"pkg{i // 200}", f"sub{i % 9}")
+        os.makedirs(directory, exist_ok=True)
+        if notebook_every and i % notebook_every == 0:
+            name, text = f"notebook_{i}.ipynb", notebook
+        else:
+            name, text = f"module_{i}.py", body
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(text)
+        total_bytes += len(text)
+    return total_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=4000)
+    parser.add_argument("--file-size", type=int, default=8192)
+    parser.add_argument("--notebook-every", type=int, default=20, help="Make every Nth file a notebook (0 = none)")
+    parser.add_argument("--jobs", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    root = tempfile.mkdtemp()
+    try:
+        total_bytes = build_tree(root, args.files, args.file_size, args.notebook_every)
+        print(f"{args.files} files, {total_bytes / 1e6:.1f} MB, {os.cpu_count()} CPUs available")
+        print(f"{'jobs':>5} {'seconds':>8} {'files/s':>9} {'MB/s':>7} {'speedup':>8}")
+        baseline = None
+        for jobs in args.jobs:
+            start = time.perf_counter()
+            output = onefilellm.process_local_folder(root, jobs=jobs)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = (output, elapsed)
+            elif output != baseline[0]:
+                raise SystemExit(f"Output with --jobs {jobs} differs from the single-process run")
+            print(f"{jobs:>5} {elapsed:>8.2f} {args.files / elapsed:>9.0f} {total_bytes / 1e6 / elapsed:>7.1f} "
+                  f"{baseline[1] / elapsed:>7.1f}x")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compare the fast notebook converter with nbconvert's PythonExporter.
+
+Generates --notebooks notebooks with markdown cells, code cells (some using
+IPython magics) and outputs, converts each with both backends, checks the
+results are identical and reports notebooks/second. The import cost of
+each backend is measured in a fresh interpreter.
+
+    python benchmarks/bench_notebooks.py --notebooks 500 --cells 30
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+
+CODE = [
+    "import numpy as np\nimport pandas as pd",
+    "df = pd.read_csv('data.csv')\ndf.head()",
+    "for i in range(10):\n    print(i, i ** 2)",
+    "def normalise(values):\n    total = sum(values)\n    return [value / total for value in values]",
+    "%matplotlib inline\nplt.plot(xs, ys)",
+    "!pip install requests",
+    "result = model.fit(x_train, y_train)\nresult.score(x_test, y_test)",
+]
+MARKDOWN = [
+    "# Exploratory analysis\n\nLoad the data and look at the **first rows**.",
+    "## Results\n\n- accuracy: 0.93\n- recall: 0.88",
+    "Some notes about the `normalise` helper.",
+]
+
+
+def make_notebook(rng, cells):
+    notebook_cells = []
+    for index in range(cells):
+        if rng.random() < 0.3:
+            notebook_cells.append({"cell_type": "markdown", "metadata": {}, "source": rng.choice(MARKDOWN).splitlines(True)})
+        else:
+            notebook_cells.append({
+                "cell_type": "code", "execution_count": index + 1, "metadata": {},
+                "outputs": [{"output_type": "stream", "name": "stdout", "text": ["0 0\n", "1 1\n", "2 4\n"]}],
+                "source": rng.choice(CODE).splitlines(True),
+            })
+    return json.dumps({"cells": notebook_cells, "metadata": {"language_info": {"name": "python"}},
+                       "nbformat": 4, "nbformat_minor": 5})
+
+
+def import_seconds(statement):
+    code = f"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+    return float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notebooks", type=int, default=500)
+    parser.add_argument("--cells", type=int, default=30)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rng = random.Random(0)
+    notebooks = [make_notebook(rng, args.cells) for _ in range(args.notebooks)]
+    print(f"{args.notebooks} notebooks of {args.cells} cells")
+    print(f"{'converter':<12} {'import s':>9} {'seconds':>8} {'notebooks/s':>12}")
+    results = {}
+    for name, convert, statement in (
+        ("nbconvert", onefilellm.convert_notebook_nbconvert, "import nbformat, nbconvert"),
+        ("fast", onefilellm.convert_notebook_fast, "import json"),
+    ):
+        imported = import_seconds(statement)
+        start = time.perf_counter()
+        results[name] = [convert(notebook) for notebook in notebooks]
+        elapsed = time.perf_counter() - start
+        print(f"{name:<12} {imported:>9.2f} {elapsed:>8.2f} {args.notebooks / elapsed:>12.0f}")
+    if results["fast"] != results["nbconvert"]:
+        raise SystemExit("The fast converter's output differs from nbconvert's")
+
+
+if __name__ == "__main__":
+    main()
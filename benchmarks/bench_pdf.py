@@ -0,0 +1,81 @@
+"""
+Measure PDF text extraction: the old temp-file, one-page-at-a-time path
+against in-memory extraction with a varying number of worker processes.
+
+Uses every *.pdf under --pdfs, or generated papers when none is given, and
+checks that every strategy extracts identical text.
+
+    python benchmarks/bench_pdf.py --pdfs ~/papers --jobs 1 2 4 8
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+from PyPDF2 import PdfReader  # noqa: E402
+
+import onefilellm  # noqa: E402
+from benchmarks.mock_pdf import make_pdf  # noqa: E402
+
+
+def extract_via_temp_file(data, directory):
+    # What process_pdf used to do: write temp.pdf, read it back, extract serially
+    path = os.path.join(directory, "temp.pdf")
+    with open(path, "wb") as f:
+        f.write(data)
+    text = []
+    with open(path, "rb") as f:
+        reader = PdfReader(f)
+        for page in range(len(reader.pages)):
+            text.append(reader.pages[page].extract_text())
+    os.remove(path)
+    return " ".join(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pdfs", help="Directory of sample PDFs")
+    parser.add_argument("--papers", type=int, default=4, help="Generated papers when no directory is given")
+    parser.add_argument("--pages", type=int, default=60, help="Pages per generated paper")
+    parser.add_argument("--jobs", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.pdfs:
+        documents = []
+        for dirpath, _, files in os.walk(args.pdfs):
+            for name in sorted(files):
+                if name.lower().endswith(".pdf"):
+                    with open(os.path.join(dirpath, name), "rb") as f:
+                        documents.append(f.read())
+    else:
+        documents = [make_pdf(num_pages=args.pages, lines_per_page=50, title=f"Paper {i}") for i in range(args.papers)]
+    total_pages = sum(len(PdfReader(io.BytesIO(data)).pages) for data in documents)
+    print(f"{len(documents)} PDFs, {total_pages} pages, {sum(map(len, documents)) / 1e6:.1f} MB, "
+          f"{os.cpu_count()} CPUs available")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        baseline = [extract_via_temp_file(data, directory) for data in documents]
+        baseline_seconds = time.perf_counter() - start
+
+    print(f"{'strategy':<22} {'seconds':>8} {'pages/s':>8} {'speedup':>8}")
+    print(f"{'temp file, serial':<22} {baseline_seconds:>8.2f} {total_pages / baseline_seconds:>8.0f} {1:>7.1f}x")
+    for jobs in args.jobs:
+        start = time.perf_counter()
+        texts = [onefilellm.extract_pdf_text(data, jobs) for data in documents]
+        elapsed = time.perf_counter() - start
+        if texts != baseline:
+            raise SystemExit(f"In-memory extraction with {jobs} jobs differs from the temp-file path")
+        label = f"in memory, {jobs} jobs"
+        print(f"{label:<22} {elapsed:>8.2f} {total_pages / elapsed:>8.0f} {baseline_seconds / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare producing all outputs of a local folder in one pass with the previous sequence.
+
+Generates a tree of --files source files and times both ways of producing
+uncompressed_output.txt, compressed_output.txt and the token counts:
+
+  sequential  write the uncompressed output, run preprocess_text on it, read
+              both files back and count their tokens (what main used to do)
+  pipeline    write into an OutputPipeline, which compresses and counts the
+              output while the folder is being read
+
+Outputs and counts are checked to be identical.
+
+    python benchmarks/bench_pipeline.py --files 3000 --jobs 1 2
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+
+
+def build_tree(root, num_files, file_size):
+    with open(onefilellm.__file__, encoding="utf-8") as f:
+        source = f.read()
+    for i in range(num_files):
+        directory = os.path.join(root, f"pkg{i // 100}", f"sub{i % 4}")
+        os.makedirs(directory, exist_ok=True)
+        start = (i * 7919) % max(1, len(source) - file_size)
+        with open(os.path.join(directory, f"module_{i}.py"), "w", encoding="utf-8") as f:
+            f.write(source[start:start + file_size])
+
+
+def run_sequential(folder, output_file, compressed_file, jobs):
+    with open(output_file, "w", encoding="utf-8") as file:
+        onefilellm.write_local_folder(folder, file, jobs=jobs)
+    onefilellm.preprocess_text(output_file, compressed_file, jobs)
+    variants = {"uncompressed": onefilellm.safe_file_read(output_file),
+                "compressed": onefilellm.safe_file_read(compressed_file)}
+    return onefilellm.build_token_manifest(variants, onefilellm.TokenCounter())
+
+
+def run_pipeline(folder, output_file, compressed_file, jobs):
+    counter = onefilellm.TokenCounter()
+    with onefilellm.OutputPipeline(output_file, compressed_file, counter, jobs=jobs) as pipeline:
+        onefilellm.write_local_folder(folder, pipeline, jobs=jobs)
+        pipeline.close()
+    return onefilellm.build_token_manifest(pipeline.sections, counter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=3000)
+    parser.add_argument("--file-size", type=int, default=8192)
+    parser.add_argument("--jobs", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    directory = tempfile.mkdtemp()
+    try:
+        folder = os.path.join(directory, "tree")
+        build_tree(folder, args.files, args.file_size)
+        print(f"{args.files} files of {args.file_size} bytes, {os.cpu_count()} CPUs available")
+        print(f"{'mode':<12} {'jobs':>4} {'seconds':>8}")
+        for jobs in args.jobs:
+            outputs = {}
+            for name, run in (("sequential", run_sequential), ("pipeline", run_pipeline)):
+                output_file = os.path.join(directory, f"{name}_uncompressed.txt")
+                compressed_file = os.path.join(directory, f"{name}_compressed.txt")
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    manifest = run(folder, output_file, compressed_file, jobs)
+                elapsed = time.perf_counter() - start
+                with open(output_file, "rb") as f, open(compressed_file, "rb") as g:
+                    outputs[name] = (f.read(), g.read(), manifest)
+                print(f"{name:<12} {jobs:>4} {elapsed:>8.2f}")
+            if outputs["pipeline"] != outputs["sequential"]:
+                raise SystemExit(f"Pipeline output with {jobs} jobs differs from the sequential run")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
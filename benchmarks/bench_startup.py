@@ -0,0 +1,111 @@
+"""
+Measure cold start: importing onefilellm, and a whole CLI run on a small local folder.
+
+Each measurement starts a fresh interpreter without GITHUB_TOKEN set, so it
+also checks that neither needs the token or the network. The local folder is
+processed once with --no-cache, where loading tiktoken's BPE ranks dominates,
+and once with warm caches, which is what a repeat run costs. Reports the
+median of --runs runs, the slowest modules imported by onefilellm (from
+python -X importtime) and whether the local-folder cold start, the run
+with --no-cache, meets --target-ms.
+
+    python benchmarks/bench_startup.py --runs 5 --target-ms 500
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "onefilellm.py")
+
+
+def environment():
+    env = {name: value for name, value in os.environ.items() if name != "GITHUB_TOKEN"}
+    env["PYTHONPATH"] = ROOT
+    return env
+
+
+def run(command, cwd):
+    start = time.perf_counter()
+    subprocess.run(command, cwd=cwd, env=environment(), check=True,
+                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def slowest_imports(cwd, count):
+    """(microseconds, module) for the modules onefilellm imports itself, slowest first."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import onefilellm"], cwd=cwd,
+                            env=environment(), capture_output=True, text=True, check=True)
+    # A module's own imports are listed before it, indented one level deeper
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or not line.split("|")[1].strip().isdigit():
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == "onefilellm":
+                return sorted(children, reverse=True)[:count]
+            children = []
+    return []
+
+
+def build_tree(root, num_files):
+    for i in range(num_files):
+        directory = os.path.join(root, f"pkg{i // 10}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module_{i}.py"), "w", encoding="utf-8") as f:
+            f.write(f"def handler_{i}(request):\n    return {{'status': 'ok', 'value': {i}}}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--target-ms", type=float, default=500,
+                        help="Median wall time the local-folder cold start (--no-cache) should stay under")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        folder = os.path.join(directory, "tree")
+        build_tree(folder, args.files)
+        local = [sys.executable, SCRIPT, folder, "--no-clipboard"]
+        cached = local + ["--cache-dir", os.path.join(directory, "cache")]
+        # Warm the bytecode and token count caches so every run measures the same thing.
+        # Each CLI run gets its own directory, as output folders are named by the second they start in
+        run(cached, tempfile.mkdtemp(dir=directory))
+
+        timings = {
+            "python -c pass": [run([sys.executable, "-c", "pass"], directory) for _ in range(args.runs)],
+            "import onefilellm": [run([sys.executable, "-c", "import onefilellm"], directory) for _ in range(args.runs)],
+            "local folder, no cache": [run(local + ["--no-cache"], tempfile.mkdtemp(dir=directory))
+                                       for _ in range(args.runs)],
+            "local folder, warm caches": [run(cached, tempfile.mkdtemp(dir=directory)) for _ in range(args.runs)],
+        }
+        print(f"{args.files} files")
+        print(f"{'run':<28} {'median ms':>10}")
+        for name, seconds in timings.items():
+            print(f"{name:<28} {statistics.median(seconds) * 1000:>10.0f}")
+
+        print("\nslowest imports of onefilellm")
+        for microseconds, name in slowest_imports(directory, 5):
+            print(f"  {name:<26} {microseconds / 1000:>10.1f}")
+
+        local_ms = statistics.median(timings["local folder, no cache"]) * 1000
+        if local_ms > args.target_ms:
+            raise SystemExit(f"Local-folder cold start took {local_ms:.0f} ms, over the {args.target_ms:.0f} ms target")
+        print(f"\nLocal-folder cold start is within the {args.target_ms:.0f} ms target")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare the old token counter (new encoder per call, 1000-character slices
+encoded one at a time) with TokenCounter, cold and with a warm count cache.
+
+Builds a flattened <source> document of --files files, or counts --input.
+
+    python benchmarks/bench_tokens.py --files 2000 --file-size 8192
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+
+
+def old_token_count(text, disallowed_special=[], chunk_size=1000):
+    # The previous get_token_count
+    enc = onefilellm.get_encoder("cl100k_base")
+    text_without_tags = re.sub(r'<[^>]+>', '', text)
+    chunks = [text_without_tags[i:i + chunk_size] for i in range(0, len(text_without_tags), chunk_size)]
+    total_tokens = 0
+    for chunk in chunks:
+        total_tokens += len(enc.encode(chunk, disallowed_special=disallowed_special))
+    return total_tokens
+
+
+def build_document(num_files, file_size):
+    with open(onefilellm.__file__, encoding="utf-8") as f:
+        source = f.read()
+    parts = ['<source type="local_directory" path="synthetic">']
+    for i in range(num_files):
+        start = (i * 7919) % max(1, len(source) - file_size)
+        parts.append(f'<file name="pkg{i // 100}/module_{i}.py">')
+        parts.append(onefilellm.escape_xml(source[start:start + file_size]))
+        parts.append('</file>')
+    parts.append('</source>')
+    return '\n'.join(parts)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--input", help="Count an existing output file instead of a generated document")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--file-size", type=int, default=8192)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = build_document(args.files, args.file_size)
+    megabytes = len(text.encode("utf-8")) / 1e6
+    print(f"{megabytes:.1f} MB of text, {os.cpu_count()} CPUs available")
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cache_path = os.path.join(cache_dir, "token_counts.sqlite")
+        runs = [
+            ("old get_token_count", old_token_count, text),
+            ("TokenCounter", onefilellm.TokenCounter().count, text),
+            ("TokenCounter, cold cache", onefilellm.TokenCounter(cache_path).count, text),
+            ("TokenCounter, warm cache", onefilellm.TokenCounter(cache_path).count, text),
+        ]
+        print(f"{'counter':<26} {'tokens':>10} {'seconds':>8} {'MB/s':>7}")
+        for label, function, argument in runs:
+            tokens, elapsed = timed(function, argument)
+            print(f"{label:<26} {tokens:>10} {elapsed:>8.2f} {megabytes / elapsed:>7.1f}")
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    main()
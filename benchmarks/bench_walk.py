@@ -0,0 +1,103 @@
+"""
+Compare walking a local folder with the previous filters and with PathFilter.
+
+Generates a tree with --files source files next to large directories that
+its .gitignore ignores (build output, a virtualenv, a cache), --ignored
+files in total, and times listing the files to ingest:
+
+  previous       os.walk pruning EXCLUDED_DIRS, and the old per-file
+                 is_allowed_filetype that rebuilt its lists on every call
+  no gitignore   iter_local_folder_files with PathFilter(gitignore=False),
+                 which must list the same files as the previous walk
+  gitignore      iter_local_folder_files as the CLI runs it by default
+
+    python benchmarks/bench_walk.py --files 5000 --ignored 100000
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import onefilellm  # noqa: E402
+
+IGNORED_DIRS = ["build", ".venv-py311", ".cache"]
+
+
+def old_is_allowed_filetype(filename):
+    # The previous is_excluded_file and is_allowed_filetype
+    excluded_patterns = ['.pb.go', '_grpc.pb.go', 'mock_', '/generated/', '/mocks/', '.gen.', '_generated.']
+    if any(pattern in filename for pattern in excluded_patterns):
+        return False
+    allowed_extensions = ['.go', '.proto', '.py', '.txt', '.md', '.cjs', '.html', '.json', '.ipynb', '.h',
+                          '.localhost', '.yaml', '.example']
+    return any(filename.endswith(ext) for ext in allowed_extensions)
+
+
+def old_walk(local_path):
+    for root, dirs, files in os.walk(local_path):
+        dirs[:] = [d for d in dirs if d not in onefilellm.EXCLUDED_DIRS]
+        relative_root = os.path.relpath(root, local_path)
+        for file in files:
+            if old_is_allowed_filetype(file):
+                yield os.path.join(root, file), file if relative_root == "." else os.path.join(relative_root, file)
+
+
+def build_tree(root, num_files, num_ignored):
+    def write(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("x = 1\n")
+
+    for i in range(num_files):
+        write(os.path.join(root, "src", f"pkg{i // 200}", f"sub{(i // 20) % 10}", f"module_{i}.py"))
+    for i in range(num_ignored):
+        ignored = IGNORED_DIRS[i % len(IGNORED_DIRS)]
+        write(os.path.join(root, ignored, f"d{i // 500}", f"e{(i // 25) % 20}", f"artifact_{i}.json"))
+    with open(os.path.join(root, ".gitignore"), "w", encoding="utf-8") as f:
+        f.write("# Build output and environments\n/build/\n.venv*/\n.cache/\n*.log\n")
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = list(function(*args))
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--ignored", type=int, default=100000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    directory = tempfile.mkdtemp()
+    try:
+        folder = os.path.join(directory, "tree")
+        build_tree(folder, args.files, args.ignored)
+        print(f"{args.files} source files, {args.ignored} files in ignored directories")
+        print(f"{'walk':<14} {'seconds':>8} {'files':>8}")
+        old_walk_files = list(old_walk(folder))  # Warm the directory cache
+        results = {}
+        for name, function, walk_args in (
+            ("previous", old_walk, (folder,)),
+            ("no gitignore", onefilellm.iter_local_folder_files, (folder, onefilellm.PathFilter(folder, gitignore=False))),
+            ("gitignore", onefilellm.iter_local_folder_files, (folder,)),
+        ):
+            seconds, results[name] = timed(function, *walk_args)
+            print(f"{name:<14} {seconds:>8.2f} {len(results[name]):>8}")
+        if results["no gitignore"] != old_walk_files:
+            raise SystemExit("PathFilter without .gitignore lists different files than the previous walk")
+        if len(results["gitignore"]) != args.files:
+            raise SystemExit("The .gitignore walk did not list exactly the source files")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
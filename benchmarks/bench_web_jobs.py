@@ -0,0 +1,107 @@
+"""
+Load test the web app's job queue against a local stand-in for GitHub.
+
+Serves the web app on a local port and a mock GitHub API that adds
+--latency to every request, then submits --jobs repository jobs at once
+through POST /jobs for each worker count in --workers. Reports how long
+submitting took (POST returns as soon as a job is queued), the time until
+every job was done, jobs/second, and the median and slowest time from
+submitting a job to its completion. One job is followed through its
+event stream, and every job's output is checked against a direct run.
+
+    python benchmarks/bench_web_jobs.py --jobs 16 --workers 1 2 4 8 --latency 0.01
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+
+import requests  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import onefilellm  # noqa: E402
+import web_app  # noqa: E402
+from benchmarks.mock_github import MockGitHubServer, make_synthetic_repo  # noqa: E402
+
+
+def follow_events(url, events):
+    with requests.get(url, stream=True, timeout=120) as response:
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                events.append(line[len("event: "):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=16)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--files", type=int, default=100, help="Files in the mock repository")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds added to every mock GitHub request")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # One access log line per request otherwise
+    onefilellm.print = lambda *objects, **kwargs: None  # Silence the per-file progress lines
+
+    jobs_dir = tempfile.mkdtemp()
+    server = make_server("127.0.0.1", 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        with MockGitHubServer(make_synthetic_repo(num_files=args.files), latency=args.latency) as github:
+            onefilellm.GITHUB_API_URL = github.api_url
+            with contextlib.redirect_stdout(io.StringIO()):
+                expected = onefilellm.process_github_repo(github.repo_url)
+            print(f"{args.jobs} jobs of a {args.files}-file repository, {args.latency * 1000:.0f} ms per GitHub request")
+            print(f"{'workers':>8} {'submit ms':>10} {'seconds':>8} {'jobs/s':>7} {'median s':>9} {'slowest s':>10}")
+            for workers in args.workers:
+                web_app.jobs = web_app.JobQueue(workers=workers, max_queued=args.jobs, jobs_dir=jobs_dir,
+                                                counter=web_app.token_counter)
+                start = time.perf_counter()
+                job_ids = [requests.post(f"{base_url}/jobs", json={"input_path": github.repo_url}, timeout=30).json()["id"]
+                           for _ in range(args.jobs)]
+                submitted = time.perf_counter() - start
+                events = []
+                follower = threading.Thread(target=follow_events, args=(f"{base_url}/jobs/{job_ids[-1]}/events?output=0", events))
+                follower.start()
+
+                statuses = {}
+                while len(statuses) < len(job_ids):
+                    for job_id in job_ids:
+                        if job_id not in statuses:
+                            status = requests.get(f"{base_url}/jobs/{job_id}", timeout=30).json()
+                            if status["state"] in ("done", "failed"):
+                                statuses[job_id] = status
+                    time.sleep(0.05)
+                elapsed = time.perf_counter() - start
+                follower.join()
+                web_app.jobs.shutdown()
+
+                failed = [status["error"] for status in statuses.values() if status["state"] != "done"]
+                if failed:
+                    raise SystemExit(f"{len(failed)} jobs failed: {failed[0]}")
+                for job_id in job_ids:
+                    output = requests.get(f"{base_url}/jobs/{job_id}/files/uncompressed_output.txt", timeout=30).text
+                    if output != expected:
+                        raise SystemExit(f"Job {job_id} wrote different output than a direct run")
+                if events[-1:] != ["end"]:
+                    raise SystemExit("The event stream did not end with the job")
+                durations = [status["finished"] - status["created"] for status in statuses.values()]
+                print(f"{workers:>8} {submitted * 1000:>10.0f} {elapsed:>8.2f} {args.jobs / elapsed:>7.2f} "
+                      f"{statistics.median(durations):>9.2f} {max(durations):>10.2f}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(jobs_dir)
+
+
+if __name__ == "__main__":
+    main()
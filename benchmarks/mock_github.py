@@ -0,0 +1,174 @@
+"""
+A small stand-in for the GitHub REST API used by the benchmarks and tests.
+
+It serves the contents API (directory listings and raw file downloads) and
+repository tarballs for an in-memory repository over a real local HTTP socket, with an optional per-request
+delay to simulate network round-trip latency.
+"""
+import gzip
+import hashlib
+import io
+import json
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+
+def make_synthetic_repo(num_files=200, files_per_dir=20, file_size=2048):
+    """Build a {path: bytes} mapping spread over nested directories."""
+    files = {}
+    line = b"def handler(request):\n    return {'status': 'ok', 'value': 42}\n"
+    body = (line * (file_size // len(line) + 1))[:file_size]
+    for i in range(num_files):
+        directory = f"pkg{i // files_per_dir}/sub{(i // 5) % 4}"
+        files[f"{directory}/module_{i}.py"] = body
+    files["README.md"] = b"# Synthetic repository\n"
+    files["node_modules/ignored/index.json"] = b"{}"
+    return files
+
+
+def tree_sort_key(entry):
+    # Git orders tree entries bytewise, comparing directory names as if they
+    # ended in "/"; the contents API returns entries in that order.
+    name = entry["name"] + ("/" if entry["type"] == "dir" else "")
+    return name.encode("utf-8")
+
+
+class MockGitHubServer:
+    """
+    Serve `files` as repository `owner/repo` on 127.0.0.1.
+
+    Use as a context manager; `api_url` is the value to put in
+    onefilellm.GITHUB_API_URL while the server is running.
+    """
+
+    def __init__(self, files, owner="octo", repo="demo", latency=0.0):
+        self.files = dict(files)
+        self.owner = owner
+        self.repo = repo
+        self.latency = latency
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def api_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def repo_url(self):
+        return f"https://github.com/{self.owner}/{self.repo}"
+
+    def __enter__(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with mock._lock:
+                    mock.request_count += 1
+                if mock.latency:
+                    time.sleep(mock.latency)
+                status, content_type, body = mock.handle(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, raw_path):
+        parsed = urlparse(raw_path)
+        path = unquote(parsed.path)
+        repo_prefix = f"/repos/{self.owner}/{self.repo}"
+        raw_prefix = f"/raw/{self.owner}/{self.repo}/"
+
+        if path.startswith(f"{repo_prefix}/contents"):
+            subpath = path[len(f"{repo_prefix}/contents"):].strip("/")
+            ref = parse_qs(parsed.query).get("ref", [""])[0]
+            listing = self.listing(subpath, ref)
+            if listing is None:
+                return 404, "application/json", b'{"message": "Not Found"}'
+            return 200, "application/json", json.dumps(listing).encode("utf-8")
+
+        if path == f"{repo_prefix}/tarball" or path.startswith(f"{repo_prefix}/tarball/"):
+            return 200, "application/x-gzip", self.tarball()
+
+        if path.startswith(raw_prefix):
+            file_path = path[len(raw_prefix):].split("/", 1)[-1]
+            if file_path in self.files:
+                return 200, "application/octet-stream", self.files[file_path]
+
+        return 404, "text/plain", b"Not Found"
+
+    def listing(self, subpath, ref=""):
+        prefix = f"{subpath}/" if subpath else ""
+        entries = {}
+        for file_path in self.files:
+            if not file_path.startswith(prefix):
+                continue
+            name, _, rest = file_path[len(prefix):].partition("/")
+            entry_path = prefix + name
+            if rest:
+                entries[name] = {
+                    "name": name,
+                    "path": entry_path,
+                    "type": "dir",
+                    "url": self.contents_url(entry_path, ref),
+                    "download_url": None,
+                }
+            else:
+                data = self.files[file_path]
+                entries[name] = {
+                    "name": name,
+                    "path": entry_path,
+                    "sha": hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest(),
+                    "type": "file",
+                    "url": self.contents_url(entry_path, ref),
+                    "download_url": f"{self.api_url}/raw/{self.owner}/{self.repo}/{ref or 'main'}/{quote(entry_path)}",
+                }
+        if not entries:
+            return None
+        return sorted(entries.values(), key=tree_sort_key)
+
+    def tarball(self):
+        """Build a gzipped tarball laid out like GitHub's, under an "<owner>-<repo>-<sha>/" root."""
+        root = f"{self.owner}-{self.repo}-0123456"
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w", format=tarfile.PAX_FORMAT) as archive:
+            directories = set()
+            for file_path in sorted(self.files, key=lambda p: p.encode("utf-8")):
+                parts = file_path.split("/")
+                for depth in range(1, len(parts)):
+                    directory = "/".join(parts[:depth])
+                    if directory not in directories:
+                        directories.add(directory)
+                        info = tarfile.TarInfo(f"{root}/{directory}")
+                        info.type = tarfile.DIRTYPE
+                        archive.addfile(info)
+                data = self.files[file_path]
+                info = tarfile.TarInfo(f"{root}/{file_path}")
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        return gzip.compress(buffer.getvalue())
+
+    def contents_url(self, path, ref=""):
+        url = f"{self.api_url}/repos/{self.owner}/{self.repo}/contents/{quote(path)}"
+        return f"{url}?ref={ref}" if ref else url
@@ -0,0 +1,114 @@
+"""
+A local documentation site for crawler benchmarks and tests.
+
+Serves a {path: html} mapping over a real local HTTP socket with an optional
+per-request delay, and answers conditional requests (If-None-Match) with 304
+like a real static file server would.
+"""
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+def make_docs_site(num_pages=100, links_per_page=8, paragraphs=20):
+    """Build a Sphinx-like site: every page shares a navigation sidebar and footer and links to its neighbours."""
+    nav = "".join(f'<li><a href="/docs/page{i}.html">Section {i}</a></li>' for i in range(min(10, num_pages)))
+    pages = {}
+    for i in range(num_pages):
+        links = "".join(
+            f'<a href="/docs/page{(i * 7 + j) % num_pages}.html#part">Related topic {j}</a> '
+            for j in range(links_per_page)
+        )
+        body = "".join(
+            f"<p>Page {i} paragraph {p}: the <code>configure()</code> call accepts options &amp; returns a client.</p>"
+            for p in range(paragraphs)
+        )
+        pages[f"/docs/page{i}.html"] = (
+            f"<html><head><title>Page {i}</title><style>p {{ margin: 0 }}</style></head><body>"
+            f'<div class="sidebar"><ul>{nav}</ul></div>'
+            f'<div class="document"><h1>Topic {i}</h1><!-- generated -->{body}<p>{links}</p></div>'
+            f"<script>var page = {i};</script>"
+            f'<div class="footer">© Example Project. Built with Sphinx.</div>'
+            f"</body></html>"
+        )
+    pages["/docs/"] = pages["/docs/page0.html"].replace("Topic 0", "Documentation home")
+    return pages
+
+
+class MockSiteServer:
+    """Serve `pages` on 127.0.0.1; use as a context manager and crawl `base_url`."""
+
+    def __init__(self, pages, latency=0.0, etags=True):
+        self.pages = dict(pages)
+        self.latency = latency
+        self.etags = etags
+        self.request_count = 0
+        self.not_modified_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def root_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def base_url(self):
+        return f"{self.root_url}/docs/"
+
+    def __enter__(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with mock._lock:
+                    mock.request_count += 1
+                if mock.latency:
+                    time.sleep(mock.latency)
+
+                path = urlparse(self.path).path
+                page = mock.pages.get(path)
+                if page is None:
+                    body = b"Not Found"
+                    self.send_response(404)
+                    self.send_header("Content-Type", "text/plain")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                body = page.encode("utf-8") if isinstance(page, str) else page
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                if mock.etags and self.headers.get("If-None-Match") == etag:
+                    with mock._lock:
+                        mock.not_modified_count += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                content_type = "application/pdf" if path.endswith(".pdf") else "text/html; charset=utf-8"
+                self.send_header("Content-Type", content_type)
+                if mock.etags:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
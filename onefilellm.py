@@ -1,44 +1,93 @@
-import requests
-from bs4 import BeautifulSoup, Comment
-from urllib.parse import urljoin, urlparse
-from PyPDF2 import PdfReader
+# Third-party packages that are only needed by some sources (requests, bs4,
+# PyPDF2, tiktoken, youtube_transcript_api, pyperclip, rich, lxml, nbconvert)
+# are imported where they are used, so importing this module stays cheap and
+# works offline.
+from urllib.parse import urljoin, urlparse, urldefrag
 import os
 import sys
-import tiktoken
-import nltk
-from nltk.corpus import stopwords
 import re
-import nbformat
-from nbconvert import PythonExporter
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api.formatters import TextFormatter
-import pyperclip
-import wget
-from rich import print
-from rich.console import Console
-from rich.panel import Panel
-from rich.text import Text
-from rich.prompt import Prompt
-from rich.progress import Progress, TextColumn, BarColumn, TimeRemainingColumn
 import xml.etree.ElementTree as ET
 import logging
 from datetime import datetime
+import time
 import hashlib
+import io
+import mmap
+import codecs
+import contextlib
+import argparse
+import threading
+import queue
+import select
+import errno
+import struct
+import ctypes
+import ctypes.util
+import tarfile
+import subprocess
+import sqlite3
+import json
+import fnmatch
+import csv
+import html
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import deque
 from dotenv import load_dotenv
 
+LXML_AVAILABLE = importlib.util.find_spec("lxml") is not None  # lxml is optional; the crawler falls back to BeautifulSoup
+
 # Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('debug.log'),
-        logging.StreamHandler()
-    ]
-)
+def configure_logging(log_file='debug.log'):
+    """Log to log_file and stderr. Called when run as a program, not on import, so tests and benchmarks write no log."""
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
 
 # EXCLUDED_DIRS = ["dist", "node_modules", ".git", "__pycache__"]  # Add any other directories to exclude here
 EXCLUDED_DIRS = ["dist", "node_modules", ".git", "__pycache__", ".venv", "outputs"]  # Add any other directories to exclude here
 
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")  # Override for GitHub Enterprise or a local mock
+GITHUB_MAX_WORKERS = 8  # Concurrent requests used when fetching a GitHub repository (1 = sequential)
+CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "onefilellm")
+BLOB_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Size cap for cached GitHub file bodies before least recently used ones are evicted
+HTTP_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Size cap for cached HTTP responses before least recently used ones are evicted
+CRAWL_CONCURRENCY = 16  # Pages the crawler fetches at once
+CRAWL_PER_HOST_LIMIT = 4  # Politeness limit: concurrent crawler requests to any single host
+CRAWL_TIMEOUT = 30  # Seconds before a crawler request is abandoned
+BOILERPLATE_MIN_PAGES = 3  # With --strip-boilerplate, a line must repeat on at least this many pages to be stripped...
+BOILERPLATE_MIN_FRACTION = 0.5  # ...and on at least this fraction of the crawl's pages
+BOILERPLATE_MIN_RUN = 3  # Repeated lines inside a page are only stripped in runs of this many; at its edges, any run
+HTML_EXTRACTOR = "beautifulsoup"  # Default backend for crawled pages; "lxml" is faster but its text can differ, see extract_html_lxml
+NOTEBOOK_CONVERTER = "fast"  # "fast" or "nbconvert", see convert_notebook
+NOTEBOOK_OUTPUT_CHARS = 0  # Characters of each code cell's outputs kept as comments by the fast converter (0 = none)
+PDF_CHUNK_PAGES = 4  # Pages handed to a worker process at a time when extracting PDF text
+PDF_PARALLEL_MIN_PAGES = 16  # Shorter PDFs are extracted in-process; starting workers would cost more than it saves
+TOKEN_ENCODING = "cl100k_base"  # tiktoken encoding used for token counts
+TOKEN_SEGMENT_CHARS = 16384  # Approximate length of the pieces token counting is batched and parallelised over
+TOKEN_BATCH_CHARS = 1 << 20  # Finished sections are counted in batches of about this many characters while output streams
+PIPELINE_CHUNK_CHARS = 1 << 16  # Output is handed to the compressor and token counters in chunks of about this size
+PIPELINE_QUEUE_CHUNKS = 64  # Chunks a pipeline stage may fall behind before writers wait for it
+PACK_ORDER = ("include", "type", "depth", "recent", "small")  # Default --pack-order, see TokenBudget
+PACK_TYPE_PRIORITY = ['.md', '.py', '.go', '.proto', '.h', '.cjs', '.html', '.yaml', '.example', '.localhost',
+                      '.ipynb', '.txt', '.json']  # Earlier extensions are kept first by the "type" rule
+DEDUP_SHINGLE_WORDS = 4  # Words per shingle hashed into a page's SimHash with --dedup-near
+DEDUP_SIMHASH_DISTANCE = 3  # Pages whose SimHashes differ in at most this many of 64 bits are near-duplicates
+DEDUP_NEAR_MIN_WORDS = 50  # Shorter pages are only deduplicated when identical; their SimHashes are too coarse
+LOCAL_CHUNK_SIZE = 32  # Files handed to a worker process at a time when processing local folders with --jobs
+WATCH_DEBOUNCE = 0.1  # Seconds without filesystem events before --watch applies a burst of changes
+WATCH_POLL_INTERVAL = 0.5  # Seconds between scans when --watch cannot use inotify
+LOCAL_MANIFEST_RACY_NS = 2 * 10**9  # Files modified this close to a walk are re-hashed on the next run, see LocalManifest
+LOCAL_SNIFF_BYTES = 8000  # Leading bytes of a local file checked for a NUL byte, which marks it as binary (as git does)
+LOCAL_MAX_FILE_BYTES = 10 << 20  # Default --max-file-size: larger local files keep only their first bytes
+LOCAL_MMAP_BYTES = 1 << 20  # Local files at least this large are memory-mapped and streamed out instead of read whole
+LOCAL_STREAM_CHUNK_BYTES = 1 << 20  # Bytes of a memory-mapped file decoded and escaped at a time
+
 
 def safe_file_read(filepath, fallback_encoding='latin1'):
     try:
@@ -48,32 +97,323 @@ def safe_file_read(filepath, fallback_encoding='latin1'):
         with open(filepath, "r", encoding=fallback_encoding) as file:
             return file.read()
 
-nltk.download("stopwords", quiet=True)
-stop_words = set(stopwords.words("english"))
+# NLTK's English stop word list (nltk 3.7), bundled so compression needs no download
+stop_words = frozenset("""
+    i me my myself we our ours ourselves you you're you've you'll you'd your yours yourself
+    yourselves he him his himself she she's her hers herself it it's its itself they them their
+    theirs themselves what which who whom this that that'll these those am is are was were be been
+    being have has had having do does did doing a an the and but if or because as until while of at
+    by for with about against between into through during before after above below to from up down
+    in out on off over under again further then once here there when where why how all any both each
+    few more most other some such no nor not only own same so than too very s t can will just don
+    don't should should've now d ll m o re ve y ain aren aren't couldn couldn't didn didn't doesn
+    doesn't hadn hadn't hasn hasn't haven haven't isn isn't ma mightn mightn't mustn mustn't needn
+    needn't shan shan't shouldn shouldn't wasn wasn't weren weren't won won't wouldn wouldn't
+""".split())
 
 load_dotenv()  # Load environment variables from .env file
 TOKEN = os.getenv('GITHUB_TOKEN')
-if not TOKEN:
-    raise EnvironmentError("GITHUB_TOKEN not found in .env file. Please add it as: GITHUB_TOKEN=your_token_here")
 
-headers = {"Authorization": f"token {TOKEN}"}
+def github_headers():
+    """Headers for GitHub API requests. The token is only required once a GitHub source is processed."""
+    if not TOKEN:
+        raise EnvironmentError("GITHUB_TOKEN not found in .env file. Please add it as: GITHUB_TOKEN=your_token_here")
+    return {"Authorization": f"token {TOKEN}"}
+
+def print(*objects, **kwargs):
+    """rich.print, imported on first use."""
+    from rich import print as rich_print
+    rich_print(*objects, **kwargs)
+
+_thread_local = threading.local()
+
+def get_session(authenticated=True):
+    """
+    Return a requests session owned by the calling thread.
+
+    Sessions keep connections alive between requests, but are not safe to share
+    across threads, so each worker thread gets its own. Authenticated sessions
+    send the GitHub token and must only be used for GitHub requests.
+    """
+    attribute = "session" if authenticated else "anonymous_session"
+    session = getattr(_thread_local, attribute, None)
+    if session is None:
+        import requests
+
+        session = requests.Session()
+        if authenticated:
+            session.headers.update(github_headers())
+        setattr(_thread_local, attribute, session)
+    return session
+
+class HTTPCache:
+    """
+    SQLite-backed HTTP response cache that revalidates with conditional requests.
+
+    Responses carrying an ETag or Last-Modified header are stored per URL. The
+    next request for that URL sends If-None-Match / If-Modified-Since, and a
+    304 is turned back into a 200 response holding the stored body, marked
+    with `from_cache = True`. Callers can also store what they extracted from
+    a response (see store_extracted) and reuse it while the URL stays unchanged
+    and it is asked for under the same name (such as the HTML extractor used).
+    GitHub does not count 304 responses against the API rate limit. Once the
+    stored bodies and extractions grow past `max_bytes`, the least recently
+    used responses are deleted.
+    """
+
+    def __init__(self, path=None, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.path = path or os.path.join(CACHE_DIR, "http_cache.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.revalidated = 0
+        self.fetched = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(responses)")]
+        if columns and "used" not in columns:
+            # Written before entries were sized for eviction; a cache is cheaper to refill than to migrate
+            self._db.execute("DROP TABLE responses")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_type TEXT, content BLOB, extracted TEXT, "
+            "size INTEGER, used REAL)"
+        )
+        self._db.commit()
+        self.size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, url, requester=None, **kwargs):
+        if requester is None:
+            import requests
+
+            requester = requests
+        if kwargs.get("stream"):
+            # Streamed bodies are consumed by the caller and never stored
+            return requester.get(url, **kwargs)
+
+        key = urldefrag(url)[0]
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, content_type, content FROM responses WHERE url = ?", (key,)
+            ).fetchone()
+
+        request_headers = dict(kwargs.pop("headers", None) or {})
+        if row:
+            etag, last_modified = row[0], row[1]
+            if etag:
+                request_headers["If-None-Match"] = etag
+            if last_modified:
+                request_headers["If-Modified-Since"] = last_modified
+        response = requester.get(url, headers=request_headers, **kwargs)
+
+        if response.status_code == 304 and row:
+            response.status_code = 200
+            response._content = row[3]
+            if row[2]:
+                response.headers["Content-Type"] = row[2]
+            from requests.utils import get_encoding_from_headers
+
+            response.encoding = get_encoding_from_headers(response.headers)
+            response.from_cache = True
+            with self._lock:
+                self.revalidated += 1
+                self._db.execute("UPDATE responses SET used = ? WHERE url = ?", (time.time(), key))
+                self._db.commit()
+            return response
+
+        response.from_cache = False
+        with self._lock:
+            self.fetched += 1
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+            if response.status_code == 200 and (etag or last_modified):
+                replaced = self._db.execute("SELECT size FROM responses WHERE url = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, NULL, ?, ?)",
+                    (key, etag, last_modified, response.headers.get("Content-Type"), response.content,
+                     len(response.content), time.time()),
+                )
+                self.size += len(response.content) - (replaced[0] if replaced else 0)
+                if self.size > self.max_bytes:
+                    self._evict()
+                self._db.commit()
+        return response
+
+    def load_extracted(self, url, name):
+        with self._lock:
+            row = self._db.execute("SELECT extracted FROM responses WHERE url = ?", (urldefrag(url)[0],)).fetchone()
+        stored = json.loads(row[0]) if row and row[0] is not None else None
+        # Extracted under another name (another backend) is as good as not extracted
+        return stored["value"] if isinstance(stored, dict) and stored.get("name") == name else None
+
+    def store_extracted(self, url, extracted, name):
+        key, data = urldefrag(url)[0], json.dumps({"name": name, "value": extracted})
+        with self._lock:
+            row = self._db.execute("SELECT size, LENGTH(content) FROM responses WHERE url = ?", (key,)).fetchone()
+            if row is None:
+                return
+            size = (row[1] or 0) + len(data.encode("utf-8"))
+            self._db.execute("UPDATE responses SET extracted = ?, size = ? WHERE url = ?", (data, size, key))
+            self.size += size - row[0]
+            if self.size > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # Trim to 90% of the cap so we do not evict on every following write
+        rows = self._db.execute("SELECT url, size FROM responses ORDER BY used").fetchall()
+        self.size = sum(size for _, size in rows)
+        for url, size in rows:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self.size -= size
+
+http_cache = None  # Set to an HTTPCache to make repeat requests conditional
+
+def http_get(url, session=None, **kwargs):
+    """requests.get (or session.get) that goes through http_cache when one is configured."""
+    if session is None:
+        import requests
+
+        session = requests
+    if http_cache is None:
+        return session.get(url, **kwargs)
+    return http_cache.get(url, session, **kwargs)
 
 def download_file(url, target_path):
-    response = requests.get(url, headers=headers)
+    import requests
+
+    # Not through http_cache: file bodies are cached by blob SHA (see BlobCache)
+    response = requests.get(url, headers=github_headers())
     response.raise_for_status()
     with open(target_path, "wb") as f:
         f.write(response.content)
 
-def process_ipynb_file(temp_file):
-    with open(temp_file, "r", encoding='utf-8', errors='ignore') as f:
-        notebook_content = f.read()
+def decode_text(data):
+    """
+    Decode downloaded bytes exactly like reading a temp file with
+    open(path, "r", encoding='utf-8', errors='ignore'), including the
+    universal newline translation text mode applies.
+    """
+    return data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+
+def convert_notebook_nbconvert(notebook_content):
+    import nbformat
+    from nbconvert import PythonExporter
 
     exporter = PythonExporter()
     python_code, _ = exporter.from_notebook_node(nbformat.reads(notebook_content, as_version=4))
     return python_code
 
+# Anything IPython's input transformer might rewrite: magics, shell escapes, help
+# syntax, prompts and autocall escapes, or line breaks other than "\n"
+IPYTHON_SYNTAX_RE = re.compile(r"[%?\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]|!(?!=)|^[ \t]*(?:[,;/]|>>>|\.\.\.|In \[|\[(?:nav|ins)\])", re.M)
+LEADING_INDENT_RE = re.compile(r"[ \t]+")
+_ipython_transformer = None
+
+def ipython_to_python(code):
+    """
+    Same result as nbconvert's ipython2python filter. IPython is only
+    imported for cells that may contain IPython syntax; for the others its
+    cleanup (leading blank lines, common indentation of the first line,
+    trailing newline) is applied directly.
+    """
+    global _ipython_transformer
+    if importlib.util.find_spec("IPython") is None:
+        return code
+    if IPYTHON_SYNTAX_RE.search(code):
+        if _ipython_transformer is None:
+            from IPython.core.inputtransformer2 import TransformerManager
+            _ipython_transformer = TransformerManager()
+        return _ipython_transformer.transform_cell(code)
+
+    if not code.endswith("\n"):
+        code += "\n"
+    lines = code.splitlines(keepends=True)
+    for index, line in enumerate(lines):
+        if line and not line.isspace():
+            lines = lines[index:]
+            break
+    indent = LEADING_INDENT_RE.match(lines[0])
+    if indent:
+        space = indent.group(0)
+        lines = [line[len(space):] if line.startswith(space) else line for line in lines]
+    return "".join(lines)
+
+def notebook_output_text(outputs, limit):
+    """The text of a code cell's outputs as comment lines, cut to `limit` characters."""
+    texts = []
+    for output in outputs:
+        if output.get("output_type") == "stream":
+            text = output.get("text", "")
+        elif output.get("output_type") == "error":
+            text = f"{output.get('ename', '')}: {output.get('evalue', '')}"
+        else:
+            text = output.get("data", {}).get("text/plain", "")
+        texts.append("".join(text) if isinstance(text, list) else text)
+    text = "".join(texts).rstrip("\n")
+    if not text:
+        return ""
+    if len(text) > limit:
+        text = text[:limit] + f"... [{len(text) - limit} more characters]"
+    return "\n# Output:\n# " + "\n# ".join(text.split("\n")) + "\n"
+
+def convert_notebook_fast(notebook_content, output_chars=0):
+    """
+    Convert a notebook to Python source the way nbconvert's PythonExporter
+    does (code cells with their In[] prompts, markdown cells as comments,
+    raw cells as-is) without nbconvert or its templates. Only notebooks in
+    an nbformat version other than 4 go through nbformat to be upgraded.
+    With `output_chars`, the text outputs of each code cell follow it as
+    comments, cut to that many characters.
+    """
+    notebook = json.loads(notebook_content)
+    if notebook.get("nbformat") != 4:
+        import nbformat
+        notebook = nbformat.reads(notebook_content, as_version=4)
+
+    parts = ["#!/usr/bin/env python\n# coding: utf-8\n"]
+    for cell in notebook.get("cells", []):
+        if cell.get("transient", {}).get("remove_source", False):
+            continue
+        source = cell.get("source", "")
+        if isinstance(source, list):
+            source = "".join(source)
+        cell_type = cell.get("cell_type")
+        if cell_type == "code":
+            parts.append(f"\n# In[{cell.get('execution_count') or ' '}]:\n\n\n{ipython_to_python(source)}\n")
+            if output_chars and cell.get("outputs"):
+                parts.append(notebook_output_text(cell["outputs"], output_chars))
+        elif cell_type == "markdown":
+            parts.append("\n# " + "\n# ".join(source.split("\n")) + "\n")
+        elif cell_type == "raw":
+            if cell.get("metadata", {}).get("raw_mimetype", "").lower() in ("text/x-python", ""):
+                parts.append(source)
+    return "".join(parts)
+
+def convert_notebook(notebook_content, converter=None, output_chars=None):
+    """Convert a notebook to Python source with `converter` (default NOTEBOOK_CONVERTER)."""
+    if (converter or NOTEBOOK_CONVERTER) == "nbconvert":
+        return convert_notebook_nbconvert(notebook_content)
+    return convert_notebook_fast(notebook_content, NOTEBOOK_OUTPUT_CHARS if output_chars is None else output_chars)
+
+def notebook_settings():
+    """(converter, output chars) in effect, for worker processes that may not share the module's globals."""
+    return NOTEBOOK_CONVERTER, NOTEBOOK_OUTPUT_CHARS
+
+def notebook_cache_suffix():
+    """Distinguishes cached notebook conversions made with outputs kept."""
+    return f".outputs{NOTEBOOK_OUTPUT_CHARS}" if NOTEBOOK_OUTPUT_CHARS and NOTEBOOK_CONVERTER == "fast" else ""
+
+def process_ipynb_file(temp_file):
+    with open(temp_file, "r", encoding='utf-8', errors='ignore') as f:
+        notebook_content = f.read()
+
+    return convert_notebook(notebook_content)
+
 def process_directory(url, output):
-    response = requests.get(url, headers=headers)
+    import requests
+
+    response = requests.get(url, headers=github_headers())
     response.raise_for_status()
     files = response.json()
 
@@ -125,8 +465,172 @@ def process_local_directory(local_path, output):
 
                 output.write("\n\n")
 
-def process_github_repo(repo_url):
-    api_base_url = "https://api.github.com/repos/"
+class BlobCache:
+    """
+    Persistent cache of processed file bodies keyed by git blob SHA.
+
+    A blob SHA identifies file content exactly, so an entry never goes stale;
+    the stored value is the already escaped (and notebook-converted) body.
+    Entries live one per file under `directory`; reading an entry refreshes
+    its mtime, and once the cache grows past `max_bytes` the least recently
+    used entries are deleted.
+    """
+
+    def __init__(self, directory=None, max_bytes=BLOB_CACHE_MAX_BYTES):
+        self.directory = directory or os.path.join(CACHE_DIR, "blobs")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.size = sum(size for _, _, size in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                body = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return body
+
+    def put(self, key, body):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(body)
+        with self._lock:
+            # A rewritten key (or a concurrent miss) replaces an entry that is already counted
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(temp_path, path)
+            self.size += os.path.getsize(path) - replaced
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Trim to 90% of the cap so we do not rescan on every following write
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self.size = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+def git_blob_sha(data):
+    """Compute the SHA git (and the GitHub API) uses to identify a blob with this content."""
+    sha = hashlib.sha1(b"blob %d\0" % len(data))
+    sha.update(data)  # Also takes a memory-mapped file without copying it
+    return sha.hexdigest()
+
+def blob_cache_key(sha, filename):
+    # Notebooks are cached after conversion, so keep them apart from the raw blob
+    return f"{sha}{notebook_cache_suffix()}.py" if filename.endswith(".ipynb") else sha
+
+def fetch_github_listing(url, executor, blob_cache=None, path_filter=None, directory=""):
+    """
+    Fetch one directory listing from the GitHub contents API.
+
+    Subdirectory listings and file downloads are submitted to the executor as
+    soon as they are discovered, so the whole tree is fetched in parallel. The
+    returned list keeps the API's entry order and pairs every kept entry with
+    the future that will hold its listing or file body. `directory` is the
+    listing's path below the walk's root, which `path_filter` rules are
+    relative to; directories it rejects are never listed.
+    """
+    response = http_get(url, get_session())
+    response.raise_for_status()
+
+    path_filter = path_filter or PathFilter()
+    listing = []
+    for file in response.json():
+        if file["type"] not in ("file", "dir") or not path_filter.keep(directory, file["name"], file["type"] == "dir"):
+            continue
+
+        if file["type"] == "file":
+            listing.append((file, executor.submit(fetch_github_file, file, blob_cache)))
+        else:
+            subdirectory = f"{directory}/{file['name']}" if directory else file["name"]
+            listing.append((file, executor.submit(fetch_github_listing, file["url"], executor, blob_cache,
+                                                  path_filter, subdirectory)))
+
+    return listing
+
+def fetch_github_file(file, blob_cache=None):
+    """
+    Return the escaped body of a single repository file, from the blob cache
+    when its SHA has been seen before and from download_url otherwise.
+    """
+    cache_key = None
+    if blob_cache is not None and file.get("sha"):
+        cache_key = blob_cache_key(file["sha"], file["name"])
+        body = blob_cache.get(cache_key)
+        if body is not None:
+            return body
+
+    # Not through http_cache: blob_cache already keeps the body under its SHA, which changes whenever it does
+    response = get_session().get(file["download_url"])
+    response.raise_for_status()
+    text = decode_text(response.content)
+
+    if file["name"].endswith(".ipynb"):
+        text = convert_notebook(text)
+    body = escape_xml(text)
+
+    if cache_key is not None:
+        blob_cache.put(cache_key, body)
+    return body
+
+def iter_github_files(listing_future):
+    """Yield (file entry, body future) pairs in the same depth-first order as the sequential walk."""
+    for file, future in listing_future.result():
+        if file["type"] == "dir":
+            yield from iter_github_files(future)
+        else:
+            yield file, future
+
+def iter_github_contents_files(contents_url, max_workers=None, blob_cache=None, path_filter=None):
+    """
+    Walk the repository through the contents API and yield (path, escaped body).
+
+    Listings and downloads run on a bounded pool; files are still yielded in
+    listing order so the result does not depend on completion order.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers or GITHUB_MAX_WORKERS)
+    try:
+        root_listing = executor.submit(fetch_github_listing, contents_url, executor, blob_cache, path_filter)
+        for file, body in iter_github_files(root_listing):
+            yield file["path"], body.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def parse_github_repo_url(repo_url):
+    """Split a GitHub repository URL into (owner/repo, branch or tag, subdirectory)."""
     repo_url_parts = repo_url.split("https://github.com/")[-1].split("/")
     repo_name = "/".join(repo_url_parts[:2])
 
@@ -140,7 +644,67 @@ def process_github_repo(repo_url):
         # Any remaining parts after the branch/tag name form the subdirectory
         if len(repo_url_parts) > 4:
             subdirectory = "/".join(repo_url_parts[4:])
-    
+
+    return repo_name, branch_or_tag, subdirectory
+
+def iter_github_archive_files(repo_name, branch_or_tag="", subdirectory="", blob_cache=None, path_filter=None):
+    """
+    Download the repository as a single tarball and yield (path, escaped body)
+    for every file the contents API walk would have emitted.
+
+    The archive is streamed through tarfile straight from the HTTP response and
+    never extracted to disk. Files are yielded sorted by path, which is the
+    same depth-first git tree order the contents API lists entries in.
+    """
+    archive_url = f"{GITHUB_API_URL}/repos/{repo_name}/tarball"
+    if branch_or_tag:
+        archive_url = f"{archive_url}/{branch_or_tag}"
+
+    response = get_session().get(archive_url, stream=True)
+    response.raise_for_status()
+
+    subdirectory = subdirectory.strip("/")
+    prefix = f"{subdirectory}/" if subdirectory else ""
+    path_filter = path_filter or PathFilter()
+    files = []
+    with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+        for member in archive:
+            # Symlinks and submodules have no blob in the archive, and the
+            # contents API does not report them as files either.
+            if not member.isfile() or "/" not in member.name:
+                continue
+
+            # Drop the "<owner>-<repo>-<sha>/" directory every entry is nested in
+            path = member.name.split("/", 1)[1]
+            if not path.startswith(prefix):
+                continue
+
+            # Filters only apply below the requested subdirectory, mirroring
+            # the listing walk that starts there.
+            if not path_filter.keep_path(path[len(prefix):]):
+                continue
+            filename = path.rsplit("/", 1)[-1]
+
+            data = archive.extractfile(member).read()
+            cache_key = blob_cache_key(git_blob_sha(data), filename) if blob_cache is not None else None
+            body = blob_cache.get(cache_key) if cache_key else None
+            if body is None:
+                text = decode_text(data)
+                if filename.endswith(".ipynb"):
+                    text = convert_notebook(text)
+                body = escape_xml(text)
+                if cache_key:
+                    blob_cache.put(cache_key, body)
+            files.append((path, body))
+
+    files.sort(key=lambda item: item[0].encode("utf-8"))
+    return iter(files)
+
+def process_github_repo(repo_url, max_workers=None, use_archive=False, blob_cache=None, budget=None, path_filter=None,
+                        dedup=None):
+    repo_name, branch_or_tag, subdirectory = parse_github_repo_url(repo_url)
+    api_base_url = f"{GITHUB_API_URL}/repos/"
+
     contents_url = f"{api_base_url}{repo_name}/contents"
     if subdirectory:
         contents_url = f"{contents_url}/{subdirectory}"
@@ -149,116 +713,784 @@ def process_github_repo(repo_url):
 
     repo_content = [f'<source type="github_repository" url="{repo_url}">']
 
-    def process_directory(url, repo_content):
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        files = response.json()
+    if use_archive:
+        files = iter_github_archive_files(repo_name, branch_or_tag, subdirectory, blob_cache, path_filter)
+    else:
+        files = iter_github_contents_files(contents_url, max_workers, blob_cache, path_filter)
 
-        for file in files:
-            if file["type"] == "dir" and file["name"] in EXCLUDED_DIRS:
-                continue
+    def announced(files):
+        for path, body in files:
+            print(f"Processing {path}...")
+            yield path, body, None
 
-            if file["type"] == "file" and is_allowed_filetype(file["name"]):
+    for path, body, original in iter_emitted_files(announced(files), budget, dedup):
+        if original is not None:
+            repo_content.append(duplicate_reference("file", path, original))
+            continue
+        repo_content.append(f'<file name="{escape_xml(path)}">')
+        repo_content.append(body)
+        repo_content.append('</file>')
 
-                print(f"Processing {file['path']}...")
+    repo_content.append('</source>')
+    print("All files processed.")
 
-                temp_file = f"temp_{file['name']}"
-                download_file(file["download_url"], temp_file)
+    return "\n".join(repo_content)
 
-                repo_content.append(f'<file name="{escape_xml(file["path"])}">') 
-                if file["name"].endswith(".ipynb"):
-                    repo_content.append(escape_xml(process_ipynb_file(temp_file)))
-                else:
-                    with open(temp_file, "r", encoding='utf-8', errors='ignore') as f:
-                        repo_content.append(escape_xml(f.read()))
-                repo_content.append('</file>')
-                os.remove(temp_file)
+class FragmentWriter:
+    """
+    Write output fragments to a text sink as they are produced, separated by
+    newlines exactly as '\n'.join() would separate them.
+    """
 
-            elif file["type"] == "dir":
-                process_directory(file["url"], repo_content)
+    def __init__(self, sink):
+        self.sink = sink
+        self.started = False
 
-    process_directory(contents_url, repo_content)
-    repo_content.append('</source>')
-    print("All files processed.")
+    def write(self, fragment):
+        if self.started:
+            self.sink.write('\n')
+        if isinstance(fragment, MappedText):
+            for chunk in fragment:
+                self.sink.write(chunk)
+        else:
+            self.sink.write(fragment)
+        self.started = True
 
-    return "\n".join(repo_content)
+def truncation_marker(size, kept):
+    return f"\n... [{size - kept} more bytes truncated]"
 
-def process_local_folder(local_path):
-    logging.info(f"Starting process_local_folder with path: {local_path}")
-    
-    def process_local_directory(local_path):
-        logging.info(f"Processing directory: {local_path}")
-        content = [f'<source type="local_directory" path="{escape_xml(local_path)}">']
-        
+class MappedText:
+    """
+    The escaped text of a large local file, decoded from a memory map
+    LOCAL_STREAM_CHUNK_BYTES at a time as it is iterated instead of being
+    held as one string. The text is the same decode_text and escape_xml give
+    for the whole file (cut to `limit` bytes and followed by a truncation
+    marker); str() returns all of it. Only the path is kept, so worker
+    processes can hand one back cheaply.
+    """
+
+    def __init__(self, file_path, limit=None, size=None):
+        self.file_path = file_path
+        self.limit = limit
+        self.size = size
+
+    def __iter__(self):
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(errors="ignore"), translate=True)
+        with open(self.file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            end = len(data) if self.limit is None else min(self.limit, len(data))
+            for start in range(0, end, LOCAL_STREAM_CHUNK_BYTES):
+                text = decoder.decode(data[start:min(start + LOCAL_STREAM_CHUNK_BYTES, end)])
+                if text:
+                    yield escape_xml(text)
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield escape_xml(text)
+        if self.limit is not None and self.size > self.limit:
+            yield truncation_marker(self.size, self.limit)
+
+    def __str__(self):
+        return "".join(self)
+
+class LocalFileLimits:
+    """
+    Per-file and total byte caps for the files of local folders, and the
+    record of the files skipped or truncated on the way, for the run summary.
+
+    The caps are applied to file sizes in walk order before anything is
+    read, so a tree keeps the same bytes whatever --jobs is. A file over the
+    per-file cap, or over what is left of the total, keeps its first bytes
+    and a truncation marker; once the total is used up, the remaining files
+    are skipped. A cap of 0 means no cap.
+    """
+
+    def __init__(self, max_file_bytes=LOCAL_MAX_FILE_BYTES, max_total_bytes=0):
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self.used = 0
+        self.skipped = []  # (relative path, reason)
+        self._truncated = {}  # file path: (relative path, size, bytes kept)
+
+    def apply(self, files):
+        """Pass on the (file path, relative path) pairs of a walk, leaving out the files past the total cap."""
+        for file_path, relative_path in files:
+            try:
+                size = os.stat(file_path).st_size
+            except OSError:
+                size = 0  # Left for the reader to report
+            limit = self.max_file_bytes or size
+            if self.max_total_bytes:
+                left = self.max_total_bytes - self.used
+                if left <= 0:
+                    self.skip(relative_path, "total size cap reached")
+                    continue
+                limit = min(limit, left)
+            if size > limit:
+                self._truncated[file_path] = (relative_path, size, limit)
+            self.used += min(size, limit)
+            yield file_path, relative_path
+
+    def limit(self, file_path):
+        """Bytes of `file_path` to keep, or None for all of them."""
+        truncated = self._truncated.get(file_path)
+        return truncated[2] if truncated else None
+
+    def skip(self, relative_path, reason):
+        self.skipped.append((relative_path, reason))
+
+    @property
+    def truncated(self):
+        """(relative path, size, bytes kept) of the files that were cut short and not skipped after all."""
+        skipped = {relative_path for relative_path, _ in self.skipped}
+        return [entry for entry in self._truncated.values() if entry[0] not in skipped]
+
+def read_local_file(file_path, known_digest=None, limit=None, notebooks=None):
+    """
+    Read one local file and return (escaped body, git blob SHA of its bytes),
+    converting notebooks to Python with the `notebooks` settings (default
+    notebook_settings()). The body is None when the content still has
+    `known_digest`, so an unchanged file is not decoded or converted again.
+
+    A file with a NUL byte in its first LOCAL_SNIFF_BYTES is rejected as
+    binary. Only the first `limit` bytes of a longer file are kept, followed
+    by a truncation marker, and its digest is None; notebooks cannot be cut
+    and are rejected instead. Files of LOCAL_MMAP_BYTES or more come back as
+    a MappedText, which streams the body from a memory map.
+    """
+    with open(file_path, "rb") as f:
+        head = f.read(LOCAL_SNIFF_BYTES)
+        if b"\0" in head:
+            raise ValueError("binary content")
+        size = os.fstat(f.fileno()).st_size
+        notebook = file_path.endswith(".ipynb")
+        if limit is not None and size > limit:
+            if notebook:
+                raise ValueError(f"notebook of {size} bytes is over the {limit} byte cap")
+            if limit >= LOCAL_MMAP_BYTES:
+                return MappedText(file_path, limit, size), None
+            data = head[:limit] + f.read(max(limit - len(head), 0))
+            return escape_xml(decode_text(data)) + truncation_marker(size, limit), None
+        if size >= LOCAL_MMAP_BYTES and not notebook:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest = git_blob_sha(data)
+            return (None if digest == known_digest else MappedText(file_path, None, size)), digest
+        data = head + f.read()
+    digest = git_blob_sha(data)
+    if digest == known_digest:
+        return None, digest
+    if notebook:
+        return escape_xml(convert_notebook(decode_text(data), *(notebooks or notebook_settings()))), digest
+    return escape_xml(decode_text(data)), digest
+
+def read_local_files(file_paths, known_digests=None, limits=None, notebooks=None):
+    """
+    Worker task for parallel local folder processing: read a chunk of files and
+    return (body, digest, error message) triples so a failure only affects its own file.
+    """
+    results = []
+    for file_path, known_digest, limit in zip(file_paths, known_digests or [None] * len(file_paths),
+                                              limits or [None] * len(file_paths)):
         try:
-            for root, dirs, files in os.walk(local_path):
-                logging.debug(f"Walking directory: {root}")
-                logging.debug(f"Found directories: {dirs}")
-                logging.debug(f"Found files: {files}")
-                
-                # Exclude directories
-                dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+            results.append(read_local_file(file_path, known_digest, limit, notebooks) + (None,))
+        except Exception as e:
+            results.append((None, None, str(e)))
+    return results
+
+def gitignore_glob_regex(glob):
+    """Regex source for a .gitignore glob without its leading and trailing slashes."""
+    parts = []
+    i = 0
+    while i < len(glob):
+        char = glob[i]
+        if char == "*":
+            # "**" only spans directories as a whole path segment; elsewhere it is a plain "*"
+            if glob.startswith("**", i) and (i == 0 or glob[i - 1] == "/") and glob[i + 2:i + 3] in ("", "/"):
+                if i + 2 == len(glob):
+                    parts.append(".+")
+                else:
+                    parts.append("(?:.*/)?")
+                i += 3
+                continue
+            start = i
+            while glob.startswith("*", i):
+                i += 1
+            # A whole segment of stars names an entry, which is never empty; so "logs/*" does not match "logs/"
+            whole_segment = (start == 0 or glob[start - 1] == "/") and (i == len(glob) or glob[i] == "/")
+            parts.append("[^/]+" if whole_segment else "[^/]*")
+            continue
+        if char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            end = i + 1
+            if glob[end:end + 1] in ("!", "^"):
+                end += 1
+            if glob[end:end + 1] == "]":
+                end += 1
+            end = glob.find("]", end)
+            if end < 0:
+                parts.append(re.escape(char))
+            else:
+                members = glob[i + 1:end]
+                negated = members[:1] in ("!", "^")
+                members = "".join("-" if member == "-" else re.escape(member) for member in members[negated:])
+                parts.append(f"[^/{members}]" if negated else f"(?!/)[{members}]")
+                i = end
+        elif char == "\\" and i + 1 < len(glob):
+            i += 1
+            parts.append(re.escape(glob[i]))
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return "".join(parts)
 
-                logging.debug(f"After exclusion, processing directories: {dirs}")
+def compile_gitignore_rules(lines, directory=""):
+    """
+    Translate .gitignore lines from relative `directory` ("" for the root)
+    into (regex source, negated) rules. The regexes match paths relative to
+    the root, with a trailing "/" for directories.
+    """
+    prefix = re.escape(directory + "/") if directory else ""
+    rules = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        while line.endswith(" ") and not line.endswith("\\ "):
+            line = line[:-1]
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        directory_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # Patterns with a slash are relative to the .gitignore; others match a name at any depth below it
+        anchored = "/" in line
+        body = gitignore_glob_regex(line.lstrip("/"))
+        rules.append((prefix + ("" if anchored else "(?:.*/)?") + body + ("/" if directory_only else "/?"), negated))
+    return rules
+
+class PathFilter:
+    """
+    Decides which files and directories are ingested, for local folders,
+    GitHub repositories (contents API and archives) and git refs alike.
+
+    A path is kept when its name passes the built-in rules (EXCLUDED_DIRS
+    for directories, is_allowed_filetype for files) and no gitignore-style
+    rule ignores it. The rules are the `exclude` patterns and, for a
+    `local_path` with `gitignore` on, .git/info/exclude and every
+    .gitignore on the way down. Patterns are relative to the root being
+    ingested and follow git's precedence: deeper files override shallower
+    ones, later lines override earlier ones, and `exclude` overrides all.
+
+    The rules in effect in a directory are compiled into one regex whose
+    alternatives run from the highest precedence rule down, so a single
+    fullmatch finds the deciding rule. Directories are checked before they
+    are descended into, so ignored trees are never walked.
+    """
 
-                for file in files:
-                    if is_allowed_filetype(file):
-                        logging.info(f"Processing file: {os.path.join(root, file)}")
+    def __init__(self, local_path=None, exclude=(), gitignore=True):
+        self.local_path = local_path
+        self.exclude = list(exclude)
+        self.gitignore = gitignore and local_path is not None
+        self._exclude_rules = compile_gitignore_rules(self.exclude)
+        self._matchers = {}  # relative directory: (rules in effect, compiled regex or None, negated flags)
+        self._directories = {}  # relative directory: kept, for keep_path
+        self.sources = set()  # Relative paths of the .gitignore files read
+
+    def reset(self):
+        """Forget the rules read from disk, after a .gitignore changed."""
+        self._matchers.clear()
+        self._directories.clear()
+        self.sources.clear()
+
+    def _read_rules(self, relative_path, directory):
+        try:
+            with open(os.path.join(self.local_path, relative_path), encoding="utf-8", errors="replace") as f:
+                lines = f.readlines()
+        except OSError:
+            return []
+        self.sources.add(relative_path)
+        return compile_gitignore_rules(lines, directory)
+
+    def load(self, directory, has_gitignore=None):
+        """
+        The matcher for entries of relative `directory`, reading its
+        .gitignore unless `has_gitignore` says there is none.
+        """
+        matcher = self._matchers.get(directory)
+        if matcher is not None:
+            return matcher
+        if directory:
+            rules = self.load(directory.rpartition("/")[0])[0]
+        else:
+            rules = self._read_rules(os.path.join(".git", "info", "exclude"), "") if self.gitignore else []
+        own = []
+        if self.gitignore and has_gitignore is not False:
+            own = self._read_rules(os.path.join(directory, ".gitignore"), directory)
+        if directory and not own:
+            matcher = self._matchers[directory.rpartition("/")[0]]
+        else:
+            rules = rules + own
+            ordered = (rules + self._exclude_rules)[::-1]
+            regex = re.compile("|".join(f"({source})" for source, _ in ordered)) if ordered else None
+            matcher = (rules, regex, (None,) + tuple(negated for _, negated in ordered))
+        self._matchers[directory] = matcher
+        return matcher
+
+    def keep(self, directory, name, is_directory=False):
+        """Whether `name`, directly inside relative `directory`, is kept; its parents are not checked."""
+        if is_directory:
+            if name in EXCLUDED_DIRS:
+                return False
+        elif not is_allowed_filetype(name):
+            return False
+        _, regex, negated = self.load(directory)
+        if regex is None:
+            return True
+        path = f"{directory}/{name}" if directory else name
+        match = regex.fullmatch(path + "/" if is_directory else path)
+        return match is None or negated[match.lastindex]
+
+    def keep_path(self, relative_path, is_directory=False):
+        """Whether `relative_path` and every directory above it are kept."""
+        directory, _, name = relative_path.replace(os.sep, "/").rpartition("/")
+        if not name:
+            return True
+        if directory:
+            kept = self._directories.get(directory)
+            if kept is None:
+                kept = self._directories[directory] = self.keep_path(directory, is_directory=True)
+            if not kept:
+                return False
+        return self.keep(directory, name, is_directory)
+
+def iter_local_folder_files(local_path, path_filter=None):
+    """
+    Yield (file path, relative path) for every file `path_filter` keeps
+    (default: the built-in rules and the folder's .gitignore files), in
+    os.walk order. Ignored directories are pruned before they are walked.
+    """
+    path_filter = path_filter or PathFilter(local_path)
+    for root, dirs, files in os.walk(local_path):
+        logging.debug(f"Walking directory: {root}")
+        logging.debug(f"Found directories: {dirs}")
+        logging.debug(f"Found files: {files}")
 
-                        try:
-                            file_path = os.path.join(root, file)
-                            relative_path = os.path.relpath(file_path, local_path)
-                            content.append(f'<file name="{escape_xml(relative_path)}">')
+        relative_root = os.path.relpath(root, local_path)
+        directory = "" if relative_root == "." else relative_root.replace(os.sep, "/")
+        path_filter.load(directory, ".gitignore" in files)
+
+        # Exclude directories
+        dirs[:] = [d for d in dirs if path_filter.keep(directory, d, is_directory=True)]
+
+        logging.debug(f"After exclusion, processing directories: {dirs}")
 
-                            if file.endswith(".ipynb"):
-                                content.append(escape_xml(process_ipynb_file(file_path)))
-                            else:
-                                with open(file_path, "r", encoding='utf-8', errors='ignore') as f:
-                                    content.append(escape_xml(f.read()))
+        for file in files:
+            if path_filter.keep(directory, file):
+                yield os.path.join(root, file), file if relative_root == "." else os.path.join(relative_root, file)
+
+def iter_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_read_local_files(files, jobs=1, known_digests=None, limits=None):
+    """
+    Read files given as (file path, relative path) pairs and yield
+    (file path, relative path, body, digest, error) in the order they were
+    given. `known_digests` maps file paths to the digest their content had
+    last time, and `limits` (a LocalFileLimits the files went through) says
+    how much of each to keep; see read_local_file.
+
+    With jobs > 1 the files are read in chunks on a process pool. Only a few
+    chunks per worker are in flight at once, so results are written out as
+    the walk progresses instead of piling up in memory. The notebook
+    settings go with every chunk, as workers started by spawn or forkserver
+    re-import the module with the default settings.
+    """
+    known_digests = known_digests or {}
+    limit = limits.limit if limits is not None else lambda file_path: None
+    notebooks = notebook_settings()
+    if jobs <= 1:
+        for file_path, relative_path in files:
+            (body, digest, error), = read_local_files([file_path], [known_digests.get(file_path)], [limit(file_path)],
+                                                      notebooks)
+            yield file_path, relative_path, body, digest, error
+        return
+
+    def submit(chunk):
+        file_paths = [file_path for file_path, _ in chunk]
+        return executor.submit(read_local_files, file_paths, [known_digests.get(file_path) for file_path in file_paths],
+                               [limit(file_path) for file_path in file_paths], notebooks)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for chunk in iter_chunks(files, LOCAL_CHUNK_SIZE):
+            pending.append((chunk, submit(chunk)))
+            if len(pending) >= jobs * 4:
+                chunk, future = pending.popleft()
+                for (file_path, relative_path), result in zip(chunk, future.result()):
+                    yield (file_path, relative_path) + result
+        while pending:
+            chunk, future = pending.popleft()
+            for (file_path, relative_path), result in zip(chunk, future.result()):
+                yield (file_path, relative_path) + result
+
+class LocalManifest:
+    """
+    SQLite record of the files of local folders from earlier runs: size,
+    mtime and git blob SHA of each file, with its escaped (and
+    notebook-converted) body.
+
+    A file whose size and mtime are unchanged is taken from the manifest
+    without being opened. Files streamed from a memory map (see MappedText)
+    are recorded without a body and streamed again; truncated files are
+    neither taken from nor recorded in the manifest, since what is kept of
+    them depends on the caps. A file whose stat changed is read and hashed, and
+    only decoded and converted again if its content changed too. Files that
+    are gone are removed at the end of the walk. A file modified less than
+    LOCAL_MANIFEST_RACY_NS before the walk started is always hashed on the
+    next run, since a later write within the same mtime tick would not show
+    in its stat.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, "local_manifest.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.unchanged = 0
+        self.read = 0
+        self.removed = 0
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "root TEXT, path TEXT, size INTEGER, mtime_ns INTEGER, digest TEXT, body TEXT, PRIMARY KEY (root, path))"
+        )
+        self._db.commit()
+
+    def iter_files(self, local_path, files, jobs=1, limits=None):
+        """
+        Take the (file path, relative path) pairs of a walk of `local_path`
+        and yield (file path, relative path, body, error) like
+        iter_read_local_files, reading only files that changed since the
+        last run and updating the manifest as they are read.
+        """
+        root = os.path.abspath(local_path) + notebook_cache_suffix()  # Notebook bodies depend on the conversion settings
+        started_ns = time.time_ns()
+        known = {path: (size, mtime_ns, digest) for path, size, mtime_ns, digest in self._db.execute(
+            "SELECT path, size, mtime_ns, digest FROM files WHERE root = ?", (root,))}
+
+        entries = []
+        stats = {}
+        for file_path, relative_path in files:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                stat = None
+            stats[file_path] = stat
+            row = known.get(relative_path)
+            entries.append((file_path, relative_path, stat is not None and row is not None
+                            and row[:2] == (stat.st_size, stat.st_mtime_ns)
+                            and (limits is None or limits.limit(file_path) is None)))
+        stale = [(file_path, relative_path) for file_path, relative_path, fresh in entries if not fresh]
+        known_digests = {file_path: known[relative_path][2] for file_path, relative_path in stale if relative_path in known}
+        reader = iter_read_local_files(stale, jobs, known_digests, limits)
+
+        def record(relative_path, stat, digest, body):
+            # Files modified just before the walk get mtime -1 so the next run hashes them again
+            mtime_ns = stat.st_mtime_ns if stat.st_mtime_ns < started_ns - LOCAL_MANIFEST_RACY_NS else -1
+            self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                             (root, relative_path, stat.st_size, mtime_ns, digest,
+                              None if isinstance(body, MappedText) else body))
+
+        def cached_bodies(relative_paths):
+            return dict(self._db.execute(
+                f"SELECT path, body FROM files WHERE root = ? AND path IN ({','.join('?' * len(relative_paths))})",
+                [root] + relative_paths,
+            ))
+
+        def cached_body(file_path, body):
+            # Large files are recorded without a body and streamed from disk again
+            return MappedText(file_path, None, stats[file_path].st_size) if body is None else body
+
+        seen = set()
+        try:
+            for chunk in iter_chunks(entries, 500):
+                bodies = cached_bodies([relative_path for _, relative_path, fresh in chunk if fresh])
+                for file_path, relative_path, fresh in chunk:
+                    seen.add(relative_path)
+                    if fresh:
+                        self.unchanged += 1
+                        yield file_path, relative_path, cached_body(file_path, bodies[relative_path]), None
+                        continue
+                    _, _, body, digest, error = next(reader)
+                    if error is None and stats[file_path] is not None:
+                        if body is None:
+                            self.unchanged += 1
+                            body = cached_body(file_path, cached_bodies([relative_path])[relative_path])
+                        else:
+                            self.read += 1
+                        if digest is not None:
+                            record(relative_path, stats[file_path], digest, body)
+                    yield file_path, relative_path, body, error
+
+            removed = [(root, path) for path in known if path not in seen]
+            self._db.executemany("DELETE FROM files WHERE root = ? AND path = ?", removed)
+            self.removed += len(removed)
+            self._db.commit()
+        finally:
+            reader.close()
+            if self._db.in_transaction:
+                self._db.rollback()
+
+    def close(self):
+        self._db.close()
+
+def write_local_folder(local_path, sink, jobs=1, budget=None, manifest=None, path_filter=None, limits=None,
+                       dedup=None):
+    """
+    Walk `local_path` and write the flattened <source type="local_directory">
+    document to `sink` (an open file, sys.stdout, io.StringIO, ...) one file at
+    a time, so memory use does not grow with the size of the tree.
+
+    With jobs > 1, reading, decoding, escaping and notebook conversion are
+    spread over that many processes; output order is unchanged. With a
+    LocalManifest, only files that changed since the last run are read. With
+    a TokenBudget, bodies are kept in memory until the walk is done and only
+    the files it selects are written. `path_filter` picks the files (see
+    iter_local_folder_files). `limits` caps how much of them is read and
+    records the files skipped or truncated (see LocalFileLimits); large files
+    are streamed to `sink` in chunks unless a budget needs their whole text.
+    With a Deduplicator, a file whose body was already written becomes a
+    reference to the first copy.
+    """
+    logging.info(f"Starting process_local_folder with path: {local_path}")
+    writer = FragmentWriter(sink)
+    limits = limits or LocalFileLimits()
 
-                            content.append('</file>')
-                        except Exception as e:
-                            logging.error(f"Error processing file {file}: {str(e)}")
+    def process_local_directory(local_path):
+        logging.info(f"Processing directory: {local_path}")
+        writer.write(f'<source type="local_directory" path="{escape_xml(local_path)}">')
+        
+        try:
+            files = limits.apply(iter_local_folder_files(local_path, path_filter))
+            if manifest is not None:
+                results = manifest.iter_files(local_path, files, jobs, limits)
+            else:
+                results = ((file_path, relative_path, body, error)
+                           for file_path, relative_path, body, _, error in iter_read_local_files(files, jobs, limits=limits))
+
+            def read_files():
+                for file_path, relative_path, body, error in results:
+                    logging.info(f"Processing file: {file_path}")
+                    if error is not None:
+                        logging.error(f"Error processing file {os.path.basename(file_path)}: {error}")
+                        limits.skip(relative_path, error)
+                        continue
+                    yield relative_path, body, os.path.getmtime(file_path) if budget is not None else None
+
+            for relative_path, body, original in iter_emitted_files(read_files(), budget, dedup):
+                if original is not None:
+                    writer.write(duplicate_reference("file", relative_path, original))
+                    continue
+                writer.write(f'<file name="{escape_xml(relative_path)}">')
+                writer.write(body)
+                writer.write('</file>')
 
         except Exception as e:
             logging.error(f"Error walking directory {local_path}: {str(e)}")
             raise
 
-        content.append('</source>')
-        return '\n'.join(content)
+        writer.write('</source>')
 
     try:
-        formatted_content = process_local_directory(local_path)
+        process_local_directory(local_path)
         logging.info("All files processed successfully")
-        return formatted_content
     except Exception as e:
         logging.error(f"Fatal error in process_local_folder: {str(e)}")
         raise
 
-def process_arxiv_pdf(arxiv_abs_url):
+def process_local_folder(local_path, jobs=1, budget=None, manifest=None, path_filter=None, limits=None, dedup=None):
+    buffer = io.StringIO()
+    write_local_folder(local_path, buffer, jobs, budget, manifest, path_filter, limits, dedup)
+    return buffer.getvalue()
+
+class GitObjectReader:
+    """
+    Read blobs from a repository's object database through one long-lived
+    `git cat-file --batch` process instead of spawning git per object.
+    """
+
+    def __init__(self, repo_path):
+        self.process = subprocess.Popen(
+            ["git", "-C", repo_path, "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def iter_blobs(self, object_ids):
+        """
+        Yield the contents of each object in order. Requests are written from a
+        separate thread so git never stalls on a full pipe while we read.
+        """
+        object_ids = list(object_ids)
+
+        def write_requests():
+            try:
+                for object_id in object_ids:
+                    self.process.stdin.write(f"{object_id}\n".encode("ascii"))
+                self.process.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                pass
+
+        writer = threading.Thread(target=write_requests, daemon=True)
+        writer.start()
+        try:
+            for object_id in object_ids:
+                header = self.process.stdout.readline().decode("ascii").split()
+                if len(header) != 3:
+                    raise RuntimeError(f"git cat-file could not read object {object_id}: {' '.join(header)}")
+                size = int(header[2])
+                data = self.process.stdout.read(size)
+                self.process.stdout.read(1)  # Trailing newline after every object
+                yield data
+        finally:
+            writer.join()
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.stdout.close()
+            self.process.wait()
+
+def list_git_ref_files(repo_path, ref, path_filter=None):
+    """
+    List the allowed files of `ref` below `repo_path` as (relative path, blob id)
+    pairs in git tree order, applying the same filters as the folder walk
+    (`path_filter`, default: the built-in rules).
+    """
+    result = subprocess.run(
+        ["git", "-C", repo_path, "ls-tree", "-r", "-z", ref],
+        capture_output=True,
+        check=True,
+    )
+
+    path_filter = path_filter or PathFilter()
+    files = []
+    for record in result.stdout.decode("utf-8", errors="replace").split("\0"):
+        if not record:
+            continue
+        info, path = record.split("\t", 1)
+        mode, object_type, object_id = info.split()
+        # Skip submodules (commits) and symlinks, whose blob is only the link target
+        if object_type != "blob" or mode == "120000":
+            continue
+
+        if path_filter.keep_path(path):
+            files.append((path, object_id))
+    return files
+
+def process_local_git_ref(repo_path, ref, path_filter=None):
+    """
+    Flatten a local git repository as it was at `ref` (branch, tag or commit)
+    by reading blobs straight from the object database, without checking the
+    ref out or touching the working tree.
+    """
+    logging.info(f"Starting process_local_git_ref with path: {repo_path} at ref: {ref}")
+
+    files = list_git_ref_files(repo_path, ref, path_filter)
+    content = [f'<source type="local_git_repository" path="{escape_xml(repo_path)}" ref="{escape_xml(ref)}">']
+
+    with GitObjectReader(repo_path) as reader:
+        for (path, _), data in zip(files, reader.iter_blobs(object_id for _, object_id in files)):
+            logging.info(f"Processing file: {path}")
+            try:
+                text = decode_text(data)
+                if path.endswith(".ipynb"):
+                    text = convert_notebook(text)
+                content.append(f'<file name="{escape_xml(path)}">')
+                content.append(escape_xml(text))
+                content.append('</file>')
+            except Exception as e:
+                logging.error(f"Error processing file {path}: {str(e)}")
+
+    content.append('</source>')
+    logging.info("All files processed successfully")
+    return '\n'.join(content)
+
+_pdf_worker_reader = None  # PdfReader over the document being extracted, one per worker process
+
+def _init_pdf_worker(data):
+    global _pdf_worker_reader
+    from PyPDF2 import PdfReader
+
+    _pdf_worker_reader = PdfReader(io.BytesIO(data))
+
+def extract_pdf_pages(start, stop):
+    """Text of pages [start, stop) of the document loaded by _init_pdf_worker."""
+    return [_pdf_worker_reader.pages[page].extract_text() for page in range(start, stop)]
+
+def iter_pdf_pages(data, jobs=None):
+    """
+    Yield the text of every page of the PDF in `data` (bytes), in page order.
+
+    The document is read from memory, never from a temporary file. PDFs of
+    at least PDF_PARALLEL_MIN_PAGES pages are extracted on a pool of `jobs`
+    processes (default: one per CPU), each parsing its own copy of the
+    document once and then extracting PDF_CHUNK_PAGES pages per task. Only a
+    few chunks per worker are in flight, so pages are yielded as they are
+    ready rather than collected first.
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    num_pages = len(reader.pages)
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or num_pages < PDF_PARALLEL_MIN_PAGES:
+        for page in range(num_pages):
+            yield reader.pages[page].extract_text()
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_pdf_worker, initargs=(data,)) as executor:
+        pending = deque()
+        for start in range(0, num_pages, PDF_CHUNK_PAGES):
+            pending.append(executor.submit(extract_pdf_pages, start, min(start + PDF_CHUNK_PAGES, num_pages)))
+            if len(pending) >= jobs * 4:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def write_arxiv_pdf(arxiv_abs_url, sink, jobs=None):
+    """Download an arXiv paper and write its <source type="arxiv_paper"> document to `sink` page by page."""
     pdf_url = arxiv_abs_url.replace("/abs/", "/pdf/") + ".pdf"
-    response = requests.get(pdf_url)
-    pdf_content = response.content
-
-    with open('temp.pdf', 'wb') as pdf_file:
-        pdf_file.write(pdf_content)
-
-    text = []
-    with open('temp.pdf', 'rb') as pdf_file:
-        pdf_reader = PdfReader(pdf_file)
-        for page in range(len(pdf_reader.pages)):
-            text.append(pdf_reader.pages[page].extract_text())
-
-    formatted_text = f'<source type="arxiv_paper" url="{arxiv_abs_url}">\n'
-    formatted_text += '<paper>\n'
-    formatted_text += escape_xml(' '.join(text))
-    formatted_text += '\n</paper>\n'
-    formatted_text += '</source>'
+    response = http_get(pdf_url)
+
+    sink.write(f'<source type="arxiv_paper" url="{arxiv_abs_url}">\n')
+    sink.write('<paper>\n')
+    for index, text in enumerate(iter_pdf_pages(response.content, jobs)):
+        if index:
+            sink.write(' ')
+        sink.write(escape_xml(text))
+    sink.write('\n</paper>\n')
+    sink.write('</source>')
 
-    os.remove('temp.pdf')
     print("ArXiv paper processed successfully.")
 
-    return formatted_text
+def process_arxiv_pdf(arxiv_abs_url, jobs=None):
+    output = io.StringIO()
+    write_arxiv_pdf(arxiv_abs_url, output, jobs)
+    return output.getvalue()
 
 def extract_links(input_file, output_file):
     url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
@@ -288,6 +1520,8 @@ def fetch_youtube_transcript(url):
         return f'<source type="youtube_transcript" url="{escape_xml(url)}">\n<error>Invalid YouTube URL format</error>\n</source>'
 
     try:
+        from youtube_transcript_api import YouTubeTranscriptApi
+
         # Try to get all available transcripts first
         transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
         logging.debug(f"Available transcripts: {transcript_list}")
@@ -323,57 +1557,1120 @@ def fetch_youtube_transcript(url):
         logging.error(error_message)
         return f'<source type="youtube_transcript" url="{escape_xml(url)}">\n<error>{escape_xml(error_message)}</error>\n</source>'
 
-def preprocess_text(input_file, output_file):
+# Characters the compressor keeps (everything else is deleted before words are split)
+COMPRESS_DISALLOWED_RE = re.compile(r"[^a-zA-Z0-9\s_.,!?:;@#$%^&*()+\-=[\]{}|\\<>`~'\"/]+")
+COMPRESS_BATCH_CHARS = 1 << 20  # Text handed to a worker process at a time when compressing with jobs > 1
+
+def compress_text(text):
+    """
+    Normalise text for the compressed output: drop characters outside the
+    allowed set, lowercase, collapse whitespace and remove stop words.
+    """
+    words = COMPRESS_DISALLOWED_RE.sub("", text).lower().split()
+    return " ".join([word for word in words if word not in stop_words])
+
+def escape_xml_attribute(text):
+    """Escape an attribute value the way ElementTree writes it."""
+    text = escape_xml(text).replace('"', "&quot;")
+    return text.replace("\r", "&#13;").replace("\n", "&#10;").replace("\t", "&#09;")
+
+def render_compressed(items):
+    """
+    Render a batch of compressor output items: plain strings are copied,
+    ("text", raw) items become compressed, escaped text, and ("leaf", tag,
+    raw) items close an element without children, choosing between
+    ">text</tag>" and " />" as ElementTree does.
+    """
+    rendered = []
+    for item in items:
+        if isinstance(item, str):
+            rendered.append(item)
+        elif item[0] == "text":
+            rendered.append(escape_xml(compress_text(item[1])))
+        else:
+            _, tag, raw = item
+            text = compress_text(raw) if raw else raw
+            rendered.append(f">{escape_xml(text)}</{tag}>" if text else " />")
+    return "".join(rendered)
+
+class CompressorFallback(Exception):
+    """Raised when streaming cannot reproduce ElementTree's output (namespaced XML)."""
+
+def iter_compressed_xml_items(chunks):
+    """
+    Parse XML from text `chunks` incrementally and yield the output items
+    (see render_compressed) of the compressed document, element by element.
+
+    The items reproduce ElementTree.write() after compressing every text and
+    tail: a start tag stays open until the next event shows whether the
+    element has text or children, and a tail is emitted once the parser has
+    moved past it. Finished elements are removed from the tree, so memory use
+    is bounded by nesting depth rather than document size.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    stack = []
+    open_element = None  # Start tag written, ">" or " />" not yet
+    tail_owner = None  # Ended element whose tail is not written yet
+
+    def flush_tail():
+        nonlocal tail_owner
+        if tail_owner is not None:
+            if tail_owner.tail:
+                yield ("text", tail_owner.tail)
+            if stack:
+                stack[-1].remove(tail_owner)
+            tail_owner = None
+
+    def handle(event, element):
+        nonlocal open_element, tail_owner
+        yield from flush_tail()
+        if event == "start":
+            if element.tag[:1] == "{" or any(key[:1] == "{" for key in element.keys()):
+                raise CompressorFallback(element.tag)
+            if open_element is not None:
+                yield ">"
+                if open_element.text:
+                    yield ("text", open_element.text)
+                open_element = None
+            yield "<" + element.tag + "".join(f' {key}="{escape_xml_attribute(value)}"' for key, value in element.items())
+            stack.append(element)
+            open_element = element
+        else:
+            stack.pop()
+            if open_element is element:
+                yield ("leaf", element.tag, element.text)
+                open_element = None
+            else:
+                yield f"</{element.tag}>"
+            tail_owner = element
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            yield from handle(event, element)
+    parser.close()
+    for event, element in parser.read_events():
+        yield from handle(event, element)
+    yield from flush_tail()
+
+def iter_compressed_plain_items(chunks):
+    """
+    Output items for text that is not well-formed XML: the whole text is
+    compressed as one string. Chunks are cut at whitespace, which compression
+    turns into a word boundary anyway, so they can be compressed separately.
+    """
+    carry = ""
+    for chunk in chunks:
+        text = carry + chunk
+        cut = max(text.rfind(" "), text.rfind("\n"))
+        if cut < 0:
+            carry = text
+            continue
+        carry = text[cut:]
+        yield ("plain", text[:cut])
+    yield ("plain", carry)
+
+def iter_text_chunks(path, size=COMPRESS_BATCH_CHARS):
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+def iter_rendered(items, render, jobs=1):
+    """
+    Group items into batches of about COMPRESS_BATCH_CHARS characters and
+    yield render(batch) for each, in order, on `jobs` processes when jobs > 1.
+    """
+    def batches():
+        batch = []
+        size = 0
+        for item in items:
+            batch.append(item)
+            size += len(item) if isinstance(item, str) else len(item[-1] or "")
+            if size >= COMPRESS_BATCH_CHARS:
+                yield batch
+                batch = []
+                size = 0
+        if batch:
+            yield batch
+
+    if jobs <= 1:
+        for batch in batches():
+            yield render(batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for batch in batches():
+            pending.append(executor.submit(render, batch))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def render_compressed_plain(items):
+    """Compress ("plain", text) items and join the non-empty results with spaces."""
+    return " ".join([text for text in (compress_text(item[1]) for item in items) if text])
+
+def preprocess_text_tree(input_file, output_file):
+    """Compress by parsing the whole document into an ElementTree; used for namespaced XML."""
     with open(input_file, "r", encoding="utf-8") as input_file:
-        input_text = input_file.read()
-
-    def process_text(text):
-        text = re.sub(r"[\n\r]+", "\n", text)
-        # Update the following line to include apostrophes and quotation marks
-        text = re.sub(r"[^a-zA-Z0-9\s_.,!?:;@#$%^&*()+\-=[\]{}|\\<>`~'\"/]+", "", text)
-        text = re.sub(r"\s+", " ", text)
-        text = text.lower()
-        words = text.split()
-        words = [word for word in words if word not in stop_words]
-        return " ".join(words)
+        root = ET.fromstring(input_file.read())
+    for elem in root.iter():
+        if elem.text:
+            elem.text = compress_text(elem.text)
+        if elem.tail:
+            elem.tail = compress_text(elem.tail)
+    ET.ElementTree(root).write(output_file, encoding="utf-8", xml_declaration=True)
+
+def preprocess_text(input_file, output_file, jobs=1):
+    """
+    Write the compressed variant of `input_file` to `output_file`.
 
+    Well-formed XML keeps its structure and is streamed one element at a
+    time (see iter_compressed_xml_items), producing the same bytes as
+    compressing a full ElementTree and writing it. Anything else is
+    compressed as plain text. With jobs > 1, text is compressed on that many
+    processes while the output order is kept.
+    """
     try:
-        # Try to parse the input as XML
-        root = ET.fromstring(input_text)
-
-        # Process text content while preserving XML structure
-        for elem in root.iter():
-            if elem.text:
-                elem.text = process_text(elem.text)
-            if elem.tail:
-                elem.tail = process_text(elem.tail)
-
-        # Write the processed XML to the output file
-        tree = ET.ElementTree(root)
-        tree.write(output_file, encoding="utf-8", xml_declaration=True)
+        # Opened the way ElementTree.write opens a file name
+        with open(output_file, "w", encoding="utf-8", errors="xmlcharrefreplace") as sink:
+            sink.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            for rendered in iter_rendered(iter_compressed_xml_items(iter_text_chunks(input_file)), render_compressed, jobs):
+                sink.write(rendered)
+        print("Text preprocessing completed with XML structure preserved.")
+    except CompressorFallback:
+        preprocess_text_tree(input_file, output_file)
         print("Text preprocessing completed with XML structure preserved.")
     except ET.ParseError:
         # If XML parsing fails, process the text without preserving XML structure
-        processed_text = process_text(input_text)
-        with open(output_file, "w", encoding="utf-8") as out_file:
-            out_file.write(processed_text)
+        with open(output_file, "w", encoding="utf-8") as sink:
+            separator = ""
+            for rendered in iter_rendered(iter_compressed_plain_items(iter_text_chunks(input_file)),
+                                          render_compressed_plain, jobs):
+                if rendered:
+                    sink.write(separator + rendered)
+                    separator = " "
         print("XML parsing failed. Text preprocessing completed without XML structure.")
 
-def get_token_count(text, disallowed_special=[], chunk_size=1000):
-    enc = tiktoken.get_encoding("cl100k_base")
+_encoders = {}
 
-    # Remove XML tags
-    text_without_tags = re.sub(r'<[^>]+>', '', text)
+def get_encoder(encoding_name=TOKEN_ENCODING):
+    """Process-wide tiktoken encoder; loading the BPE ranks is far more expensive than encoding."""
+    encoder = _encoders.get(encoding_name)
+    if encoder is None:
+        import tiktoken
 
-    # Split the text into smaller chunks
-    chunks = [text_without_tags[i:i+chunk_size] for i in range(0, len(text_without_tags), chunk_size)]
-    total_tokens = 0
+        encoder = _encoders[encoding_name] = tiktoken.get_encoding(encoding_name)
+    return encoder
 
-    for chunk in chunks:
-        tokens = enc.encode(chunk, disallowed_special=disallowed_special)
-        total_tokens += len(tokens)
-    
-    return total_tokens
+TOKEN_SECTION_RE = re.compile(r'<(?:file name|page url)="([^"]*)"(?: duplicate_of="[^"]*")?>|</(?:file|page)>')
+TOKEN_TAG_RE = re.compile(r'<[^>]+>')
+# Positions no cl100k/o200k pre-tokenizer piece spans: between a non-space character
+# and a following space, or after a newline followed by a non-space character
+TOKEN_BOUNDARY_RE = re.compile(r'(?<=\S)(?= )|(?<=\n)(?=\S)')
+
+def split_sections(text):
+    """
+    Split onefilellm output into [(name, text), ...] at <file> and <page>
+    tags, with XML tags removed from the text. name is the file name or page
+    url, or None for the text between sections.
+    """
+    sections = []
+    name = None
+    position = 0
+    for match in TOKEN_SECTION_RE.finditer(text):
+        sections.append((name, TOKEN_TAG_RE.sub('', text[position:match.start()])))
+        name = html.unescape(match.group(1)) if match.group(1) is not None else None
+        position = match.end()
+    sections.append((name, TOKEN_TAG_RE.sub('', text[position:])))
+    return sections
+
+class TokenCounter:
+    """
+    Count tokens of onefilellm output, per <file> / <page> section and in total.
+
+    XML tags are not counted. Each section is cut into segments of about
+    TOKEN_SEGMENT_CHARS characters at positions where the tokenizer would
+    split anyway, so the segments encode to exactly as many tokens as the
+    whole section, and all segments of a document are encoded in one
+    multithreaded batch. With a `cache_path`, counts are stored in SQLite by
+    a hash of the section text, so unchanged files are not encoded again on
+    later runs.
+    """
+
+    def __init__(self, cache_path=None, encoding_name=TOKEN_ENCODING, num_threads=None):
+        self.encoding_name = encoding_name
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS token_counts (digest TEXT PRIMARY KEY, tokens INTEGER)")
+            self._db.commit()
+
+    def _digest(self, text):
+        return hashlib.sha1(f"{self.encoding_name}\0{text}".encode("utf-8", "surrogatepass")).hexdigest()
+
+    def _load(self, digests):
+        counts = {}
+        if self._db is None:
+            return counts
+        unique = list(set(digests))
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                counts.update(self._db.execute(
+                    f"SELECT digest, tokens FROM token_counts WHERE digest IN ({','.join('?' * len(batch))})", batch
+                ))
+        return counts
+
+    def _store(self, counts):
+        if self._db is None or not counts:
+            return
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO token_counts VALUES (?, ?)", counts.items())
+            self._db.commit()
+
+    def encode_lengths(self, texts):
+        """Token counts of `texts`, encoded as one batch of boundary-aligned segments."""
+        segments = []
+        owners = []
+        for index, text in enumerate(texts):
+            start = 0
+            while len(text) - start > TOKEN_SEGMENT_CHARS:
+                boundary = TOKEN_BOUNDARY_RE.search(text, start + TOKEN_SEGMENT_CHARS)
+                if boundary is None:
+                    break
+                segments.append(text[start:boundary.start()])
+                owners.append(index)
+                start = boundary.start()
+            segments.append(text[start:])
+            owners.append(index)
+
+        lengths = [0] * len(texts)
+        encoded = get_encoder(self.encoding_name).encode_ordinary_batch(segments, num_threads=self.num_threads)
+        for index, tokens in zip(owners, encoded):
+            lengths[index] += len(tokens)
+        return lengths
+
+    def count_texts(self, texts):
+        """Token counts of already tag-free `texts`, using and filling the count cache."""
+        digests = [self._digest(text) for text in texts] if self._db is not None else [None] * len(texts)
+        cached = self._load(digests) if self._db is not None else {}
+        missing = [index for index, text in enumerate(texts) if text and digests[index] not in cached]
+        lengths = dict(zip(missing, self.encode_lengths([texts[index] for index in missing]))) if missing else {}
+        if self._db is not None:
+            self._store({digests[index]: lengths[index] for index in missing})
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += sum(1 for text in texts if text) - len(missing)
+        return [lengths.get(index, cached.get(digests[index], 0)) for index in range(len(texts))]
+
+    def count_sections(self, text):
+        """
+        Return [(name, tokens), ...] in document order: one entry per <file>
+        (its name) or <page> (its url), and None entries for the text between
+        them.
+        """
+        sections = split_sections(text)
+        return list(zip([name for name, _ in sections], self.count_texts([body for _, body in sections])))
+
+    def count(self, text):
+        return sum(tokens for _, tokens in self.count_sections(text))
+
+class SectionTally:
+    """
+    Split onefilellm output written in pieces of any size into the sections
+    split_sections would find in the whole text, and count the bytes and
+    tokens of each. Finished sections are counted in batches while writing
+    continues; close() returns [(name, bytes, tokens), ...] in document order.
+    """
+
+    def __init__(self, counter=None):
+        self.counter = counter or TokenCounter()
+        self.name = None
+        self.carry = ""
+        self.pending = []
+        self.pending_chars = 0
+        self.sections = []
+
+    def write(self, text):
+        # Section tags contain no "<" of their own, so none can start before the last "<" already seen
+        start = self.carry.rfind("<")
+        if start < 0:
+            start = len(self.carry)
+        buffer = self.carry + text
+        position = 0
+        for match in TOKEN_SECTION_RE.finditer(buffer, start):
+            self._finish(self.name, buffer[position:match.start()])
+            self.name = html.unescape(match.group(1)) if match.group(1) is not None else None
+            position = match.end()
+        self.carry = buffer[position:]
+
+    def _finish(self, name, text):
+        body = TOKEN_TAG_RE.sub('', text)
+        self.pending.append((name, body))
+        self.pending_chars += len(body)
+        if self.pending_chars >= TOKEN_BATCH_CHARS:
+            self._count()
+
+    def _count(self):
+        counts = self.counter.count_texts([body for _, body in self.pending])
+        self.sections.extend((name, len(body.encode("utf-8")), tokens) for (name, body), tokens in zip(self.pending, counts))
+        self.pending = []
+        self.pending_chars = 0
+
+    def close(self):
+        self._finish(self.name, self.carry)
+        self.carry = ""
+        self._count()
+        return self.sections
+
+def get_token_count(text, counter=None):
+    """Number of tokens in `text`, ignoring XML tags. See TokenCounter."""
+    return (counter or TokenCounter()).count(text)
+
+class TokenBudget:
+    """
+    Choose which files to keep so a flattened source fits in `max_tokens`.
+
+    Files are costed with `counter` exactly as they will appear in the output
+    (tags are not counted, the newlines around each file are), then taken in
+    priority order while they fit; a file that does not fit is dropped and
+    the next, possibly smaller, one is tried. Priority compares the rules in
+    `order` one after the other:
+
+      include  files matching one of the `include` glob patterns first
+      type     extensions in PACK_TYPE_PRIORITY order, others last
+      depth    files closer to the root first
+      recent   most recently modified first (local files only)
+      small    cheapest first
+
+    Kept files stay in their original order; dropped ones are recorded in
+    `dropped` as (path, tokens).
+    """
+
+    def __init__(self, max_tokens, include=(), order=PACK_ORDER, counter=None):
+        unknown = set(order) - {"include", "type", "depth", "recent", "small"}
+        if unknown:
+            raise ValueError(f"Unknown pack order rule(s): {', '.join(sorted(unknown))}")
+        self.max_tokens = max_tokens
+        self.include = list(include)
+        self.order = list(order)
+        self.counter = counter or TokenCounter()
+        self.used = 0
+        self.dropped = []
+
+    def _rule(self, rule, path, mtime, cost):
+        if rule == "include":
+            return 0 if any(fnmatch.fnmatch(path, pattern) for pattern in self.include) else 1
+        if rule == "type":
+            extension = os.path.splitext(path)[1].lower()
+            return PACK_TYPE_PRIORITY.index(extension) if extension in PACK_TYPE_PRIORITY else len(PACK_TYPE_PRIORITY)
+        if rule == "depth":
+            return path.replace(os.sep, "/").count("/")
+        if rule == "recent":
+            return -(mtime or 0)
+        return cost
+
+    def select(self, files):
+        """Take (path, escaped body, mtime or None) triples and return the (path, body) pairs to emit."""
+        costs = self.counter.count_texts([f"\n{body}\n" for _, body, _ in files])
+        priority = sorted(range(len(files)), key=lambda index: [
+            self._rule(rule, files[index][0], files[index][2], costs[index]) for rule in self.order
+        ])
+
+        # One token for the newline after the source header, and one after each file
+        remaining = self.max_tokens - 1
+        kept = set()
+        for index in priority:
+            if costs[index] + 1 <= remaining:
+                kept.add(index)
+                remaining -= costs[index] + 1
+        self.used = self.max_tokens - remaining
+        self.dropped.extend((files[index][0], costs[index]) for index in range(len(files)) if index not in kept)
+        return [(path, body) for index, (path, body, _) in enumerate(files) if index in kept]
+
+def simhash(text, shingle_words=DEDUP_SHINGLE_WORDS):
+    """64-bit SimHash of the distinct `shingle_words`-word shingles of `text`."""
+    words = text.split()
+    shingles = {" ".join(words[i:i + shingle_words]) for i in range(max(len(words) - shingle_words + 1, 1))}
+    # Tally the byte values at each position of the hashes, then turn the tallies into votes per bit
+    histograms = [[0] * 256 for _ in range(8)]
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        for position in range(8):
+            histograms[position][digest[position]] += 1
+    counts = [0] * 64
+    for position, histogram in enumerate(histograms):
+        for byte, count in enumerate(histogram):
+            if count:
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        counts[(7 - position) * 8 + bit] += count
+    return sum(1 << bit for bit, count in enumerate(counts) if count * 2 > len(shingles))
+
+class Deduplicator:
+    """
+    Recognise bodies that were already written, so that later copies can be
+    replaced with a reference to the first (see duplicate_reference).
+
+    Bodies are keyed by the SHA-1 of their escaped text. With `near`, pages
+    of at least DEDUP_NEAR_MIN_WORDS words are also compared by SimHash, and
+    a page within `distance` bits of an earlier one counts as a copy too.
+    Fingerprints are indexed by `distance` + 1 bands of bits, one of which
+    must match exactly for pages that close, so a page is only compared
+    with likely candidates. Copies are recorded in `duplicates` as (name,
+    duplicate_of, bytes, tokens); tokens are only counted with a `counter`,
+    in batches, and are complete once `tokens_saved` has been read.
+    """
+
+    def __init__(self, near=False, distance=DEDUP_SIMHASH_DISTANCE, counter=None):
+        self.near = near
+        self.distance = distance
+        self.counter = counter
+        self.duplicates = []
+        self._digests = {}
+        self._bands = {}
+        self._uncounted = []  # (index in duplicates, text) waiting to be counted in a batch
+        self._uncounted_chars = 0
+
+    def check(self, name, body, page=False):
+        """Return the name of the earlier copy of `body` (a str or MappedText), or None and remember it."""
+        digest = hashlib.sha1()
+        size = 0
+        for chunk in body if isinstance(body, MappedText) else (body,):
+            data = chunk.encode("utf-8")
+            digest.update(data)
+            size += len(data)
+        original = self._digests.setdefault(digest.digest(), name)
+        if original == name and page and self.near:
+            original = self._near_original(name, str(body))
+        if original == name:
+            return None
+        self.duplicates.append((name, original, size, 0))
+        if self.counter is not None:
+            text = str(body)
+            self._uncounted.append((len(self.duplicates) - 1, text))
+            self._uncounted_chars += len(text)
+            if self._uncounted_chars >= TOKEN_BATCH_CHARS:
+                self._count()
+        return original
+
+    def _count(self):
+        counts = self.counter.count_texts([text for _, text in self._uncounted]) if self._uncounted else []
+        for (index, _), tokens in zip(self._uncounted, counts):
+            self.duplicates[index] = self.duplicates[index][:3] + (tokens,)
+        self._uncounted = []
+        self._uncounted_chars = 0
+
+    def _near_original(self, name, text):
+        if len(text.split()) < DEDUP_NEAR_MIN_WORDS:
+            return name
+        fingerprint = simhash(text)
+        width = 64 // (self.distance + 1)
+        bands = [(band, (fingerprint >> (band * width)) & ((1 << width) - 1)) for band in range(self.distance + 1)]
+        for band in bands:
+            for other, other_name in self._bands.get(band, ()):
+                if bin(fingerprint ^ other).count("1") <= self.distance:
+                    return other_name
+        for band in bands:
+            self._bands.setdefault(band, []).append((fingerprint, name))
+        return name
+
+    @property
+    def bytes_saved(self):
+        return sum(entry[2] for entry in self.duplicates)
+
+    @property
+    def tokens_saved(self):
+        self._count()
+        return sum(entry[3] for entry in self.duplicates)
+
+def duplicate_reference(tag, name, original):
+    """The <file> or <page> element written in place of a copy of `original`."""
+    attribute = "url" if tag == "page" else "name"
+    return f'<{tag} {attribute}="{escape_xml(name)}" duplicate_of="{escape_xml(original)}"></{tag}>'
+
+def iter_emitted_files(files, budget=None, dedup=None):
+    """
+    Take (path, escaped body, mtime or None) triples and yield the (path,
+    body, duplicate_of) triples to write, in order. With a TokenBudget only
+    the files it selects are yielded; with a Deduplicator, a copy of an
+    earlier body comes with body None and the path of the first copy.
+    """
+    if budget is None:
+        for path, body, _ in files:
+            original = dedup.check(path, body) if dedup is not None else None
+            yield path, None if original is not None else body, original
+        return
+
+    # Costing needs every file, so collect them and emit the selection afterwards.
+    # Copies are left out of the costing and kept as references when their original is
+    entries = []
+    collected = []
+    for path, body, mtime in files:
+        original = dedup.check(path, body) if dedup is not None else None
+        entries.append((path, original))
+        if original is None:
+            collected.append((path, str(body), mtime))
+    kept = dict(budget.select(collected))
+    for path, original in entries:
+        if original is None and path in kept:
+            yield path, kept[path], None
+        elif original is not None and original in kept:
+            yield path, None, original
+
+def manifest_directories(name):
+    """Every directory containing `name`, outermost first; for page urls the first one is the site."""
+    if "://" in name:
+        scheme, _, rest = name.partition("://")
+        host, _, path = rest.partition("/")
+        root = f"{scheme}://{host}"
+        parts = path.split("/")[:-1]
+        return [root] + [f"{root}/{'/'.join(parts[:depth])}" for depth in range(1, len(parts) + 1)]
+    parts = name.split("/")[:-1]
+    return ["/".join(parts[:depth]) for depth in range(1, len(parts) + 1)]
+
+def build_token_manifest(variants, counter=None):
+    """
+    Bytes and tokens per file, per directory and per extension for each
+    output variant, e.g. {"uncompressed": text, "compressed": text}. A
+    variant may also be given as the sections SectionTally.close() returned.
+
+    Files are listed in output order. A directory's figures include all of
+    its subdirectories, and directories and extensions are sorted by tokens
+    of the first variant, largest first. Text outside <file>/<page>
+    sections (source headers, PR descriptions, ...) only counts towards the
+    totals.
+    """
+    counter = counter or TokenCounter()
+    columns = [f"{variant}_{measure}" for variant in variants for measure in ("bytes", "tokens")]
+    files = {}
+    totals = {}
+    for variant, sections in variants.items():
+        if isinstance(sections, str):
+            tally = SectionTally(counter)
+            tally.write(sections)
+            sections = tally.close()
+        total_bytes = total_tokens = 0
+        for name, size, tokens in sections:
+            total_bytes += size
+            total_tokens += tokens
+            if name is not None:
+                row = files.setdefault(name, dict({"name": name}, **dict.fromkeys(columns, 0)))
+                row[f"{variant}_bytes"] += size
+                row[f"{variant}_tokens"] += tokens
+        totals[variant] = {"bytes": total_bytes, "tokens": total_tokens}
+
+    def roll_up(key, keys_of):
+        groups = {}
+        for row in files.values():
+            for group in keys_of(row["name"]):
+                total = groups.setdefault(group, dict({key: group, "files": 0}, **dict.fromkeys(columns, 0)))
+                total["files"] += 1
+                for column in columns:
+                    total[column] += row[column]
+        return sorted(groups.values(), key=lambda total: -total[columns[1]])
+
+    def extension(name):
+        return [os.path.splitext(name.rsplit("/", 1)[-1])[1].lower() or "(none)"]
+
+    return {
+        "encoding": counter.encoding_name,
+        "totals": totals,
+        "files": list(files.values()),
+        "directories": roll_up("directory", manifest_directories),
+        "extensions": roll_up("extension", extension),
+    }
+
+def write_token_manifest(manifest, json_path=None, csv_path=None):
+    """Write a manifest from build_token_manifest as JSON and/or as one flat CSV table."""
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(manifest, indent=2))
+    if csv_path:
+        variants = list(manifest["totals"])
+        columns = [f"{variant}_{measure}" for variant in variants for measure in ("bytes", "tokens")]
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["kind", "name", "files"] + columns)
+            writer.writerow(["total", "", len(manifest["files"])] +
+                            [manifest["totals"][variant][measure] for variant in variants for measure in ("bytes", "tokens")])
+            for kind, key, rows in (("directory", "directory", manifest["directories"]),
+                                    ("extension", "extension", manifest["extensions"]),
+                                    ("file", "name", manifest["files"])):
+                for row in rows:
+                    writer.writerow([kind, row[key], row.get("files", 1)] + [row[column] for column in columns])
+
+class OutputPipeline:
+    """
+    Text sink that produces every output artifact in a single pass.
+
+    Everything written is saved to `output_file` and, in chunks, fanned out
+    to two background stages: one compresses it straight into
+    `compressed_file` (see preprocess_text) and counts the compressed
+    sections, the other counts the uncompressed sections. Once close() has
+    returned, both files are complete and `sections` holds the counts for
+    build_token_manifest, without reading either file back. Output that the
+    streaming compressor cannot handle (malformed or namespaced XML) is
+    compressed from `output_file` by preprocess_text after writing ends.
+    """
+
+    def __init__(self, output_file, compressed_file, counter=None, jobs=1):
+        self.output_file = output_file
+        self.compressed_file = compressed_file
+        self.counter = counter or TokenCounter()
+        self.jobs = jobs
+        self.sections = {"uncompressed": None, "compressed": None}
+        self.fallback = False
+        self.closed = False
+        self._buffer = []
+        self._buffered = 0
+        self._errors = []
+        self._file = open(output_file, "w", encoding="utf-8")
+        self._queues = [queue.Queue(maxsize=PIPELINE_QUEUE_CHUNKS) for _ in range(2)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(self._count_uncompressed, self._queues[0]), daemon=True),
+            threading.Thread(target=self._run, args=(self._compress, self._queues[1]), daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.closed:
+            self.close(abort=exc_type is not None)
+
+    def write(self, text):
+        if text:
+            self._buffer.append(text)
+            self._buffered += len(text)
+            if self._buffered >= PIPELINE_CHUNK_CHARS:
+                self.flush()
+
+    def flush(self):
+        chunk = "".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if chunk:
+            self._file.write(chunk)
+            for stage_queue in self._queues:
+                stage_queue.put(chunk)
+
+    @staticmethod
+    def _chunks(stage_queue):
+        while True:
+            chunk = stage_queue.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    def _run(self, stage, stage_queue):
+        chunks = self._chunks(stage_queue)
+        try:
+            stage(chunks)
+        except BaseException as e:
+            self._errors.append(e)
+        # Keep taking chunks if the stage stopped early, so writers never block on a full queue
+        for _ in chunks:
+            pass
+
+    def _count_uncompressed(self, chunks):
+        tally = SectionTally(self.counter)
+        for chunk in chunks:
+            tally.write(chunk)
+        self.sections["uncompressed"] = tally.close()
+
+    def _compress(self, chunks):
+        tally = SectionTally(self.counter)
+        try:
+            # Opened the way ElementTree.write opens a file name
+            with open(self.compressed_file, "w", encoding="utf-8", errors="xmlcharrefreplace") as sink:
+                declaration = "<?xml version='1.0' encoding='utf-8'?>\n"
+                sink.write(declaration)
+                tally.write(declaration)
+                for rendered in iter_rendered(iter_compressed_xml_items(chunks), render_compressed, self.jobs):
+                    sink.write(rendered)
+                    tally.write(rendered)
+        except (CompressorFallback, ET.ParseError):
+            self.fallback = True
+            return
+        self.sections["compressed"] = tally.close()
+
+    def close(self, abort=False):
+        """Finish both stages and the files; with `abort`, skip the compression fallback."""
+        self.closed = True
+        try:
+            self.flush()
+        finally:
+            for stage_queue in self._queues:
+                stage_queue.put(None)
+            for thread in self._threads:
+                thread.join()
+            self._file.close()
+        if self._errors:
+            raise self._errors[0]
+        if abort:
+            return
+        logging.info(f"Wrote uncompressed output to {self.output_file}")
+        if self.fallback:
+            preprocess_text(self.output_file, self.compressed_file, self.jobs)
+            tally = SectionTally(self.counter)
+            for chunk in iter_text_chunks(self.compressed_file):
+                tally.write(chunk)
+            self.sections["compressed"] = tally.close()
+        else:
+            print("Text preprocessing completed with XML structure preserved.")
+
+def count_fragments(fragments, counter):
+    """Sections of each output fragment as SectionTally.close() returns them, counted in one batch."""
+    split = [split_sections(fragment) for fragment in fragments]
+    counts = iter(counter.count_texts([body for sections in split for _, body in sections]))
+    return [[(name, len(body.encode("utf-8")), next(counts)) for name, body in sections] for sections in split]
+
+def compress_fragment(fragment):
+    """Compressed rendering of one well-formed XML fragment, as preprocess_text writes it inside a document."""
+    return render_compressed(list(iter_compressed_xml_items([fragment])))
+
+class LocalFolderOutput:
+    """
+    The flattened output of a local folder, kept in memory one <file> at a
+    time so that changed files can be patched in.
+
+    Every file keeps its uncompressed fragment, its compressed rendering and
+    the sections counted from both. update() re-reads only the files it is
+    given (walking the tree again only when files appeared or disappeared),
+    and write() assembles both outputs and the token manifest from the kept
+    pieces. The results are identical to a full run through OutputPipeline.
+    """
+
+    def __init__(self, local_path, counter=None, jobs=1, path_filter=None, max_file_bytes=LOCAL_MAX_FILE_BYTES):
+        self.local_path = local_path
+        self.counter = counter or TokenCounter()
+        self.jobs = jobs
+        self.path_filter = path_filter or PathFilter(local_path)
+        self.max_file_bytes = max_file_bytes
+        self.order = []
+        self.files = {}  # relative path: (fragment, compressed or None, uncompressed sections, compressed sections)
+        self.header = f'<source type="local_directory" path="{escape_xml(local_path)}">'
+        self.newline_tokens = self.counter.count_texts(["\n"])[0]
+        try:
+            rendered = compress_fragment(self.header + "<f/></source>")
+            self.compressed_open, self.compressed_close = rendered.split("<f />")
+            self.compressed_empty = compress_fragment(self.header + "\n</source>")
+        except (CompressorFallback, ET.ParseError):
+            self.compressed_open = None
+
+    def _read(self, files):
+        fragments = {}
+        limits = LocalFileLimits(self.max_file_bytes)
+        for file_path, relative_path, body, _, error in iter_read_local_files(limits.apply(files), self.jobs, limits=limits):
+            if error is not None:
+                logging.error(f"Error processing file {os.path.basename(file_path)}: {error}")
+                continue
+            fragments[relative_path] = f'<file name="{escape_xml(relative_path)}">\n{body}\n</file>'
+        compressed = []
+        for fragment in fragments.values():
+            try:
+                compressed.append(compress_fragment(fragment))
+            except (CompressorFallback, ET.ParseError):
+                compressed.append(None)
+        counted = count_fragments(list(fragments.values()) + [text or "" for text in compressed], self.counter)
+        for index, (relative_path, fragment) in enumerate(fragments.items()):
+            self.files[relative_path] = (fragment, compressed[index], counted[index], counted[len(fragments) + index])
+        return set(fragments)
+
+    def update(self, changed=None):
+        """
+        Apply changes to the relative paths in `changed` (files, or
+        directories ending in os.sep), or rescan everything when it is None.
+        Returns the number of files read.
+        """
+        # A changed ignore file can add or drop any file, so the rules are re-read and the tree walked
+        rules_changed = changed is not None and any(
+            os.path.basename(path) == ".gitignore" or path in self.path_filter.sources for path in changed
+        )
+        if rules_changed:
+            self.path_filter.reset()
+        # New files and directory changes need a walk to find their place in the output
+        walk = changed is None or rules_changed or any(
+            path.endswith(os.sep) or (path not in self.files and os.path.isfile(os.path.join(self.local_path, path)))
+            for path in changed
+        )
+        if walk:
+            files = list(iter_local_folder_files(self.local_path, self.path_filter))
+            self.order = [relative_path for _, relative_path in files]
+            for relative_path in set(self.files) - set(self.order):
+                del self.files[relative_path]
+            stale = [(file_path, relative_path) for file_path, relative_path in files
+                     if changed is None or relative_path in changed or relative_path not in self.files]
+        else:
+            deleted = {path for path in changed if path in self.files and not os.path.isfile(os.path.join(self.local_path, path))}
+            self.order = [path for path in self.order if path not in deleted]
+            for path in deleted:
+                del self.files[path]
+            stale = [(os.path.join(self.local_path, path), path) for path in self.order if path in changed]
+        read = self._read(stale)
+        # Files that could not be read are left out, like in a full run
+        for _, relative_path in stale:
+            if relative_path not in read:
+                self.files.pop(relative_path, None)
+        return len(read)
+
+    def write(self, output_file, compressed_file, manifest_json_file=None, manifest_csv_file=None):
+        """Write both outputs (each replaced atomically) and the token manifest; returns the manifest."""
+        entries = [self.files[path] for path in self.order if path in self.files]
+        replace_file(output_file, "\n".join([self.header] + [entry[0] for entry in entries] + ["</source>"]))
+        glue = [(None, 1, self.newline_tokens)]
+        uncompressed = glue * (len(entries) + 1) + [section for entry in entries for section in entry[2]]
+
+        if self.compressed_open is not None and all(entry[1] is not None for entry in entries):
+            declaration = "<?xml version='1.0' encoding='utf-8'?>\n"
+            if entries:
+                text = self.compressed_open + "".join(entry[1] for entry in entries) + self.compressed_close
+            else:
+                text = self.compressed_empty
+            replace_file(compressed_file, declaration + text, errors="xmlcharrefreplace")
+            compressed = glue + [section for entry in entries for section in entry[3]]
+        else:
+            # Output the streaming compressor cannot keep as XML is compressed from the written file
+            preprocess_text(output_file, compressed_file, self.jobs)
+            tally = SectionTally(self.counter)
+            for chunk in iter_text_chunks(compressed_file):
+                tally.write(chunk)
+            compressed = tally.close()
+
+        manifest = build_token_manifest({"uncompressed": uncompressed, "compressed": compressed}, self.counter)
+        write_token_manifest(manifest, manifest_json_file, manifest_csv_file)
+        return manifest
+
+def replace_file(path, text, errors="strict"):
+    """Write `text` to `path` through a temporary file, so readers never see a partial file."""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8", errors=errors) as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+def is_watched_path(relative_path, is_directory=False, path_filter=None):
+    """Whether a change at `relative_path` can affect the output of a local folder."""
+    return (path_filter or PathFilter()).keep_path(relative_path, is_directory)
+
+class FolderWatcher:
+    """
+    Report changes below a local folder in bursts.
+
+    On Linux, inotify watches every directory `path_filter` keeps, so
+    events from node_modules, .git, ignored build trees and the like are
+    never even delivered; elsewhere, or when inotify is unavailable or out
+    of watches, the folder is scanned every WATCH_POLL_INTERVAL seconds
+    instead. Changed .gitignore files are reported too, as they change
+    which files belong to the output. wait() blocks until something
+    changes and returns once WATCH_DEBOUNCE seconds pass without further
+    events.
+    """
+
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+    IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+    IN_Q_OVERFLOW, IN_IGNORED, IN_ONLYDIR, IN_ISDIR = 0x4000, 0x8000, 0x01000000, 0x40000000
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, local_path, use_inotify=True, path_filter=None):
+        self.local_path = local_path
+        self.path_filter = path_filter or PathFilter(local_path)
+        self._fd = None
+        self._directories = {}  # inotify watch descriptor: relative directory path
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._start_inotify()
+            except OSError as e:
+                logging.warning(f"inotify unavailable, polling instead: {e}")
+                self.close()
+        if self._fd is None:
+            self._snapshot = self._scan()
+
+    @property
+    def backend(self):
+        return "inotify" if self._fd is not None else "polling"
+
+    def _start_inotify(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            self._fd = None
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self._watch_tree("")
+
+    def _watch_tree(self, relative_directory):
+        """Watch a directory and every directory below it."""
+        for root, dirs, files in os.walk(os.path.join(self.local_path, relative_directory)):
+            relative_root = os.path.relpath(root, self.local_path)
+            relative_root = "" if relative_root == "." else relative_root
+            directory = relative_root.replace(os.sep, "/")
+            self.path_filter.load(directory, ".gitignore" in files)
+            dirs[:] = [d for d in dirs if self.path_filter.keep(directory, d, is_directory=True)]
+            mask = (self.IN_MODIFY | self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO
+                    | self.IN_CREATE | self.IN_DELETE | self.IN_ONLYDIR)
+            descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(root), mask)
+            if descriptor < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOENT:
+                    continue
+                raise OSError(error, os.strerror(error))
+            self._directories[descriptor] = relative_root
+
+    def _scan(self):
+        # A fresh filter each time, so edited ignore files take effect and are reported
+        path_filter = PathFilter(self.local_path, self.path_filter.exclude, self.path_filter.gitignore)
+        files = list(iter_local_folder_files(self.local_path, path_filter))
+        files.extend((os.path.join(self.local_path, path), path) for path in path_filter.sources)
+        snapshot = {}
+        for file_path, relative_path in files:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            snapshot[relative_path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def _read_events(self):
+        """Changed paths from the events queued so far; None after an overflow."""
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, _, length = self.EVENT.unpack_from(data, offset)
+                name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b"\0")
+                offset += self.EVENT.size + length
+                if mask & self.IN_Q_OVERFLOW:
+                    changed = None
+                    continue
+                if mask & self.IN_IGNORED:
+                    self._directories.pop(descriptor, None)
+                    continue
+                directory = self._directories.get(descriptor)
+                if directory is None or changed is None:
+                    continue
+                relative_path = os.path.join(directory, os.fsdecode(name))
+                if mask & self.IN_ISDIR:
+                    if not is_watched_path(relative_path, is_directory=True, path_filter=self.path_filter):
+                        continue
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        try:
+                            self._watch_tree(relative_path)
+                        except OSError:
+                            changed = None
+                            continue
+                    changed.add(relative_path + os.sep)
+                elif name == b".gitignore" and self.path_filter.gitignore:
+                    # Forget the old rules and watch the directories they no longer ignore
+                    self.path_filter.reset()
+                    try:
+                        self._watch_tree(directory)
+                    except OSError:
+                        changed = None
+                        continue
+                    changed.add(relative_path)
+                elif is_watched_path(relative_path, path_filter=self.path_filter):
+                    changed.add(relative_path)
+
+    def _poll(self):
+        snapshot = self._scan()
+        changed = {path for path in snapshot.keys() | self._snapshot.keys() if snapshot.get(path) != self._snapshot.get(path)}
+        self._snapshot = snapshot
+        return changed
+
+    def wait(self, timeout=None):
+        """
+        Return the changed relative paths (directories end in os.sep), None
+        when everything has to be rescanned, or an empty set after `timeout`
+        seconds without changes.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self._fd is None:
+            while True:
+                changed = self._poll()
+                if changed:
+                    return changed
+                if deadline is not None and time.monotonic() >= deadline:
+                    return set()
+                time.sleep(WATCH_POLL_INTERVAL if deadline is None else
+                           max(0, min(WATCH_POLL_INTERVAL, deadline - time.monotonic())))
+
+        changed = set()
+        waiting = None if deadline is None else max(0, deadline - time.monotonic())
+        first_event = None
+        while True:
+            ready, _, _ = select.select([self._fd], [], [], waiting)
+            if not ready:
+                if changed or changed is None or deadline is not None:
+                    return changed
+                continue
+            events = self._read_events()
+            changed = None if events is None or changed is None else changed | events
+            if changed == set():
+                # Only ignored paths changed; keep waiting for the original deadline
+                waiting = None if deadline is None else max(0, deadline - time.monotonic())
+                continue
+            # A file that keeps changing must not hold back the update forever
+            first_event = first_event or time.monotonic()
+            waiting = max(0, min(WATCH_DEBOUNCE, first_event + 10 * WATCH_DEBOUNCE - time.monotonic()))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+def watch_local_folder(local_path, output_file, compressed_file, manifest_json_file=None, manifest_csv_file=None,
+                       counter=None, jobs=1, console=None, watcher=None, max_updates=None, path_filter=None,
+                       max_file_bytes=LOCAL_MAX_FILE_BYTES):
+    """
+    Write the outputs of `local_path`, then keep them up to date as files
+    change until interrupted (or after `max_updates` bursts of changes).
+    """
+    if console is None:
+        from rich.console import Console
+
+        console = Console()
+    path_filter = path_filter or PathFilter(local_path)
+    output = LocalFolderOutput(local_path, counter, jobs, path_filter, max_file_bytes)
+    output.update()
+    manifest = output.write(output_file, compressed_file, manifest_json_file, manifest_csv_file)
+    watcher = watcher or FolderWatcher(local_path, path_filter=path_filter)
+    console.print(f"\n[bright_green]Watching[/bright_green] [bold bright_yellow]{local_path}[/bold bright_yellow] "
+                  f"({watcher.backend}): [bold bright_cyan]{manifest['totals']['uncompressed']['tokens']}[/bold bright_cyan] tokens, "
+                  f"[bold bright_cyan]{manifest['totals']['compressed']['tokens']}[/bold bright_cyan] compressed. Press Ctrl+C to stop.")
+    updates = 0
+    try:
+        while max_updates is None or updates < max_updates:
+            changed = watcher.wait()
+            if changed == set():
+                continue
+            start = time.perf_counter()
+            read = output.update(changed)
+            manifest = output.write(output_file, compressed_file, manifest_json_file, manifest_csv_file)
+            updates += 1
+            console.print(f"[bright_green]Updated[/bright_green] {read} files in {time.perf_counter() - start:.2f}s: "
+                          f"[bold bright_cyan]{manifest['totals']['uncompressed']['tokens']}[/bold bright_cyan] tokens, "
+                          f"[bold bright_cyan]{manifest['totals']['compressed']['tokens']}[/bold bright_cyan] compressed")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return manifest
 
 def is_same_domain(base_url, new_url):
     return urlparse(base_url).netloc == urlparse(new_url).netloc
@@ -387,66 +2684,415 @@ def is_within_depth(base_url, current_url, max_depth):
 
     return len(current_parts) - len(base_parts) <= max_depth
 
-def process_pdf(url):
-    response = requests.get(url)
+def extract_pdf_text(data, jobs=None):
+    return ' '.join(iter_pdf_pages(data, jobs))
+
+def process_pdf(url, jobs=None):
+    response = http_get(url)
     response.raise_for_status()
+    return extract_pdf_text(response.content, jobs)
+
+HTML_SKIPPED_TAGS = frozenset(['script', 'style', 'head', 'title', 'meta'])
+HTML_TEXTLESS_TAGS = frozenset(['template', 'rt', 'rp'])  # BeautifulSoup leaves their strings out of get_text()
+
+def extract_html_beautifulsoup(content):
+    """Reference extractor: BeautifulSoup with the pure-Python html.parser."""
+    from bs4 import BeautifulSoup, Comment
+
+    soup = BeautifulSoup(content, 'html.parser')
+    for element in soup(['script', 'style', 'head', 'title', 'meta', '[document]']):
+        element.decompose()
+    comments = soup.find_all(string=lambda text: isinstance(text, Comment))
+    for comment in comments:
+        comment.extract()
+    text = soup.get_text(separator='\n', strip=True)
+    links = [link['href'] for link in soup.find_all('a', href=True)]
+    return text, links
+
+def decode_html(content):
+    """
+    Decode page bytes the way BeautifulSoup would: byte-order mark, then a
+    declared charset, then utf-8. Anything else is left to UnicodeDammit.
+    """
+    from bs4.dammit import EncodingDetector, UnicodeDammit
 
-    with open('temp.pdf', 'wb') as pdf_file:
-        pdf_file.write(response.content)
+    data, bom_encoding = EncodingDetector.strip_byte_order_mark(content)
+    for encoding in (bom_encoding, EncodingDetector.find_declared_encoding(data, is_html=True), 'utf-8'):
+        if encoding:
+            try:
+                return data.decode(encoding)
+            except (LookupError, UnicodeDecodeError):
+                pass
+    return UnicodeDammit(content, is_html=True).unicode_markup
 
-    text = []
-    with open('temp.pdf', 'rb') as pdf_file:
-        pdf_reader = PdfReader(pdf_file)
-        for page in range(len(pdf_reader.pages)):
-            text.append(pdf_reader.pages[page].extract_text())
+def extract_html_lxml(content):
+    """
+    Text and links like extract_html_beautifulsoup, using libxml2's HTML
+    parser. Text nodes are collected in document order, skipping the subtrees
+    of HTML_SKIPPED_TAGS, comments and processing instructions but keeping
+    the text that follows them as separate strings, as BeautifulSoup does.
+    Links inside HTML_TEXTLESS_TAGS still count, only their text is left out.
+
+    Ordinary pages give the same result, but the two parsers read some input
+    differently: libxml2 turns CR and CRLF into LF and NUL into U+FFFD,
+    reads an unknown entity such as "&notanentity;" as its longest known
+    prefix ("&not"), and keeps the contents of textarea, xmp, plaintext, iframe and noembed
+    as literal text where html.parser parses the markup inside them.
+    """
+    from lxml import etree
+
+    if isinstance(content, bytes):
+        content = decode_html(content)
+    root = etree.fromstring(content.encode('utf-8'), etree.HTMLParser(encoding='utf-8'))
+    if root is None:
+        return '', []
+
+    strings = []
+    links = []
+
+    def add(string):
+        if string:
+            string = string.strip()
+            if string:
+                strings.append(string)
+
+    add(root.text)
+    # Iterative walk; each stack entry holds a children iterator, whether text
+    # inside it is left out, and the tail to add once the children are exhausted
+    stack = [(iter(root), False, None)]
+    while stack:
+        children, textless, tail = stack[-1]
+        element = next(children, None)
+        if element is None:
+            stack.pop()
+            add(tail)
+        elif isinstance(element.tag, str) and element.tag not in HTML_SKIPPED_TAGS:
+            if element.tag == 'a':
+                href = element.get('href')
+                if href is not None:
+                    links.append(href)
+            child_textless = textless or element.tag in HTML_TEXTLESS_TAGS
+            if not child_textless:
+                add(element.text)
+            stack.append((iter(element), child_textless, None if textless else element.tail))
+        elif not textless:
+            if element.tag is etree.Comment and element.text and element.text.startswith('[CDATA[') and element.text.endswith(']]'):
+                add(element.text[7:-2])  # libxml2 keeps CDATA sections as comments; BeautifulSoup keeps their text
+            add(element.tail)
+    return '\n'.join(strings), links
+
+HTML_EXTRACTORS = {
+    "lxml": extract_html_lxml,
+    "beautifulsoup": extract_html_beautifulsoup,
+}
+
+def parse_html(content, extractor=None):
+    """
+    Return (text, hrefs) for an HTML page: the visible text, and the raw href
+    of every link in document order. Depends only on the page bytes, so the
+    crawler can run it in worker processes. `extractor` names one of
+    HTML_EXTRACTORS (default HTML_EXTRACTOR); see extract_html_lxml for how
+    their text can differ.
+    """
+    return HTML_EXTRACTORS[extractor or HTML_EXTRACTOR](content)
 
-    os.remove('temp.pdf')
-    return ' '.join(text)
+def fetch_page(url):
+    return http_get(url, get_session(authenticated=False), timeout=CRAWL_TIMEOUT)
+
+class CrawlFrontier:
+    """
+    Breadth-first crawl queue with enqueue-time deduplication, optionally
+    checkpointed to SQLite so an interrupted crawl can resume where it stopped.
+
+    Every URL is queued at most once (`seen` covers queued, done and failed
+    URLs), so link-dense sites do not pile duplicates into the queue. With a
+    `path`, each committed page is written in one transaction together with
+    the links it added to the queue, and reopening the same file restores the
+    queue, the seen set and the text of the pages already committed.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.pending = deque()
+        self.seen = set()
+        self.committed = []  # (url, text) of pages committed by a previous run, in crawl order
+        self._added = []
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS frontier ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT UNIQUE, depth INTEGER, status TEXT, text TEXT)"
+            )
+            self._db.commit()
+            for url, depth, status, text in self._db.execute("SELECT url, depth, status, text FROM frontier ORDER BY seq"):
+                self.seen.add(url)
+                if status == "pending":
+                    self.pending.append((url, depth))
+                elif status == "done":
+                    self.committed.append((url, text))
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, url, depth):
+        """Queue url unless it was seen before; returns whether it was queued."""
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        self.pending.append((url, depth))
+        self._added.append((url, depth))
+        return True
+
+    def peek(self, index):
+        return self.pending[index]
+
+    def pop(self):
+        return self.pending.popleft()
+
+    def commit(self, url, text):
+        """Record url as done with its extracted text (None if it failed), plus everything queued since the last commit."""
+        added, self._added = self._added, []
+        if self._db is None:
+            return
+        with self._db:
+            self._db.executemany("INSERT INTO frontier (url, depth, status) VALUES (?, ?, 'pending')", added)
+            self._db.execute("UPDATE frontier SET status = ?, text = ? WHERE url = ?",
+                             ("failed" if text is None else "done", text, url))
+
+    def close(self, finished=False):
+        """Close the checkpoint; a finished crawl deletes it so the next run starts over."""
+        if self._db is None:
+            return
+        self._db.close()
+        self._db = None
+        if finished:
+            os.remove(self.path)
+
+class BoilerplateFilter:
+    """
+    Learn the lines a crawl repeats from page to page (navigation sidebars,
+    headers, footers) and strip them from its pages.
+
+    Pages are added as they are extracted, and only the number of pages
+    each distinct line appeared on is kept, by hash. Once the crawl is done,
+    a line is boilerplate if it appeared on BOILERPLATE_MIN_PAGES pages and
+    BOILERPLATE_MIN_FRACTION of all pages. strip() drops runs of boilerplate
+    lines at the start or end of a page and, inside it, runs of at least
+    BOILERPLATE_MIN_RUN lines, so that a lone repeated heading ("Parameters")
+    stays. The first page a line was dropped from keeps it, so the
+    navigation still appears once. Pages must be stripped in crawl order.
+    """
+
+    def __init__(self, counter=None):
+        self.counter = counter
+        self.pages = 0
+        self.chars_before = 0
+        self.chars_after = 0
+        self._tokens = [0, 0]
+        self._uncounted = []  # Pages before and after stripping, counted in batches
+        self._uncounted_chars = 0
+        self._counts = {}
+        self._kept = set()
+
+    def add(self, text):
+        self.pages += 1
+        for key in {hash(line) for line in text.split("\n") if line.strip()}:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def _is_boilerplate(self, line):
+        count = self._counts.get(hash(line), 0) if line.strip() else 0
+        return count >= BOILERPLATE_MIN_PAGES and count >= self.pages * BOILERPLATE_MIN_FRACTION
+
+    def strip(self, text):
+        """Return `text` (a page added earlier) without its boilerplate lines."""
+        lines = text.split("\n")
+        boilerplate = [self._is_boilerplate(line) for line in lines]
+        kept = []
+        start = 0
+        while start < len(lines):
+            end = start + 1
+            while end < len(lines) and boilerplate[end] == boilerplate[start]:
+                end += 1
+            run = lines[start:end]
+            if boilerplate[start] and (end - start >= BOILERPLATE_MIN_RUN or start == 0 or end == len(lines)):
+                run = [line for line in run if hash(line) not in self._kept]
+                self._kept.update(hash(line) for line in run)
+            kept.extend(run)
+            start = end
+        stripped = "\n".join(kept)
+        self.chars_before += len(text)
+        self.chars_after += len(stripped)
+        if self.counter is not None:
+            self._uncounted += [text, stripped]
+            self._uncounted_chars += len(text) + len(stripped)
+            if self._uncounted_chars >= TOKEN_BATCH_CHARS:
+                self._count()
+        return stripped
+
+    def _count(self):
+        counts = self.counter.count_texts(self._uncounted) if self._uncounted else []
+        self._tokens[0] += sum(counts[0::2])
+        self._tokens[1] += sum(counts[1::2])
+        self._uncounted = []
+        self._uncounted_chars = 0
+
+    @property
+    def tokens_before(self):
+        """Tokens of the pages stripped so far, before stripping (with a `counter`)."""
+        self._count()
+        return self._tokens[0]
+
+    @property
+    def tokens_after(self):
+        self._count()
+        return self._tokens[1]
+
+def crawl_state_path(base_url, max_depth, include_pdfs, ignore_epubs, cache_dir=CACHE_DIR):
+    """Checkpoint file for a crawl; the same crawl settings always map to the same file."""
+    key = hashlib.sha1(f"{base_url}\0{max_depth}\0{include_pdfs}\0{ignore_epubs}".encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, "crawls", f"{key}.sqlite")
+
+async def crawl_async(base_url, max_depth, include_pdfs, ignore_epubs,
+                      concurrency=CRAWL_CONCURRENCY, per_host_limit=CRAWL_PER_HOST_LIMIT, parse_workers=None,
+                      state_path=None, html_extractor=None, dedup=None, boilerplate=None):
+    """
+    Breadth-first crawl that keeps up to `concurrency` requests in flight (at
+    most `per_host_limit` per host) while producing pages in exactly the order
+    a one-page-at-a-time crawl would.
+
+    Pages at the head of the frontier are fetched as soon as a slot is free,
+    but committed strictly in queue order: only when page N is committed are
+    its links added to the frontier. The frontier therefore grows in the same
+    discovery order as a sequential crawl, whatever order responses arrive in.
+    Requests run on a thread pool and HTML parsing on a process pool, so the
+    event loop only schedules work.
+
+    With a `state_path`, progress is checkpointed after every page (see
+    CrawlFrontier). Running the same crawl again after an interruption
+    replays the pages already done and continues with the rest of the queue,
+    producing the same result as an uninterrupted crawl. `html_extractor`
+    picks the HTML backend (see parse_html). With a Deduplicator, a page
+    whose text was already written becomes a reference to the first copy.
+    With a BoilerplateFilter, pages are written once the crawl is done,
+    without the lines it learned they repeat.
+    """
+    import asyncio
+    import requests
+
+    loop = asyncio.get_running_loop()
+    extractor = html_extractor or HTML_EXTRACTOR
+    if parse_workers is None:
+        parse_workers = min(os.cpu_count() or 1, 4) if concurrency > 1 else 1
+
+    global_limit = asyncio.Semaphore(concurrency)
+    host_limits = {}
+    # Only the head of the frontier is scheduled, so queued URLs cost a tuple each rather than a task
+    window = concurrency * 4
+
+    async def crawl_page(url):
+        host_limit = host_limits.setdefault(urlparse(url).netloc, asyncio.Semaphore(per_host_limit))
+        async with host_limit, global_limit:
+            response = await loop.run_in_executor(fetch_executor, fetch_page, url)
+            clean_url = url.split('#')[0]
+
+            # A page revalidated from the HTTP cache reuses the extraction stored with it
+            extracted = http_cache.load_extracted(clean_url, extractor) if getattr(response, "from_cache", False) else None
+            if extracted is not None:
+                return extracted["text"], extracted["links"]
+
+            if clean_url.endswith('.pdf') and include_pdfs:
+                # Already downloaded; pages of concurrent PDFs are spread over the parse workers
+                text, links = await loop.run_in_executor(parse_executor, extract_pdf_text, response.content, 1), []
+            else:
+                text, links = await loop.run_in_executor(parse_executor, parse_html, response.content, extractor)
+
+            if http_cache is not None:
+                http_cache.store_extracted(clean_url, {"text": text, "links": links}, extractor)
+            return text, links
 
-def crawl_and_extract_text(base_url, max_depth, include_pdfs, ignore_epubs):
-    visited_urls = set()
-    urls_to_visit = [(base_url, 0)]
     processed_urls = []
     all_text = [f'<source type="web_documentation" url="{escape_xml(base_url)}">']
 
-    while urls_to_visit:
-        current_url, current_depth = urls_to_visit.pop(0)
-        clean_url = current_url.split('#')[0]
+    pages = []  # (url, text) held back until the boilerplate is known
 
-        if clean_url not in visited_urls and is_same_domain(base_url, clean_url) and is_within_depth(base_url, clean_url, max_depth):
-            if ignore_epubs and clean_url.endswith('.epub'):
-                continue
+    def add_page(url, text):
+        processed_urls.append(url)
+        if boilerplate is not None:
+            boilerplate.add(text)
+            pages.append((url, text))
+        else:
+            write_page(url, text)
 
-            try:
-                response = requests.get(current_url)
-                soup = BeautifulSoup(response.content, 'html.parser')
-                visited_urls.add(clean_url)
+    def write_page(url, text):
+        body = escape_xml(text)
+        original = dedup.check(url, body, page=True) if dedup is not None else None
+        if original is not None:
+            all_text.append(duplicate_reference("page", url, original))
+        else:
+            all_text.append(f'<page url="{escape_xml(url)}">')
+            all_text.append(body)
+            all_text.append('</page>')
+
+    frontier = CrawlFrontier(state_path)
+    if frontier.committed or frontier.pending:
+        print(f"Resuming crawl: {len(frontier.committed)} pages already done, {len(frontier)} queued")
+    for url, text in frontier.committed:
+        add_page(url, text)
+
+    clean_base_url = base_url.split('#')[0]
+    if not (ignore_epubs and clean_base_url.endswith('.epub')) and clean_base_url not in frontier.seen:
+        frontier.add(clean_base_url, 0)
+
+    fetch_executor = ThreadPoolExecutor(max_workers=concurrency)
+    parse_executor = fetch_executor
+    if parse_workers > 1 and frontier:
+        # Start the worker processes before any fetch thread exists, so they are not forked mid-request
+        parse_executor = ProcessPoolExecutor(max_workers=parse_workers)
+        parse_executor.submit(int).result()
+    tasks = deque()
 
-                if clean_url.endswith('.pdf') and include_pdfs:
-                    text = process_pdf(clean_url)
-                else:
-                    for element in soup(['script', 'style', 'head', 'title', 'meta', '[document]']):
-                        element.decompose()
-                    comments = soup.find_all(string=lambda text: isinstance(text, Comment))
-                    for comment in comments:
-                        comment.extract()
-                    text = soup.get_text(separator='\n', strip=True)
-
-                all_text.append(f'<page url="{escape_xml(clean_url)}">')
-                all_text.append(escape_xml(text))
-                all_text.append('</page>')
-                processed_urls.append(clean_url)
-                print(f"Processed: {clean_url}")
-
-                if current_depth < max_depth:
-                    for link in soup.find_all('a', href=True):
-                        new_url = urljoin(current_url, link['href']).split('#')[0]
-                        if new_url not in visited_urls and is_within_depth(base_url, new_url, max_depth) and (include_pdfs or not new_url.endswith('.pdf')) and not (ignore_epubs and new_url.endswith('.epub')):
-                            urls_to_visit.append((new_url, current_depth + 1))
+    try:
+        while frontier:
+            while len(tasks) < min(len(frontier), window):
+                tasks.append(asyncio.ensure_future(crawl_page(frontier.peek(len(tasks))[0])))
 
+            current_url, current_depth = frontier.pop()
+            task = tasks.popleft()
+
+            clean_url = current_url.split('#')[0]
+            try:
+                text, links = await task
             except requests.RequestException as e:
                 print(f"Failed to retrieve {clean_url}: {e}")
+                frontier.commit(current_url, None)
+                continue
 
+            add_page(clean_url, text)
+            print(f"Processed: {clean_url}")
+
+            if current_depth < max_depth:
+                for href in links:
+                    new_url = urljoin(current_url, href).split('#')[0]
+                    if new_url not in frontier.seen and is_same_domain(base_url, new_url) and is_within_depth(base_url, new_url, max_depth) and (include_pdfs or not new_url.endswith('.pdf')) and not (ignore_epubs and new_url.endswith('.epub')):
+                        frontier.add(new_url, current_depth + 1)
+            frontier.commit(current_url, text)
+    except BaseException:
+        frontier.close()
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+        fetch_executor.shutdown(wait=False, cancel_futures=True)
+        if parse_executor is not fetch_executor:
+            parse_executor.shutdown(wait=False, cancel_futures=True)
+    frontier.close(finished=True)
+
+    for url, text in pages:
+        write_page(url, boilerplate.strip(text))
     all_text.append('</source>')
     formatted_content = '\n'.join(all_text)
 
@@ -455,7 +3101,24 @@ def crawl_and_extract_text(base_url, max_depth, include_pdfs, ignore_epubs):
         'processed_urls': processed_urls
     }
 
+def crawl_and_extract_text(base_url, max_depth, include_pdfs, ignore_epubs,
+                           concurrency=CRAWL_CONCURRENCY, per_host_limit=CRAWL_PER_HOST_LIMIT, parse_workers=None,
+                           state_path=None, html_extractor=None, dedup=None, boilerplate=None):
+    """
+    Crawl documentation starting at base_url, following same-domain links up
+    to max_depth path segments below it. See crawl_async; concurrency=1 crawls
+    one page at a time, and state_path makes the crawl resumable.
+    """
+    import asyncio
+
+    return asyncio.run(crawl_async(base_url, max_depth, include_pdfs, ignore_epubs,
+                                   concurrency, per_host_limit, parse_workers, state_path,
+                                   html_extractor, dedup, boilerplate))
+
 def process_doi_or_pmid(identifier):
+    import requests
+    from bs4 import BeautifulSoup
+
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 6.3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.102 Safari/537.36',
         'Connection': 'keep-alive'
@@ -486,14 +3149,9 @@ def process_doi_or_pmid(identifier):
         else:
             pdf_url = 'https:/' + content
 
-        pdf_filename = f"{identifier.replace('/', '-')}.pdf"
-        wget.download(pdf_url, pdf_filename)
-
-        with open(pdf_filename, 'rb') as pdf_file:
-            pdf_reader = PdfReader(pdf_file)
-            text = ""
-            for page in range(len(pdf_reader.pages)):
-                text += pdf_reader.pages[page].extract_text()
+        pdf_response = http_get(pdf_url)
+        pdf_response.raise_for_status()
+        text = ''.join(iter_pdf_pages(pdf_response.content))
 
         formatted_text = f'<source type="sci_hub_paper" identifier="{escape_xml(identifier)}">\n'
         formatted_text += '<paper>\n'
@@ -501,7 +3159,6 @@ def process_doi_or_pmid(identifier):
         formatted_text += '\n</paper>\n'
         formatted_text += '</source>'
 
-        os.remove(pdf_filename)
         print(f"Identifier {identifier} processed successfully.")
         return formatted_text
     except (requests.RequestException, ValueError) as e:
@@ -518,20 +3175,20 @@ def process_github_pull_request(pull_request_url):
     repo_name = url_parts[4]
     pull_request_number = url_parts[-1]
 
-    api_base_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/pulls/{pull_request_number}"
-    headers = {"Authorization": f"token {TOKEN}"}
+    api_base_url = f"{GITHUB_API_URL}/repos/{repo_owner}/{repo_name}/pulls/{pull_request_number}"
+    headers = github_headers()
 
-    response = requests.get(api_base_url, headers=headers)
+    response = http_get(api_base_url, headers=headers)
     pull_request_data = response.json()
 
     diff_url = pull_request_data["diff_url"]
-    diff_response = requests.get(diff_url, headers=headers)
+    diff_response = http_get(diff_url, headers=headers)
     pull_request_diff = diff_response.text
 
     comments_url = pull_request_data["comments_url"]
     review_comments_url = pull_request_data["review_comments_url"]
-    comments_response = requests.get(comments_url, headers=headers)
-    review_comments_response = requests.get(review_comments_url, headers=headers)
+    comments_response = http_get(comments_url, headers=headers)
+    review_comments_response = http_get(review_comments_url, headers=headers)
     comments_data = comments_response.json()
     review_comments_data = review_comments_response.json()
 
@@ -593,14 +3250,14 @@ def process_github_issue(issue_url):
     repo_name = url_parts[4]
     issue_number = url_parts[-1]
 
-    api_base_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/issues/{issue_number}"
-    headers = {"Authorization": f"token {TOKEN}"}
+    api_base_url = f"{GITHUB_API_URL}/repos/{repo_owner}/{repo_name}/issues/{issue_number}"
+    headers = github_headers()
 
-    response = requests.get(api_base_url, headers=headers)
+    response = http_get(api_base_url, headers=headers)
     issue_data = response.json()
 
     comments_url = issue_data["comments_url"]
-    comments_response = requests.get(comments_url, headers=headers)
+    comments_response = http_get(comments_url, headers=headers)
     comments_data = comments_response.json()
 
     formatted_text = f'<source type="github_issue" url="{issue_url}">\n'
@@ -621,7 +3278,7 @@ def process_github_issue(issue_url):
             line_range = url_parts[1]
             start_line, end_line = map(int, line_range.split("-")[0][1:]), map(int, line_range.split("-")[1][1:])
 
-            file_response = requests.get(file_url, headers=headers)
+            file_response = http_get(file_url, headers=headers)
             file_content = file_response.text
 
             code_lines = file_content.split("\n")[start_line-1:end_line]
@@ -649,6 +3306,32 @@ def process_github_issue(issue_url):
     return formatted_text
 
 
+ALLOWED_EXTENSIONS = frozenset([
+    '.go',
+    '.proto',
+    '.py',
+    '.txt',
+    '.md',
+    '.cjs',
+    '.html',
+    '.json',
+    '.ipynb',
+    '.h',
+    '.localhost',
+    '.yaml',
+    '.example',
+])
+EXCLUDED_FILE_PATTERNS = (
+    '.pb.go',  # Proto generated Go files
+    '_grpc.pb.go',  # gRPC generated Go files
+    'mock_',  # Mock files
+    '/generated/',  # Generated files in a generated directory
+    '/mocks/',  # Mock files in a mocks directory
+    '.gen.',  # Generated files with .gen. in name
+    '_generated.',  # Generated files with _generated in name
+)
+EXCLUDED_FILE_RE = re.compile("|".join(map(re.escape, EXCLUDED_FILE_PATTERNS)))
+
 def is_excluded_file(filename):
     """
     Check if a file should be excluded based on patterns.
@@ -659,17 +3342,7 @@ def is_excluded_file(filename):
     Returns:
         bool: True if the file should be excluded, False otherwise
     """
-    excluded_patterns = [
-        '.pb.go',  # Proto generated Go files
-        '_grpc.pb.go',  # gRPC generated Go files
-        'mock_',  # Mock files
-        '/generated/',  # Generated files in a generated directory
-        '/mocks/',  # Mock files in a mocks directory
-        '.gen.',  # Generated files with .gen. in name
-        '_generated.',  # Generated files with _generated in name
-    ]
-
-    return any(pattern in filename for pattern in excluded_patterns)
+    return EXCLUDED_FILE_RE.search(filename) is not None
 
 
 def is_allowed_filetype(filename):
@@ -682,28 +3355,8 @@ def is_allowed_filetype(filename):
     Returns:
         bool: True if the file should be processed, False otherwise
     """
-    # First check if file matches any exclusion patterns
-    if is_excluded_file(filename):
-        return False
-
-    # Then check if it has an allowed extension
-    allowed_extensions = [
-        '.go',
-        '.proto',
-        '.py',
-        '.txt',
-        '.md',
-        '.cjs',
-        '.html',
-        '.json',
-        '.ipynb',
-        '.h',
-        '.localhost',
-        '.yaml',
-        '.example'
-    ]
-
-    return any(filename.endswith(ext) for ext in allowed_extensions)
+    # Every allowed extension has a single dot, so only the last one matters
+    return filename[filename.rfind('.'):] in ALLOWED_EXTENSIONS and not is_excluded_file(filename)
 
 def create_output_folder(input_path):
     """
@@ -739,9 +3392,93 @@ def create_output_folder(input_path):
     os.makedirs(output_folder)
     return output_folder
 
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Aggregate a local folder, repository, paper or web page into a single text file for LLM prompts."
+    )
+    parser.add_argument("input_path", nargs="?", help="Local path, URL, DOI or PMID to process")
+    parser.add_argument("--source", help="Path or URL to process (alternative to the positional argument)")
+    parser.add_argument("--archive", action="store_true",
+                        help="Download GitHub repositories as a single tarball instead of one request per file")
+    parser.add_argument("--ref",
+                        help="For a local git repository, read files as of this branch, tag or commit instead of the working tree")
+    parser.add_argument("--stdout", action="store_true",
+                        help="Stream the uncompressed output to stdout instead of writing output files")
+    parser.add_argument("--no-clipboard", action="store_true",
+                        help="Do not copy the uncompressed output to the clipboard")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Processes used to read and convert files of a local folder and to build the "
+                             "compressed output (default: 1), and to extract PDF pages (default: one per CPU)")
+    parser.add_argument("--max-tokens", type=int,
+                        help="Keep only as many files of a local folder or GitHub repository as fit in this many tokens")
+    parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                        help="With --max-tokens, keep files matching this glob pattern first (repeatable)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="Skip files and directories matching this .gitignore-style pattern, relative to the "
+                             "folder or repository being ingested (repeatable)")
+    parser.add_argument("--no-gitignore", action="store_true",
+                        help="Ingest files in local folders even when .gitignore or .git/info/exclude ignores them")
+    parser.add_argument("--max-file-size", type=float, default=LOCAL_MAX_FILE_BYTES / (1024 * 1024), metavar="MB",
+                        help="Keep only the first MB of larger files of a local folder, followed by a truncation "
+                             f"marker (default: {LOCAL_MAX_FILE_BYTES // (1024 * 1024)}, 0 = no cap)")
+    parser.add_argument("--max-total-size", type=float, default=0, metavar="MB",
+                        help="Read at most this many MB of a local folder's files in walk order and skip the rest "
+                             "(default: 0, no cap)")
+    parser.add_argument("--strip-boilerplate", action="store_true",
+                        help="Drop the lines a documentation crawl repeats on most pages (navigation, headers, "
+                             "footers) from every page but the first")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Write files and crawled pages whose content was already written as a reference to "
+                             "the first copy (<file name=... duplicate_of=...>)")
+    parser.add_argument("--dedup-near", action="store_true",
+                        help="With --dedup, also treat crawled pages that are near-duplicates (by SimHash) as copies")
+    parser.add_argument("--pack-order", default=",".join(PACK_ORDER),
+                        help=f"With --max-tokens, priority rules in order (default: {','.join(PACK_ORDER)})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not read or write the on-disk caches (processed GitHub and local files, HTTP responses)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help=f"Directory for on-disk caches (default: {CACHE_DIR})")
+    parser.add_argument("--cache-size", type=int, default=BLOB_CACHE_MAX_BYTES // (1024 * 1024),
+                        help="Size cap in MB of each of the GitHub file cache and the HTTP response cache; "
+                             "least recently used entries are evicted beyond it")
+    parser.add_argument("--crawl-concurrency", type=int, default=CRAWL_CONCURRENCY,
+                        help=f"Pages fetched at once when crawling documentation (default: {CRAWL_CONCURRENCY})")
+    parser.add_argument("--crawl-per-host", type=int, default=CRAWL_PER_HOST_LIMIT,
+                        help=f"Maximum concurrent crawler requests to a single host (default: {CRAWL_PER_HOST_LIMIT})")
+    parser.add_argument("--html-extractor", default=HTML_EXTRACTOR,
+                        choices=[name for name in HTML_EXTRACTORS if name != "lxml" or LXML_AVAILABLE],
+                        help=f"HTML text extraction backend for crawled pages (default: {HTML_EXTRACTOR})")
+    parser.add_argument("--restart-crawl", action="store_true",
+                        help="Discard the checkpoint of an interrupted crawl instead of resuming it")
+    parser.add_argument("--workers", type=int, default=GITHUB_MAX_WORKERS,
+                        help=f"Concurrent requests used for GitHub repositories (default: {GITHUB_MAX_WORKERS}, 1 = sequential)")
+    parser.add_argument("--notebook-converter", default=NOTEBOOK_CONVERTER, choices=["fast", "nbconvert"],
+                        help=f"How notebooks are converted to Python (default: {NOTEBOOK_CONVERTER}); both give the same output")
+    parser.add_argument("--notebook-outputs", type=int, default=NOTEBOOK_OUTPUT_CHARS, metavar="CHARS",
+                        help="With the fast converter, keep up to this many characters of each code cell's text "
+                             "outputs as comments (default: 0, outputs are dropped)")
+    parser.add_argument("--watch", action="store_true",
+                        help="For a local folder, keep the output files up to date as files change until interrupted")
+    args = parser.parse_args(argv)
+    for option in ("stdout", "ref", "max_tokens", "max_total_size", "dedup", "dedup_near"):
+        if args.watch and getattr(args, option):
+            parser.error(f"--watch cannot be combined with --{option.replace('_', '-')}")
+    return args
+
 def main():
+    global http_cache, NOTEBOOK_CONVERTER, NOTEBOOK_OUTPUT_CHARS
+    configure_logging()
     logging.info("Starting main function")
-    console = Console()
+    args = parse_arguments(sys.argv[1:])
+    NOTEBOOK_CONVERTER, NOTEBOOK_OUTPUT_CHARS = args.notebook_converter, args.notebook_outputs
+    # With --stdout the document itself goes to stdout, so everything else is sent to stderr
+    stdout = sys.stdout
+    from rich.console import Console
+    from rich.panel import Panel
+    from rich.text import Text
+    from rich.progress import Progress, TextColumn, BarColumn, TimeRemainingColumn
+
+    console = Console(stderr=args.stdout)
 
     intro_text = Text("\nInput Paths or URLs Processed:\n", style="dodger_blue1")
     input_types = [
@@ -770,21 +3507,58 @@ def main():
 
     logging.debug(f"System arguments: {sys.argv}")
     
-    if len(sys.argv) > 1:
-        input_path = sys.argv[2] if sys.argv[1] == "--source" else sys.argv[1]
+    if args.source or args.input_path:
+        input_path = args.source or args.input_path
         logging.info(f"Using command line argument path: {input_path}")
     else:
+        from rich.prompt import Prompt
+
         input_path = Prompt.ask("\n[bold dodger_blue1]Enter the path or URL[/bold dodger_blue1]", console=console)
         logging.info(f"Using prompted path: {input_path}")
     
     console.print(f"\n[bold bright_green]You entered:[/bold bright_green] [bold bright_yellow]{input_path}[/bold bright_yellow]\n")
 
-    output_folder = create_output_folder(input_path)
-    output_file = os.path.join(output_folder, "uncompressed_output.txt")
-    processed_file = os.path.join(output_folder, "compressed_output.txt")
-    urls_list_file = os.path.join(output_folder, "processed_urls.txt")
-
-    with Progress(
+    if args.stdout:
+        output_folder = None
+    else:
+        output_folder = create_output_folder(input_path)
+        output_file = os.path.join(output_folder, "uncompressed_output.txt")
+        processed_file = os.path.join(output_folder, "compressed_output.txt")
+        urls_list_file = os.path.join(output_folder, "processed_urls.txt")
+        manifest_json_file = os.path.join(output_folder, "token_manifest.json")
+        manifest_csv_file = os.path.join(output_folder, "token_manifest.csv")
+        dropped_files_file = os.path.join(output_folder, "dropped_files.txt")
+        skipped_files_file = os.path.join(output_folder, "skipped_files.txt")
+
+    if not args.no_cache:
+        http_cache = HTTPCache(os.path.join(args.cache_dir, "http_cache.sqlite"), args.cache_size * 1024 * 1024)
+    token_counter = TokenCounter(None if args.no_cache else os.path.join(args.cache_dir, "token_counts.sqlite"))
+    budget = None
+    if args.max_tokens:
+        budget = TokenBudget(args.max_tokens, args.include, args.pack_order.split(","), token_counter)
+    limits = LocalFileLimits(int(args.max_file_size * 1024 * 1024), int(args.max_total_size * 1024 * 1024))
+    dedup = None
+    if args.dedup or args.dedup_near:
+        dedup = Deduplicator(near=args.dedup_near, counter=token_counter)
+    # .gitignore files only apply to local folders; git refs and GitHub repositories list tracked files
+    path_filter = PathFilter(input_path if os.path.isdir(input_path) and not args.ref else None, args.exclude,
+                             gitignore=not args.no_gitignore)
+    if args.watch:
+        if not os.path.isdir(input_path):
+            console.print(f"\n[bold red]--watch needs a local folder:[/bold red] {input_path}")
+            return
+        watch_local_folder(input_path, output_file, processed_file, manifest_json_file, manifest_csv_file,
+                           token_counter, jobs=args.jobs or 1, console=console, path_filter=path_filter,
+                           max_file_bytes=limits.max_file_bytes)
+        return
+
+    # Every artifact is produced while the input is processed; see OutputPipeline
+    pipeline = None
+    if not args.stdout:
+        pipeline = OutputPipeline(output_file, processed_file, token_counter, jobs=args.jobs or 1)
+    sink = stdout if args.stdout else pipeline
+
+    with pipeline or contextlib.nullcontext(), contextlib.redirect_stdout(sys.stderr if args.stdout else stdout), Progress(
         TextColumn("[bold bright_blue]{task.description}"),
         BarColumn(bar_width=None),
         TimeRemainingColumn(),
@@ -803,48 +3577,138 @@ def main():
                 elif "/issues/" in input_path:
                     final_output = process_github_issue(input_path)
                 else:
-                    final_output = process_github_repo(input_path)
+                    blob_cache = None
+                    if not args.no_cache:
+                        blob_cache = BlobCache(os.path.join(args.cache_dir, "blobs"), args.cache_size * 1024 * 1024)
+                    final_output = process_github_repo(input_path, max_workers=args.workers, use_archive=args.archive,
+                                                       blob_cache=blob_cache, budget=budget, path_filter=path_filter,
+                                                       dedup=dedup)
+                    if blob_cache is not None:
+                        console.print(f"\n[bright_green]Blob cache:[/bright_green] [bold bright_cyan]{blob_cache.hits}[/bold bright_cyan] hits, "
+                                      f"[bold bright_cyan]{blob_cache.misses}[/bold bright_cyan] misses")
             elif urlparse(input_path).scheme in ["http", "https"]:
                 if "youtube.com" in input_path or "youtu.be" in input_path:
                     final_output = fetch_youtube_transcript(input_path)
                 elif "arxiv.org" in input_path:
-                    final_output = process_arxiv_pdf(input_path)
+                    # Written page by page, like local folders, instead of as one string
+                    write_arxiv_pdf(input_path, sink, jobs=args.jobs)
+                    final_output = None
                 else:
-                    crawl_result = crawl_and_extract_text(input_path, max_depth=2, include_pdfs=True, ignore_epubs=True)
+                    state_path = None
+                    if not args.no_cache:
+                        state_path = crawl_state_path(input_path, 2, True, True, args.cache_dir)
+                        if args.restart_crawl:
+                            for suffix in ("", "-wal", "-shm"):
+                                with contextlib.suppress(FileNotFoundError):
+                                    os.remove(state_path + suffix)
+                    boilerplate = BoilerplateFilter(token_counter) if args.strip_boilerplate else None
+                    crawl_started = time.perf_counter()
+                    crawl_result = crawl_and_extract_text(input_path, max_depth=2, include_pdfs=True, ignore_epubs=True,
+                                                          concurrency=args.crawl_concurrency,
+                                                          per_host_limit=args.crawl_per_host,
+                                                          state_path=state_path,
+                                                          html_extractor=args.html_extractor, dedup=dedup,
+                                                          boilerplate=boilerplate)
+                    if boilerplate is not None and boilerplate.pages:
+                        removed = boilerplate.tokens_before - boilerplate.tokens_after
+                        console.print(f"\n[bright_green]Boilerplate:[/bright_green] [bold bright_cyan]{removed}[/bold bright_cyan] of "
+                                      f"[bold bright_cyan]{boilerplate.tokens_before}[/bold bright_cyan] tokens "
+                                      f"({removed / max(boilerplate.tokens_before, 1):.0%}) removed from "
+                                      f"[bold bright_cyan]{boilerplate.pages}[/bold bright_cyan] pages of "
+                                      f"[bold bright_yellow]{urlparse(input_path).netloc}[/bold bright_yellow], "
+                                      f"{boilerplate.pages / (time.perf_counter() - crawl_started):.1f} pages/s")
                     final_output = crawl_result['content']
-                    with open(urls_list_file, 'w', encoding='utf-8') as urls_file:
-                        urls_file.write('\n'.join(crawl_result['processed_urls']))
+                    if output_folder:
+                        with open(urls_list_file, 'w', encoding='utf-8') as urls_file:
+                            urls_file.write('\n'.join(crawl_result['processed_urls']))
             elif input_path.startswith("10.") and "/" in input_path or input_path.isdigit():
                 final_output = process_doi_or_pmid(input_path)
+            elif args.ref:
+                logging.debug(f"Processing local git repository at ref {args.ref}")
+                final_output = process_local_git_ref(input_path, args.ref, path_filter)
             else:
                 logging.debug("Processing as local folder")
-                final_output = process_local_folder(input_path)
+                # Stream the walk straight into the output instead of building one large string
+                manifest = None
+                if not args.no_cache:
+                    manifest = LocalManifest(os.path.join(args.cache_dir, "local_manifest.sqlite"))
+                write_local_folder(input_path, sink, jobs=args.jobs or 1, budget=budget, manifest=manifest,
+                                   path_filter=path_filter, limits=limits, dedup=dedup)
+                final_output = None
+                if manifest is not None:
+                    manifest.close()
+                    console.print(f"\n[bright_green]Local manifest:[/bright_green] [bold bright_cyan]{manifest.unchanged}[/bold bright_cyan] unchanged, "
+                                  f"[bold bright_cyan]{manifest.read}[/bold bright_cyan] read, "
+                                  f"[bold bright_cyan]{manifest.removed}[/bold bright_cyan] removed")
+                if limits.skipped or limits.truncated:
+                    console.print(f"\n[bright_green]Skipped files:[/bright_green] [bold bright_cyan]{len(limits.skipped)}[/bold bright_cyan], "
+                                  f"[bright_green]truncated:[/bright_green] [bold bright_cyan]{len(limits.truncated)}[/bold bright_cyan]")
+                    for relative_path, reason in limits.skipped[:10]:
+                        console.print(f"  [bright_yellow]{relative_path}[/bright_yellow]: skipped, {reason}")
+                    for relative_path, size, kept in limits.truncated[:10]:
+                        console.print(f"  [bright_yellow]{relative_path}[/bright_yellow]: first {kept} of {size} bytes kept")
+                    if output_folder:
+                        with open(skipped_files_file, "w", encoding="utf-8") as skipped_file:
+                            skipped_file.write("".join(f"{path}\tskipped\t{reason}\n" for path, reason in limits.skipped))
+                            skipped_file.write("".join(f"{path}\ttruncated\t{kept} of {size} bytes\n"
+                                                       for path, size, kept in limits.truncated))
+
+            if final_output is not None:
+                sink.write(final_output)
 
             progress.update(task, advance=50)
 
-            # Write the uncompressed output
-            with open(output_file, "w", encoding="utf-8") as file:
-                file.write(final_output)
-                logging.info(f"Wrote uncompressed output to {output_file}")
+            if budget is not None:
+                console.print(f"\n[bright_green]Token budget:[/bright_green] [bold bright_cyan]{budget.used}[/bold bright_cyan] of "
+                              f"[bold bright_cyan]{budget.max_tokens}[/bold bright_cyan] tokens used, "
+                              f"[bold bright_cyan]{len(budget.dropped)}[/bold bright_cyan] files dropped")
+                if output_folder:
+                    with open(dropped_files_file, "w", encoding="utf-8") as dropped_file:
+                        dropped_file.write("".join(f"{path}\t{tokens}\n" for path, tokens in budget.dropped))
+                else:
+                    for path, tokens in budget.dropped:
+                        print(f"Dropped {path} ({tokens} tokens)")
+
+            if dedup is not None:
+                console.print(f"\n[bright_green]Duplicates:[/bright_green] [bold bright_cyan]{len(dedup.duplicates)}[/bold bright_cyan] "
+                              f"written as references, [bold bright_cyan]{dedup.bytes_saved}[/bold bright_cyan] bytes and "
+                              f"[bold bright_cyan]{dedup.tokens_saved}[/bold bright_cyan] tokens saved")
 
+            if http_cache is not None:
+                console.print(f"\n[bright_green]HTTP cache:[/bright_green] [bold bright_cyan]{http_cache.revalidated}[/bold bright_cyan] unchanged (304), "
+                              f"[bold bright_cyan]{http_cache.fetched}[/bold bright_cyan] fetched")
 
-            # Process the compressed output
-            preprocess_text(output_file, processed_file)
+            if args.stdout:
+                stdout.flush()
+                return
+
+            # Wait for the compressed output and the token counts
+            pipeline.close()
 
             progress.update(task, advance=50)
 
-            compressed_text = safe_file_read(processed_file)
-            compressed_token_count = get_token_count(compressed_text)
-            console.print(f"\n[bright_green]Compressed Token Count:[/bright_green] [bold bright_cyan]{compressed_token_count}[/bold bright_cyan]")
+            manifest = build_token_manifest({"uncompressed": pipeline.sections["uncompressed"],
+                                             "compressed": pipeline.sections["compressed"]}, token_counter)
+            write_token_manifest(manifest, manifest_json_file, manifest_csv_file)
 
-            uncompressed_text = safe_file_read(output_file)
-            uncompressed_token_count = get_token_count(uncompressed_text)
+            compressed_token_count = manifest["totals"]["compressed"]["tokens"]
+            console.print(f"\n[bright_green]Compressed Token Count:[/bright_green] [bold bright_cyan]{compressed_token_count}[/bold bright_cyan]")
+            uncompressed_token_count = manifest["totals"]["uncompressed"]["tokens"]
             console.print(f"[bright_green]Uncompressed Token Count:[/bright_green] [bold bright_cyan]{uncompressed_token_count}[/bold bright_cyan]")
+            top_level = {directories[0] for directories in map(manifest_directories, (row["name"] for row in manifest["files"])) if directories}
+            for row in [row for row in manifest["directories"] if row["directory"] in top_level][:5]:
+                console.print(f"  [bright_white]{row['directory']}[/bright_white]: [bright_cyan]{row['uncompressed_tokens']}[/bright_cyan] tokens in {row['files']} files")
+            console.print(f"[bright_green]Token manifest:[/bright_green] [bold bright_blue]{manifest_json_file}[/bold bright_blue]")
 
             console.print(f"\n[bold bright_yellow]{processed_file}[/bold bright_yellow] and [bold bright_blue]{output_file}[/bold bright_blue] have been created in the working directory.")
 
-            pyperclip.copy(uncompressed_text)
-            console.print(f"\n[bright_white]The contents of [bold bright_blue]{output_file}[/bold bright_blue] have been copied to the clipboard.[/bright_white]")
+            if not args.no_clipboard:
+                import pyperclip
+
+                # Read back only for the clipboard, so the pipeline never holds the whole document
+                with open(output_file, "r", encoding="utf-8", newline="") as f:
+                    pyperclip.copy(f.read())
+                console.print(f"\n[bright_white]The contents of [bold bright_blue]{output_file}[/bold bright_blue] have been copied to the clipboard.[/bright_white]")
 
         except Exception as e:
             logging.error(f"Error in main function: {str(e)}")
@@ -1,8 +1,22 @@
 import unittest
 import os
+import sys
 import tempfile
 import shutil
-from onefilellm import process_github_repo, process_arxiv_pdf, process_local_folder, fetch_youtube_transcript, crawl_and_extract_text, process_doi_or_pmid, process_github_pull_request, process_github_issue
+import json
+import re
+import random
+import subprocess
+import importlib.util
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+import onefilellm
+from benchmarks.mock_github import MockGitHubServer
+from benchmarks.mock_pdf import make_pdf
+from benchmarks.mock_site import MockSiteServer, make_docs_site
+from onefilellm import process_github_repo, process_arxiv_pdf, process_local_folder, process_local_git_ref, write_local_folder, fetch_youtube_transcript, crawl_and_extract_text, process_doi_or_pmid, process_github_pull_request, process_github_issue
 
 class TestDataAggregation(unittest.TestCase):
     def setUp(self):
@@ -102,5 +116,805 @@ class TestDataAggregation(unittest.TestCase):
         self.assertIn('<repository>', issue_content)
         print("GitHub issue processing test passed.")
 
+class TestLocalFolder(unittest.TestCase):
+    """Local folder ingestion tests that run against a generated directory tree."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.write("README.md", "# Project\n")
+        self.write("src/app.py", "if a < b and c > d:\n    pass\n")
+        self.write("src/data.json", '{"key": "value & more"}\n')
+        self.write("node_modules/pkg/index.json", "{}")
+        self.write("image.png", "not text")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, path, text):
+        full_path = os.path.join(self.temp_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(text)
+
+    def test_local_folder_needs_no_github_token_or_heavy_imports(self):
+        code = (
+            "import sys, onefilellm\n"
+            "onefilellm.process_local_folder(sys.argv[1])\n"
+            "print(sorted({'requests', 'bs4', 'PyPDF2', 'nltk', 'rich', 'youtube_transcript_api', 'nbconvert'} & set(sys.modules)))\n"
+            "try:\n"
+            "    onefilellm.github_headers()\n"
+            "except EnvironmentError:\n"
+            "    print('token required')\n"
+        )
+        env = {name: value for name, value in os.environ.items() if name != "GITHUB_TOKEN"}
+        env["PYTHONPATH"] = os.path.dirname(os.path.abspath(onefilellm.__file__))
+        result = subprocess.run([sys.executable, "-c", code, self.temp_dir], cwd=self.temp_dir, env=env,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.splitlines(), ["[]", "token required"])
+
+    def test_streaming_writer_matches_string_output(self):
+        writes = []
+
+        class RecordingSink:
+            def write(self, text):
+                writes.append(text)
+
+        write_local_folder(self.temp_dir, RecordingSink())
+        content = process_local_folder(self.temp_dir)
+        self.assertEqual("".join(writes), content)
+        self.assertGreater(len(writes), 3)
+        self.assertIn('<file name="src/app.py">\nif a &lt; b and c &gt; d:\n    pass\n\n</file>', content)
+        self.assertNotIn("node_modules", content)
+        self.assertNotIn("image.png", content)
+        self.assertTrue(content.endswith("</source>"))
+
+    def test_token_budget_keeps_priority_files(self):
+        self.write("docs/big.md", "word " * 400 + "\n")
+        full = process_local_folder(self.temp_dir)
+        budget = onefilellm.TokenBudget(40, include=["src/*"])
+        packed = process_local_folder(self.temp_dir, budget=budget)
+
+        self.assertEqual(budget.used, onefilellm.get_token_count(packed))
+        self.assertLessEqual(budget.used, 40)
+        self.assertEqual([path for path, _ in budget.dropped], ["docs/big.md"])
+        self.assertEqual(packed, full.replace(
+            '<file name="docs/big.md">\n' + "word " * 400 + "\n\n</file>\n", ""))
+
+        budget = onefilellm.TokenBudget(33, include=["src/*"], order=["include", "type"])
+        packed = process_local_folder(self.temp_dir, budget=budget)
+        self.assertIn('<file name="src/data.json">', packed)
+        self.assertIn('<file name="src/app.py">', packed)
+        self.assertNotIn('<file name="README.md">', packed)
+        self.assertRaises(ValueError, onefilellm.TokenBudget, 10, order=["newest"])
+
+    def test_manifest_reads_only_changed_files(self):
+        def age(path, seconds=100):
+            full_path = os.path.join(self.temp_dir, path)
+            os.utime(full_path, (os.path.getmtime(full_path) - seconds,) * 2)
+
+        for path in ("README.md", "src/app.py", "src/data.json"):
+            age(path)
+        manifest = onefilellm.LocalManifest(os.path.join(self.temp_dir, "outputs", "manifest.sqlite"))
+        self.addCleanup(manifest.close)
+        expected = process_local_folder(self.temp_dir)
+        self.assertEqual(process_local_folder(self.temp_dir, manifest=manifest), expected)
+        self.assertEqual((manifest.unchanged, manifest.read, manifest.removed), (0, 3, 0))
+
+        with patch.object(onefilellm, "read_local_file", side_effect=AssertionError("read again")):
+            self.assertEqual(process_local_folder(self.temp_dir, manifest=manifest), expected)
+        self.assertEqual((manifest.unchanged, manifest.read, manifest.removed), (3, 3, 0))
+
+        self.write("src/app.py", "print('changed')\n")
+        age("src/app.py", 50)
+        age("README.md", 50)  # Touched, same content
+        os.remove(os.path.join(self.temp_dir, "src/data.json"))
+        self.write("src/new.py", "x = 1\n")
+        expected = process_local_folder(self.temp_dir)
+        self.assertEqual(process_local_folder(self.temp_dir, manifest=manifest, jobs=2), expected)
+        self.assertEqual((manifest.unchanged, manifest.read, manifest.removed), (4, 5, 1))
+
+    def full_run(self, directory):
+        output_file, compressed_file = os.path.join(directory, "full.txt"), os.path.join(directory, "full_compressed.txt")
+        counter = onefilellm.TokenCounter()
+        with onefilellm.OutputPipeline(output_file, compressed_file, counter) as pipeline:
+            write_local_folder(self.temp_dir, pipeline)
+            pipeline.close()
+        with open(output_file, "rb") as f, open(compressed_file, "rb") as g:
+            return f.read(), g.read(), onefilellm.build_token_manifest(pipeline.sections, counter)
+
+    def test_watched_output_patches_changed_files(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        output_file, compressed_file = os.path.join(output_dir, "out.txt"), os.path.join(output_dir, "compressed.txt")
+
+        def written():
+            with open(output_file, "rb") as f, open(compressed_file, "rb") as g:
+                return f.read(), g.read(), manifest
+
+        output = onefilellm.LocalFolderOutput(self.temp_dir)
+        self.assertEqual(output.update(), 3)
+        manifest = output.write(output_file, compressed_file)
+        self.assertEqual(written(), self.full_run(output_dir))
+
+        self.write("src/app.py", "print('The changed APP')\n")
+        self.assertEqual(output.update({"src/app.py"}), 1)
+        manifest = output.write(output_file, compressed_file)
+        self.assertEqual(written(), self.full_run(output_dir))
+
+        os.remove(os.path.join(self.temp_dir, "src/data.json"))
+        self.write("src/lib/new.md", "# New\n")
+        self.assertEqual(output.update({"src/data.json", "src/lib" + os.sep}), 1)
+        manifest = output.write(output_file, compressed_file)
+        self.assertEqual(written(), self.full_run(output_dir))
+
+    def test_folder_watcher_ignores_excluded_dirs(self):
+        backends = [False] + ([True] if sys.platform.startswith("linux") else [])
+        for use_inotify in backends:
+            watcher = onefilellm.FolderWatcher(self.temp_dir, use_inotify=use_inotify)
+            self.addCleanup(watcher.close)
+            self.assertEqual(watcher.wait(timeout=0.2), set())
+            self.write("node_modules/pkg/index.json", "{\"changed\": true}")
+            self.write("image.png", "still not text")
+            self.assertEqual(watcher.wait(timeout=0.2 + 2 * onefilellm.WATCH_POLL_INTERVAL), set())
+            self.write("src/app.py", "x = 2\n")
+            self.write("docs/guide.md", "# Guide\n")
+            expected = {"src/app.py", "docs" + os.sep} if watcher.backend == "inotify" else {"src/app.py", "docs/guide.md"}
+            self.assertEqual(watcher.wait(timeout=5), expected)
+            shutil.rmtree(os.path.join(self.temp_dir, "docs"))
+
+    def test_gitignore_rules_prune_the_walk(self):
+        self.write(".gitignore", "build/\n*.json\n!keep.json\n/docs/**/draft*\n")
+        self.write("src/.gitignore", "!data.json\nlib/*.md\n")
+        self.write("build/out.md", "# built\n")
+        self.write("keep.json", "{}")
+        self.write("src/lib/notes.md", "# notes\n")
+        self.write("src/lib/deep/notes.md", "# deep\n")
+        self.write("docs/a/b/draft-1.md", "# draft\n")
+        self.write("docs/a/final.md", "# final\n")
+        walked = []
+        real_walk = os.walk
+
+        def recording_walk(top, *args, **kwargs):
+            for entry in real_walk(top, *args, **kwargs):
+                walked.append(os.path.relpath(entry[0], self.temp_dir))
+                yield entry
+
+        with patch.object(onefilellm.os, "walk", recording_walk):
+            files = sorted(path for _, path in onefilellm.iter_local_folder_files(self.temp_dir))
+        expected = ["README.md", "docs/a/final.md", "keep.json", "src/app.py", "src/data.json", "src/lib/deep/notes.md"]
+        self.assertEqual(files, [path.replace("/", os.sep) for path in expected])
+        self.assertNotIn("build", walked)
+        if shutil.which("git"):
+            subprocess.run(["git", "init", "-q", self.temp_dir], check=True)
+            listed = subprocess.run(["git", "-C", self.temp_dir, "ls-files", "--others", "--exclude-standard"],
+                                    capture_output=True, text=True, check=True).stdout.split()
+            self.assertEqual(sorted(path for path in listed if onefilellm.is_allowed_filetype(os.path.basename(path))
+                                    and not path.startswith("node_modules/")), expected)
+
+        path_filter = onefilellm.PathFilter(self.temp_dir, exclude=["src/", "!keep.json", "*.md"], gitignore=False)
+        self.assertEqual(sorted(path for _, path in onefilellm.iter_local_folder_files(self.temp_dir, path_filter)),
+                         ["keep.json"])
+
+    def test_gitignore_star_does_not_ignore_the_directory_itself(self):
+        self.write(".gitignore", "logs/*\n!logs/README.md\ncache/*\n!cache/keep/\n")
+        self.write("logs/README.md", "# logs\n")
+        self.write("logs/run.txt", "ran\n")
+        self.write("cache/keep/notes.md", "# kept\n")
+        self.write("cache/drop/notes.md", "# dropped\n")
+        files = sorted(path for _, path in onefilellm.iter_local_folder_files(self.temp_dir))
+        expected = ["README.md", "cache/keep/notes.md", "logs/README.md", "src/app.py", "src/data.json"]
+        self.assertEqual(files, [path.replace("/", os.sep) for path in expected])
+        if shutil.which("git"):
+            subprocess.run(["git", "init", "-q", self.temp_dir], check=True)
+            listed = subprocess.run(["git", "-C", self.temp_dir, "ls-files", "--others", "--exclude-standard"],
+                                    capture_output=True, text=True, check=True).stdout.split()
+            self.assertEqual(sorted(path for path in listed if onefilellm.is_allowed_filetype(os.path.basename(path))
+                                    and not path.startswith("node_modules/")), expected)
+
+    def test_watched_output_reapplies_changed_gitignore(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        output_file = os.path.join(output_dir, "watched.txt")
+        compressed_file = os.path.join(output_dir, "watched_compressed.txt")
+        output = onefilellm.LocalFolderOutput(self.temp_dir)
+        output.update()
+        self.write(".gitignore", "src/\n")
+        output.update({".gitignore"})
+        output.write(output_file, compressed_file)
+        with open(output_file, encoding="utf-8") as f:
+            self.assertEqual(f.read(), process_local_folder(self.temp_dir))
+        self.assertEqual(output.order, ["README.md"])
+
+    def test_parallel_jobs_keep_walk_order(self):
+        for i in range(50):
+            self.write(f"pkg{i % 3}/module_{i}.py", f"value = {i}\n")
+        self.assertEqual(process_local_folder(self.temp_dir, jobs=3), process_local_folder(self.temp_dir))
+
+    def test_dedup_writes_copies_as_references(self):
+        self.write("vendor/app.py", "if a < b and c > d:\n    pass\n")
+        budget = onefilellm.TokenBudget(1000)
+        for kwargs in ({}, {"budget": budget}):
+            dedup = onefilellm.Deduplicator(counter=onefilellm.TokenCounter())
+            content = process_local_folder(self.temp_dir, dedup=dedup, **kwargs)
+            self.assertGreater(dedup.tokens_saved, 0)
+            (name, original, size, tokens), = dedup.duplicates
+            self.assertEqual({name, original}, {"src/app.py", "vendor/app.py"})
+            self.assertEqual(content.count("if a &lt; b"), 1)
+            self.assertIn(f'<file name="{name}" duplicate_of="{original}"></file>', content)
+            self.assertEqual((size, tokens), (len("if a &lt; b and c &gt; d:\n    pass\n"), dedup.tokens_saved))
+            self.assertIn((name, ""), onefilellm.split_sections(content))
+
+    def test_binary_and_oversized_files_are_skipped_or_truncated(self):
+        with open(os.path.join(self.temp_dir, "src", "blob.txt"), "wb") as f:
+            f.write(b"GIF89a\0\0binary")
+        data = "é<&>\r\n".encode() * 500
+        with open(os.path.join(self.temp_dir, "src", "large.json"), "wb") as f:
+            f.write(data)
+        # Memory-map every file over 64 bytes and decode it a few bytes at a time, across multibyte characters and \r\n
+        with patch.object(onefilellm, "LOCAL_MMAP_BYTES", 64), patch.object(onefilellm, "LOCAL_STREAM_CHUNK_BYTES", 7):
+            limits = onefilellm.LocalFileLimits()
+            content = process_local_folder(self.temp_dir, limits=limits)
+            self.assertIn(onefilellm.escape_xml(onefilellm.decode_text(data)), content)
+            self.assertNotIn("blob.txt", content)
+            self.assertEqual(limits.skipped, [("src/blob.txt", "binary content")])
+
+            limits = onefilellm.LocalFileLimits(max_file_bytes=1000)
+            content = process_local_folder(self.temp_dir, jobs=2, limits=limits)
+            self.assertIn(onefilellm.escape_xml(onefilellm.decode_text(data[:1000])) + f"\n... [{len(data) - 1000} more bytes truncated]\n</file>", content)
+            self.assertEqual(limits.truncated, [("src/large.json", len(data), 1000)])
+
+        limits = onefilellm.LocalFileLimits(max_total_bytes=20)
+        content = process_local_folder(self.temp_dir, limits=limits)
+        self.assertIn('<file name="README.md">\n# Project\n\n</file>', content)
+        self.assertIn(("src/app.py", "total size cap reached"), limits.skipped)
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class TestLocalGitRef(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.write("src/app.py", "print('v1')\n")
+        self.write("node_modules/pkg/index.json", "{}")
+        self.git("init", "-q")
+        self.git("add", "-A")
+        self.git("commit", "-q", "-m", "v1")
+        self.git("tag", "v1")
+        self.write("src/app.py", "print('v2')\n")
+        self.write("notes.md", "uncommitted\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+
+    def git(self, *args):
+        subprocess.run(["git", "-C", self.repo, "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                       check=True, capture_output=True)
+
+    def write(self, path, text):
+        full_path = os.path.join(self.repo, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(text)
+
+    def test_reads_ref_without_working_tree(self):
+        content = process_local_git_ref(self.repo, "v1")
+        self.assertIn('<source type="local_git_repository"', content)
+        self.assertIn('<file name="src/app.py">\nprint(\'v1\')\n\n</file>', content)
+        self.assertNotIn("v2", content)
+        self.assertNotIn("notes.md", content)
+        self.assertNotIn("node_modules", content)
+
+class TestGitHubRepoMock(unittest.TestCase):
+    """GitHub repository tests that run against a local mock of the contents API."""
+
+    files = {
+        "README.md": b"# Demo\r\nline two\n",
+        "src/app.py": b"print('<hello>')\n",
+        "src/lib/util.py": b"x = 1 & 2\n",
+        "src/lib.py": b"y = 2\n",
+        "src/z.txt": b"last\n",
+        "node_modules/pkg/index.json": b"{}",
+        "image.png": b"\x89PNG",
+    }
+
+    def setUp(self):
+        self.server = MockGitHubServer(self.files).__enter__()
+        self.original_api_url, self.original_token = onefilellm.GITHUB_API_URL, onefilellm.TOKEN
+        onefilellm.GITHUB_API_URL = self.server.api_url
+        onefilellm.TOKEN = "mock-token"  # The mock server accepts any token, so these tests run without GITHUB_TOKEN
+
+    def tearDown(self):
+        onefilellm.GITHUB_API_URL, onefilellm.TOKEN = self.original_api_url, self.original_token
+        self.server.__exit__(None, None, None)
+
+    def test_token_budget_drops_files_over_budget(self):
+        budget = onefilellm.TokenBudget(16, order=["depth", "small"])
+        content = process_github_repo(self.server.repo_url, budget=budget)
+        self.assertEqual(budget.used, onefilellm.get_token_count(content))
+        self.assertEqual(budget.used, 13)
+        self.assertEqual(sorted(path for path, _ in budget.dropped), ["src/app.py", "src/lib.py", "src/lib/util.py"])
+        self.assertIn('<file name="README.md">', content)
+        self.assertIn('<file name="src/z.txt">', content)
+
+    def test_dedup_writes_copies_as_references(self):
+        files = {"src/app.py": b"print('<hello>')\n", "vendor/app.py": b"print('<hello>')\n", "z.py": b"z = 1\n"}
+        with MockGitHubServer(files) as server:
+            onefilellm.GITHUB_API_URL = server.api_url
+            dedup = onefilellm.Deduplicator()
+            content = process_github_repo(server.repo_url, dedup=dedup)
+        self.assertEqual(content.count("print("), 1)
+        self.assertIn('<file name="vendor/app.py" duplicate_of="src/app.py"></file>\n<file name="z.py">', content)
+        self.assertEqual(dedup.bytes_saved, len("print('&lt;hello&gt;')\n"))
+
+    def test_concurrent_fetch_matches_sequential(self):
+        sequential = process_github_repo(self.server.repo_url, max_workers=1)
+        concurrent = process_github_repo(self.server.repo_url, max_workers=8)
+        self.assertEqual(sequential, concurrent)
+        self.assertEqual(concurrent, "\n".join([
+            f'<source type="github_repository" url="{self.server.repo_url}">',
+            '<file name="README.md">', "# Demo\nline two\n", '</file>',
+            '<file name="src/app.py">', "print('&lt;hello&gt;')\n", '</file>',
+            '<file name="src/lib.py">', "y = 2\n", '</file>',
+            '<file name="src/lib/util.py">', "x = 1 &amp; 2\n", '</file>',
+            '<file name="src/z.txt">', "last\n", '</file>',
+            '</source>',
+        ]))
+
+    def test_blob_cache_skips_unchanged_downloads(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        first = process_github_repo(self.server.repo_url, blob_cache=onefilellm.BlobCache(cache_dir))
+
+        cache = onefilellm.BlobCache(cache_dir)
+        requests_before = self.server.request_count
+        second = process_github_repo(self.server.repo_url, blob_cache=cache)
+        self.assertEqual(first, second)
+        self.assertEqual((cache.hits, cache.misses), (5, 0))
+        # Only the three directory listings were requested again
+        self.assertEqual(self.server.request_count - requests_before, 3)
+
+    def test_file_downloads_bypass_http_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.addCleanup(setattr, onefilellm, "http_cache", None)
+        onefilellm.http_cache = onefilellm.HTTPCache(os.path.join(cache_dir, "http_cache.sqlite"))
+        process_github_repo(self.server.repo_url, blob_cache=onefilellm.BlobCache(cache_dir))
+        # Only the three directory listings; file bodies are kept by the blob cache
+        self.assertEqual(onefilellm.http_cache.fetched, 3)
+
+    def test_blob_cache_evicts_least_recently_used(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = onefilellm.BlobCache(cache_dir, max_bytes=250)
+        for key in ("aa01", "bb02", "cc03"):
+            cache.put(key, "x" * 100)
+            os.utime(cache._path(key), (0, {"aa01": 1, "bb02": 2, "cc03": 3}[key]))
+        self.assertIsNone(cache.get("aa01"))
+        self.assertEqual(cache.get("cc03"), "x" * 100)
+        self.assertLessEqual(cache.size, 250)
+
+    def test_blob_cache_size_counts_rewritten_entries_once(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = onefilellm.BlobCache(cache_dir, max_bytes=250)
+        for _ in range(5):
+            cache.put("aa01", "x" * 100)
+        cache.put("aa01", "x" * 60)
+        self.assertEqual(cache.size, 60)
+        self.assertEqual(cache.get("aa01"), "x" * 60)
+
+    def test_archive_matches_contents_api(self):
+        for repo_url in (self.server.repo_url, f"{self.server.repo_url}/tree/main/src"):
+            self.assertEqual(process_github_repo(repo_url, use_archive=True), process_github_repo(repo_url))
+
+    def test_exclude_patterns_apply_to_listing_and_archive(self):
+        path_filter = onefilellm.PathFilter(exclude=["lib/", "/*.txt"])
+        for repo_url in (self.server.repo_url, f"{self.server.repo_url}/tree/main/src"):
+            listed = process_github_repo(repo_url, path_filter=path_filter)
+            self.assertEqual(process_github_repo(repo_url, use_archive=True, path_filter=path_filter), listed)
+            self.assertIn('<file name="src/app.py">', listed)
+            self.assertIn('<file name="src/lib.py">', listed)
+            self.assertNotIn("util.py", listed)
+        # "/*.txt" is anchored to the ingested root, so it only drops z.txt when that root is src
+        self.assertIn("src/z.txt", process_github_repo(self.server.repo_url, path_filter=path_filter))
+        self.assertNotIn("src/z.txt", process_github_repo(f"{self.server.repo_url}/tree/main/src", path_filter=path_filter))
+
+@unittest.skipUnless(importlib.util.find_spec("flask"), "flask is not installed")
+class TestWebAppJobs(unittest.TestCase):
+    """Web app job queue tests that ingest from the mock GitHub API."""
+
+    def setUp(self):
+        import web_app
+
+        self.web_app = web_app
+        self.jobs_dir = tempfile.mkdtemp()
+        self.server = MockGitHubServer(TestGitHubRepoMock.files).__enter__()
+        self.original_api_url, self.original_token = onefilellm.GITHUB_API_URL, onefilellm.TOKEN
+        onefilellm.GITHUB_API_URL = self.server.api_url
+        onefilellm.TOKEN = "mock-token"  # The mock server accepts any token, so these tests run without GITHUB_TOKEN
+        self.original_jobs = web_app.jobs
+        web_app.jobs = web_app.JobQueue(workers=2, jobs_dir=self.jobs_dir, counter=onefilellm.TokenCounter())
+        self.client = web_app.app.test_client()
+        self.expected = process_github_repo(self.server.repo_url)
+
+    def tearDown(self):
+        self.web_app.jobs.shutdown()
+        self.web_app.jobs = self.original_jobs
+        onefilellm.GITHUB_API_URL, onefilellm.TOKEN = self.original_api_url, self.original_token
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.jobs_dir)
+
+    def submit(self):
+        response = self.client.post("/jobs", json={"input_path": self.server.repo_url})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()["id"]
+        return job_id
+
+    def test_concurrent_jobs_run_in_separate_workspaces(self):
+        job_ids = [self.submit() for _ in range(3)]
+        for job_id in job_ids:
+            self.assertTrue(self.web_app.jobs.get(job_id).done.wait(30))
+            status = self.client.get(f"/jobs/{job_id}").get_json()
+            self.assertEqual(status["state"], "done")
+            self.assertEqual(status["tokens"]["uncompressed"], onefilellm.get_token_count(self.expected))
+            self.assertIn("token_manifest.json", status["files"])
+            response = self.client.get(f"/jobs/{job_id}/files/uncompressed_output.txt")
+            self.assertEqual(response.get_data(as_text=True), self.expected)
+            response.close()
+        self.assertEqual(len({self.web_app.jobs.get(job_id).workspace for job_id in job_ids}), 3)
+        self.assertEqual(self.client.get("/jobs/unknown").status_code, 404)
+
+    def test_event_stream_sends_status_and_output(self):
+        job_id = self.submit()
+        body = self.client.get(f"/jobs/{job_id}/events").get_data(as_text=True)
+        events = [(event, json.loads(data)) for event, data in re.findall(r"event: (\w+)\ndata: (.*)\n\n", body)]
+        self.assertEqual(events[0][0], "status")
+        self.assertEqual(events[-1][0], "end")
+        self.assertEqual(events[-1][1]["state"], "done")
+        self.assertEqual("".join(data["text"] for event, data in events if event == "output"), self.expected)
+
+class TestTokenCounter(unittest.TestCase):
+    document = (
+        '<source type="local_directory" path="demo">\n'
+        '<file name="a.py">\ndef handler(request):\n    return {"status": "ok"}\n</file>\n'
+        '<file name="b &amp; c.md">\n# Title\n\nSome   words, numbers 12345 and émoji 🙂.\n</file>\n'
+        '</source>'
+    )
+
+    def test_counts_match_whole_text_encoding(self):
+        encoder = onefilellm.get_encoder()
+        self.assertIs(encoder, onefilellm.get_encoder())
+        sections = onefilellm.TokenCounter().count_sections(self.document)
+        self.assertEqual([name for name, _ in sections], [None, "a.py", None, "b & c.md", None])
+        for body, (_, tokens) in zip(re.split(r'<file name="[^"]*">|</file>', self.document), sections):
+            self.assertEqual(tokens, len(encoder.encode_ordinary(re.sub(r'<[^>]+>', '', body))))
+
+        long_text = "lines  of\n\n  text, with {braces}\n" * 5000
+        with patch.object(onefilellm, "TOKEN_SEGMENT_CHARS", 100):
+            self.assertEqual(onefilellm.get_token_count(long_text), len(encoder.encode_ordinary(long_text)))
+
+    def test_cached_counts_skip_encoding(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache_path = os.path.join(cache_dir, "token_counts.sqlite")
+        expected = onefilellm.TokenCounter().count(self.document)
+
+        self.assertEqual(onefilellm.TokenCounter(cache_path).count(self.document), expected)
+        counter = onefilellm.TokenCounter(cache_path)
+        with patch.object(counter, "encode_lengths", side_effect=AssertionError("encoded again")):
+            self.assertEqual(counter.count(self.document), expected)
+        self.assertEqual((counter.hits, counter.misses), (5, 0))
+
+    def test_manifest_rolls_up_directories_and_extensions(self):
+        uncompressed = (
+            '<source type="local_directory" path="demo">\n'
+            '<file name="README.md">\n# Demo project\n</file>\n'
+            '<file name="src/app.py">\nimport os\nprint(os.getcwd())\n</file>\n'
+            '<file name="src/lib/util.py">\ndef add(a, b):\n    return a + b\n</file>\n'
+            '</source>'
+        )
+        compressed = uncompressed.replace("    ", " ").replace("Demo project", "demo")
+        counter = onefilellm.TokenCounter()
+        manifest = onefilellm.build_token_manifest({"uncompressed": uncompressed, "compressed": compressed}, counter)
+
+        self.assertEqual([row["name"] for row in manifest["files"]], ["README.md", "src/app.py", "src/lib/util.py"])
+        util = manifest["files"][2]
+        self.assertEqual(util["uncompressed_bytes"], len("\ndef add(a, b):\n    return a + b\n"))
+        self.assertEqual(util["uncompressed_tokens"], counter.count("\ndef add(a, b):\n    return a + b\n"))
+        directories = {row["directory"]: row for row in manifest["directories"]}
+        self.assertEqual(sorted(directories), ["src", "src/lib"])
+        self.assertEqual(directories["src"]["files"], 2)
+        self.assertEqual(directories["src"]["compressed_tokens"],
+                         manifest["files"][1]["compressed_tokens"] + util["compressed_tokens"])
+        self.assertEqual([row["extension"] for row in manifest["extensions"]], [".py", ".md"])
+        self.assertEqual(manifest["totals"]["uncompressed"]["tokens"], counter.count(uncompressed))
+
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        json_path, csv_path = os.path.join(output_dir, "m.json"), os.path.join(output_dir, "m.csv")
+        onefilellm.write_token_manifest(manifest, json_path, csv_path)
+        with open(json_path) as f:
+            self.assertEqual(json.load(f), manifest)
+        with open(csv_path) as f:
+            rows = f.read().splitlines()
+        self.assertEqual(rows[0], "kind,name,files,uncompressed_bytes,uncompressed_tokens,compressed_bytes,compressed_tokens")
+        self.assertEqual(len(rows), 1 + 1 + 2 + 2 + 3)
+
+class TestCompressor(unittest.TestCase):
+    document = (
+        '<source type="local_directory" path="a &amp; b">\n'
+        '<file name="The File.py">\nThe QUICK brown fox &amp; the lazy dog &lt;tag&gt; café\r\n</file>\n'
+        '<file name="empty.py">\n\n</file><file name="stop.py">the and of</file>\n'
+        '<meta note="line&#10;two &quot;quoted&quot;"/><item>Text<child/>Tail text</item>\n'
+        '</source>'
+    )
+
+    def compress(self, text, function, *args):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        input_file, output_file = os.path.join(directory, "in.txt"), os.path.join(directory, "out.txt")
+        with open(input_file, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        function(input_file, output_file, *args)
+        with open(output_file, "rb") as f:
+            return f.read()
+
+    def test_streaming_matches_whole_tree(self):
+        expected = self.compress(self.document, onefilellm.preprocess_text_tree)
+        self.assertIn(b'<file name="empty.py" /><file name="stop.py" />', expected)
+        self.assertEqual(self.compress(self.document, onefilellm.preprocess_text), expected)
+        with patch.object(onefilellm, "COMPRESS_BATCH_CHARS", 16):
+            self.assertEqual(self.compress(self.document, onefilellm.preprocess_text, 2), expected)
+
+    def test_malformed_xml_is_compressed_as_plain_text(self):
+        text = "<a>The unclosed <b> element\nand MORE text " * 50
+        self.assertEqual(self.compress(text, onefilellm.preprocess_text),
+                         onefilellm.compress_text(text).encode("utf-8"))
+        namespaced = '<a xmlns="urn:x"><b>Namespaced Text</b></a>'
+        self.assertEqual(self.compress(namespaced, onefilellm.preprocess_text),
+                         self.compress(namespaced, onefilellm.preprocess_text_tree))
+
+    def test_pipeline_matches_separate_passes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output_file, compressed_file = os.path.join(directory, "out.txt"), os.path.join(directory, "compressed.txt")
+        counter = onefilellm.TokenCounter()
+        for text in (self.document * 3, "<a>The unclosed <b> element\nand MORE text " * 50):
+            with patch.object(onefilellm, "PIPELINE_CHUNK_CHARS", 8):
+                with onefilellm.OutputPipeline(output_file, compressed_file, counter) as pipeline:
+                    for start in range(0, len(text), 5):
+                        pipeline.write(text[start:start + 5])
+                    pipeline.close()
+            with open(output_file, encoding="utf-8", newline="") as f:
+                self.assertEqual(f.read(), text)
+            with open(compressed_file, "rb") as f:
+                compressed = f.read()
+            self.assertEqual(compressed, self.compress(text, onefilellm.preprocess_text))
+            self.assertEqual(onefilellm.build_token_manifest(pipeline.sections, counter),
+                             onefilellm.build_token_manifest({"uncompressed": text,
+                                                              "compressed": compressed.decode("utf-8")}, counter))
+
+class TestNotebookConverter(unittest.TestCase):
+    notebook = json.dumps({
+        "cells": [
+            {"cell_type": "markdown", "metadata": {}, "source": ["# Analysis\n", "\n", "Load the **data**."]},
+            {"cell_type": "code", "execution_count": 1, "metadata": {}, "source": ["%matplotlib inline\n", "import os"],
+             "outputs": [{"output_type": "stream", "name": "stdout", "text": ["x" * 50 + "\n"]}]},
+            {"cell_type": "code", "execution_count": None, "metadata": {}, "outputs": [], "source": ""},
+            {"cell_type": "code", "execution_count": 3, "metadata": {}, "outputs": [],
+             "source": "\n    for i in range(3):\n        print(i)"},
+            {"cell_type": "raw", "metadata": {}, "source": "raw = True\n"},
+            {"cell_type": "raw", "metadata": {"raw_mimetype": "text/html"}, "source": "<b>dropped</b>"},
+        ],
+        "metadata": {}, "nbformat": 4, "nbformat_minor": 5,
+    })
+
+    def test_fast_converter_matches_nbconvert(self):
+        self.assertEqual(onefilellm.convert_notebook_fast(self.notebook),
+                         onefilellm.convert_notebook_nbconvert(self.notebook))
+
+    def test_outputs_are_truncated_comments(self):
+        converted = onefilellm.convert_notebook_fast(self.notebook, output_chars=10)
+        self.assertIn("\n# Output:\n# xxxxxxxxxx... [40 more characters]\n", converted)
+        self.assertEqual(converted.count("# Output:"), 1)
+
+    def test_spawned_workers_use_the_notebook_settings(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name in ("a.ipynb", "b.ipynb", "c.py"):
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                f.write(self.notebook if name.endswith(".ipynb") else "x = 1\n")
+        # Spawned workers re-import onefilellm, so they only see settings passed with each task
+        spawn = functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn"))
+        with patch.object(onefilellm, "NOTEBOOK_OUTPUT_CHARS", 10), patch.object(onefilellm, "LOCAL_CHUNK_SIZE", 1):
+            expected = process_local_folder(directory)
+            with patch.object(onefilellm, "ProcessPoolExecutor", spawn):
+                self.assertEqual(process_local_folder(directory, jobs=2), expected)
+        self.assertEqual(expected.count("# xxxxxxxxxx... [40 more characters]"), 2)
+
+class TestPdfExtraction(unittest.TestCase):
+    def test_parallel_pages_match_serial_extraction(self):
+        data = make_pdf(num_pages=onefilellm.PDF_PARALLEL_MIN_PAGES + 3, lines_per_page=5)
+        serial = list(onefilellm.iter_pdf_pages(data, jobs=1))
+        self.assertEqual(len(serial), onefilellm.PDF_PARALLEL_MIN_PAGES + 3)
+        self.assertIn("page 19", serial[18])
+        self.assertEqual(list(onefilellm.iter_pdf_pages(data, jobs=2)), serial)
+
+class TestCrawlMock(unittest.TestCase):
+    """Crawler tests that run against a local documentation site."""
+
+    def setUp(self):
+        self.server = MockSiteServer(make_docs_site(num_pages=12, links_per_page=3, paragraphs=2)).__enter__()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+
+    def crawl(self, **kwargs):
+        return crawl_and_extract_text(self.server.base_url, max_depth=1, include_pdfs=False, ignore_epubs=True, **kwargs)
+
+    def test_crawl_extracts_visible_text(self):
+        result = self.crawl()
+        self.assertEqual(result['processed_urls'][0], self.server.base_url)
+        self.assertEqual(len(result['processed_urls']), len(set(result['processed_urls'])))
+        self.assertIn(f'<page url="{self.server.root_url}/docs/page7.html">', result['content'])
+        self.assertIn("Documentation home", result['content'])
+        self.assertIn("configure()\ncall accepts options &amp; returns a client.", result['content'])
+        self.assertNotIn("var page", result['content'])
+        self.assertNotIn("generated", result['content'])
+
+    @unittest.skipIf(not onefilellm.LXML_AVAILABLE, "lxml is not installed")
+    def test_lxml_extractor_matches_beautifulsoup(self):
+        pages = [page.encode("utf-8") for page in make_docs_site(num_pages=3).values()] + [
+            "<html><head><meta charset='latin-1'><title>T</title></head><body><p>a<!-- c -->b<script>x</script>"
+            "tail<?pi x?>z&amp; é<![CDATA[ cd ]]></p></body></html>".encode("latin-1"),
+            b"<p>unclosed <b>bold <a href='/x?a=1&amp;b=2'>link</a></p> after<template>t<a href=t>in</a></template>",
+            b"\xef\xbb\xbf<ruby>kan<rt>k</rt>ji</ruby>",
+            b"",
+        ]
+        for page in pages:
+            self.assertEqual(onefilellm.extract_html_lxml(page), onefilellm.extract_html_beautifulsoup(page))
+        self.assertEqual(self.crawl(html_extractor="lxml"), self.crawl(html_extractor="beautifulsoup"))
+
+        # The documented differences (see extract_html_lxml)
+        crlf = b"<p>first line of the\r\nparagraph\rend</p>"
+        self.assertEqual(onefilellm.extract_html_beautifulsoup(crlf)[0], "first line of the\r\nparagraph\rend")
+        self.assertEqual(onefilellm.extract_html_lxml(crlf)[0], "first line of the\nparagraph\nend")
+        for tag in ("textarea", "xmp", "plaintext", "iframe", "noembed"):
+            page = f"<body><p>a</p><{tag}>x <b>bold</b></{tag}></body>".encode("utf-8")
+            self.assertEqual(onefilellm.extract_html_beautifulsoup(page)[0], "a\nx\nbold")
+            self.assertTrue(onefilellm.extract_html_lxml(page)[0].startswith("a\nx <b>bold</b>"))
+
+    @unittest.skipIf(not onefilellm.LXML_AVAILABLE, "lxml is not installed")
+    def test_http_cache_reuses_extractions_only_from_the_same_extractor(self):
+        self.server.pages["/docs/"] = self.server.pages["/docs/"].replace("</body>", "<textarea>x <b>bold</b></textarea></body>")
+        expected = self.crawl(html_extractor="lxml")
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.addCleanup(setattr, onefilellm, "http_cache", None)
+        onefilellm.http_cache = onefilellm.HTTPCache(os.path.join(cache_dir, "http_cache.sqlite"))
+
+        self.assertNotEqual(self.crawl(html_extractor="beautifulsoup"), expected)
+        self.assertEqual(self.crawl(html_extractor="lxml"), expected)
+        self.assertEqual(onefilellm.http_cache.revalidated, len(expected['processed_urls']))
+
+    def test_crawl_extracts_linked_pdfs_in_memory(self):
+        self.server.pages["/docs/paper.pdf"] = make_pdf(num_pages=2, lines_per_page=2)
+        self.server.pages["/docs/"] = self.server.pages["/docs/"].replace("</body>", '<a href="paper.pdf">Paper</a></body>')
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, os.getcwd())
+
+        result = crawl_and_extract_text(self.server.base_url, 1, True, True)
+        self.assertIn(f"{self.server.root_url}/docs/paper.pdf", result['processed_urls'])
+        self.assertIn("Sample paper, page 2", result['content'])
+        self.assertEqual(os.listdir("."), [])
+
+    def test_concurrent_crawl_keeps_discovery_order(self):
+        self.server.latency = 0.01
+        sequential = crawl_and_extract_text(self.server.base_url, 2, False, True, concurrency=1)
+        concurrent = crawl_and_extract_text(self.server.base_url, 2, False, True, concurrency=8, per_host_limit=8,
+                                            parse_workers=2)
+        self.assertEqual(sequential, concurrent)
+        self.assertEqual(len(concurrent['processed_urls']), 13)
+
+    def test_http_cache_revalidates_unchanged_pages(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.addCleanup(setattr, onefilellm, "http_cache", None)
+        onefilellm.http_cache = onefilellm.HTTPCache(os.path.join(cache_dir, "http_cache.sqlite"))
+
+        first = self.crawl()
+        self.assertEqual(self.server.not_modified_count, 0)
+        second = self.crawl()
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.not_modified_count, len(second['processed_urls']))
+        self.assertEqual(onefilellm.http_cache.revalidated, len(second['processed_urls']))
+
+    def test_http_cache_evicts_least_recently_used(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.addCleanup(setattr, onefilellm, "http_cache", None)
+        onefilellm.http_cache = onefilellm.HTTPCache(os.path.join(cache_dir, "http_cache.sqlite"), max_bytes=4000)
+
+        pages = len(self.crawl()['processed_urls'])
+        db = onefilellm.http_cache._db
+        stored, size = db.execute("SELECT COUNT(*), SUM(size) FROM responses").fetchone()
+        self.assertLess(stored, pages)
+        self.assertEqual(onefilellm.http_cache.size, size)
+        self.assertLessEqual(size, 4000)
+
+    def test_boilerplate_is_stripped_from_all_but_the_first_page(self):
+        plain = self.crawl()['content']
+        boilerplate = onefilellm.BoilerplateFilter(onefilellm.TokenCounter())
+        stripped = self.crawl(boilerplate=boilerplate)['content']
+        self.assertEqual(plain.count("Section 3\n"), len(re.findall("<page ", plain)))
+        self.assertEqual(stripped.count("Section 3\n"), 1)
+        self.assertEqual(stripped.count("Built with Sphinx."), 1)
+        for i in range(10):
+            self.assertIn(f"Topic {i}\nPage {i} paragraph 0: the\nconfigure()\n", stripped)
+        self.assertEqual(boilerplate.pages, len(re.findall("<page ", stripped)))
+        self.assertLess(boilerplate.tokens_after, boilerplate.tokens_before / 2)
+
+    def test_boilerplate_keeps_lone_repeated_lines_inside_pages(self):
+        boilerplate = onefilellm.BoilerplateFilter()
+        pages = [f"Home\nGuide\nAPI\nPage {i}\nParameters\nvalue {i}\nFooter" for i in range(4)]
+        for page in pages:
+            boilerplate.add(page)
+        self.assertEqual([boilerplate.strip(page) for page in pages],
+                         [pages[0]] + [f"Page {i}\nParameters\nvalue {i}" for i in range(1, 4)])
+
+    def test_dedup_replaces_repeated_pages_with_references(self):
+        rng = random.Random(0)
+        article = " ".join(rng.choice(["client", "option", "request", "server", "config", "token", "cache", "page",
+                                       "returns", "accepts", "the", "a", "with", "from", "each", "value"])
+                           for _ in range(400))
+        pages = make_docs_site(num_pages=12, links_per_page=3, paragraphs=2)
+        pages["/docs/page2.html"] = pages["/docs/page1.html"]  # The same page under another URL
+        pages["/docs/page3.html"] = pages["/docs/page3.html"].replace("<h1>", f"<p>{article} revision 1</p><h1>")
+        pages["/docs/page4.html"] = pages["/docs/page3.html"].replace("revision 1", "revision 2")
+        with MockSiteServer(pages) as server:
+            def crawl(dedup):
+                return crawl_and_extract_text(server.base_url, max_depth=1, include_pdfs=False, ignore_epubs=True,
+                                              dedup=dedup)['content']
+
+            exact = onefilellm.Deduplicator()
+            content = crawl(exact)
+            self.assertIn(f'<page url="{server.root_url}/docs/page2.html" '
+                          f'duplicate_of="{server.root_url}/docs/page1.html"></page>', content)
+            self.assertEqual([entry[:2] for entry in exact.duplicates],
+                             [(f"{server.root_url}/docs/page2.html", f"{server.root_url}/docs/page1.html")])
+
+            near = onefilellm.Deduplicator(near=True)
+            content = crawl(near)
+            self.assertIn(f'<page url="{server.root_url}/docs/page4.html" '
+                          f'duplicate_of="{server.root_url}/docs/page3.html"></page>', content)
+            self.assertEqual(len(near.duplicates), 2)
+
+    def test_interrupted_crawl_resumes_from_checkpoint(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        state_path = os.path.join(state_dir, "crawl.sqlite")
+        expected = crawl_and_extract_text(self.server.base_url, 2, False, True, concurrency=1)
+        full_requests = self.server.request_count
+
+        fetch_page = onefilellm.fetch_page
+        fetched = []
+
+        def crash_after_five_pages(url):
+            if len(fetched) == 5:
+                raise KeyboardInterrupt
+            fetched.append(url)
+            return fetch_page(url)
+
+        with patch.object(onefilellm, "fetch_page", crash_after_five_pages):
+            with self.assertRaises(KeyboardInterrupt):
+                crawl_and_extract_text(self.server.base_url, 2, False, True, concurrency=1, state_path=state_path)
+        self.assertTrue(os.path.exists(state_path))
+
+        self.server.request_count = 0
+        resumed = crawl_and_extract_text(self.server.base_url, 2, False, True, concurrency=4, state_path=state_path)
+        self.assertEqual(resumed, expected)
+        self.assertLessEqual(self.server.request_count, full_requests - 4)
+        self.assertFalse(os.path.exists(state_path))
+
 if __name__ == "__main__":
     unittest.main()
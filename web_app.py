@@ -1,17 +1,232 @@
-from flask import Flask, request, render_template_string, send_file
+from flask import Flask, Response, abort, jsonify, redirect, request, render_template_string, send_file
+import codecs
+import json
+import logging
 import os
-import sys
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
-# Import functions from onefilellm.py. 
+# Import functions from onefilellm.py.
 # Ensure onefilellm.py is accessible in the same directory.
 from onefilellm import process_github_repo, process_github_pull_request, process_github_issue
-from onefilellm import process_arxiv_pdf, process_local_folder, fetch_youtube_transcript
-from onefilellm import crawl_and_extract_text, process_doi_or_pmid, get_token_count, preprocess_text, safe_file_read
-from pathlib import Path
-import pyperclip
+from onefilellm import process_arxiv_pdf, write_local_folder, fetch_youtube_transcript
+from onefilellm import crawl_and_extract_text, process_doi_or_pmid
+from onefilellm import OutputPipeline, TokenCounter, CACHE_DIR, build_token_manifest, write_token_manifest, configure_logging
+
+WEB_JOB_WORKERS = int(os.getenv("ONEFILELLM_WEB_WORKERS", "2"))  # Ingestion jobs run at once; later ones wait in the queue
+WEB_MAX_QUEUED_JOBS = 32  # Jobs that may wait for a worker; beyond that new jobs are refused with 503
+WEB_KEPT_JOBS = 50  # Finished jobs kept for status and downloads; the oldest are deleted with their workspaces
+WEB_JOBS_DIR = os.getenv("ONEFILELLM_WEB_JOBS_DIR", os.path.join(CACHE_DIR, "web_jobs"))  # Parent of the per-job workspaces
+WEB_EVENT_INTERVAL = 0.25  # Seconds between checks for new progress and output in an event stream
+WEB_EVENT_CHARS = 1 << 16  # Output characters sent per event
+JOB_FILES = ("uncompressed_output.txt", "compressed_output.txt", "token_manifest.json", "token_manifest.csv",
+             "processed_urls.txt")  # The files a job may write to its workspace, and the only ones served
 
 app = Flask(__name__)
 
+# Shared by all jobs: one encoder per process, and counts cached by content hash across runs
+token_counter = TokenCounter(os.path.join(CACHE_DIR, "token_counts.sqlite"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    """One ingestion request, run in its own workspace directory."""
+
+    def __init__(self, input_path, workspace):
+        self.id = uuid.uuid4().hex
+        self.input_path = input_path
+        self.workspace = workspace
+        self.state = "queued"  # Then "running", and "done" or "failed"
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.chars_written = 0
+        self.tokens = None
+        self.done = threading.Event()
+
+    def path(self, filename):
+        return os.path.join(self.workspace, filename)
+
+    def status(self):
+        return {
+            "id": self.id,
+            "input_path": self.input_path,
+            "state": self.state,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "chars_written": self.chars_written,
+            "tokens": self.tokens,
+            "files": [name for name in JOB_FILES if self.done.is_set() and os.path.exists(self.path(name))],
+        }
+
+
+class ProgressSink:
+    """Text sink that passes writes on to `sink` and keeps count of them on the job."""
+
+    def __init__(self, sink, job):
+        self.sink = sink
+        self.job = job
+
+    def write(self, text):
+        self.sink.write(text)
+        self.job.chars_written += len(text)
+
+
+def write_source(input_path, sink, workspace):
+    """Write the document for `input_path` to `sink`, choosing the source type like onefilellm.main."""
+    parsed = urlparse(input_path)
+    if "github.com" in input_path:
+        if "/pull/" in input_path:
+            final_output = process_github_pull_request(input_path)
+        elif "/issues/" in input_path:
+            final_output = process_github_issue(input_path)
+        else:
+            final_output = process_github_repo(input_path)
+    elif parsed.scheme in ["http", "https"]:
+        if "youtube.com" in input_path or "youtu.be" in input_path:
+            final_output = fetch_youtube_transcript(input_path)
+        elif "arxiv.org" in input_path:
+            final_output = process_arxiv_pdf(input_path)
+        else:
+            crawl_result = crawl_and_extract_text(input_path, max_depth=2, include_pdfs=True, ignore_epubs=True)
+            final_output = crawl_result['content']
+            with open(os.path.join(workspace, "processed_urls.txt"), 'w', encoding='utf-8') as urls_file:
+                urls_file.write('\n'.join(crawl_result['processed_urls']))
+    elif (input_path.startswith("10.") and "/" in input_path) or input_path.isdigit():
+        final_output = process_doi_or_pmid(input_path)
+    else:
+        # Streamed file by file instead of being built as one string
+        write_local_folder(input_path, sink)
+        return
+    sink.write(final_output)
+
+
+def run_job(job, counter):
+    """Ingest the job's input into its workspace: both outputs and the token manifest."""
+    with OutputPipeline(job.path("uncompressed_output.txt"), job.path("compressed_output.txt"), counter) as pipeline:
+        write_source(job.input_path, ProgressSink(pipeline, job), job.workspace)
+        pipeline.close()
+    manifest = build_token_manifest({"uncompressed": pipeline.sections["uncompressed"],
+                                     "compressed": pipeline.sections["compressed"]}, counter)
+    write_token_manifest(manifest, job.path("token_manifest.json"), job.path("token_manifest.csv"))
+    job.tokens = {variant: manifest["totals"][variant]["tokens"] for variant in ("uncompressed", "compressed")}
+
+
+class JobQueue:
+    """
+    Run ingestion jobs on a pool of `workers` threads, each job writing to
+    its own workspace under `jobs_dir` so that concurrent jobs never share
+    output files.
+
+    submit() returns at once; at most `max_queued` jobs may wait for a
+    worker before it raises QueueFull. Only the `kept` most recent finished
+    jobs are remembered; older ones are forgotten and their workspaces
+    deleted.
+    """
+
+    def __init__(self, workers=WEB_JOB_WORKERS, max_queued=WEB_MAX_QUEUED_JOBS, jobs_dir=WEB_JOBS_DIR,
+                 kept=WEB_KEPT_JOBS, counter=None):
+        self.max_queued = max_queued
+        self.jobs_dir = jobs_dir
+        self.kept = kept
+        self.counter = counter or TokenCounter()
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onefilellm-job")
+
+    def submit(self, input_path):
+        with self._lock:
+            if sum(job.state == "queued" for job in self.jobs.values()) >= self.max_queued:
+                raise QueueFull(f"{self.max_queued} jobs are already waiting")
+            os.makedirs(self.jobs_dir, exist_ok=True)
+            job = Job(input_path, tempfile.mkdtemp(prefix="job-", dir=self.jobs_dir))
+            self.jobs[job.id] = job
+            self._forget_finished()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def _forget_finished(self):
+        finished = [job for job in self.jobs.values() if job.done.is_set()]
+        for job in finished[:max(len(finished) - self.kept, 0)]:
+            del self.jobs[job.id]
+            shutil.rmtree(job.workspace, ignore_errors=True)
+
+    def _run(self, job):
+        job.state = "running"
+        job.started = time.time()
+        try:
+            run_job(job, self.counter)
+            job.state = "done"
+        except Exception as e:
+            logging.error(f"Job {job.id} for {job.input_path} failed: {str(e)}")
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            job.finished = time.time()
+            job.done.set()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+jobs = JobQueue(counter=token_counter)
+
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_job_events(job, output=True):
+    """
+    Server-sent events for a job: "status" whenever its status changes,
+    "output" with each new piece of its uncompressed output (read from its
+    workspace as it is written), and a final "end" with the last status.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    position = 0
+    last_status = None
+    while True:
+        finished = job.done.is_set()
+        status = job.status()
+        if status != last_status:
+            yield server_sent_event("status", status)
+            last_status = status
+        text = ""
+        if output and os.path.exists(job.path("uncompressed_output.txt")):
+            with open(job.path("uncompressed_output.txt"), "rb") as f:
+                f.seek(position)
+                data = f.read(WEB_EVENT_CHARS)
+            position += len(data)
+            text = decoder.decode(data, final=finished and not data)
+            if text:
+                yield server_sent_event("output", {"text": text})
+        if finished and not text:
+            yield server_sent_event("end", status)
+            return
+        if not text:
+            time.sleep(WEB_EVENT_INTERVAL)
+
+
 # Simple HTML template using inline rendering for demonstration.
 template = """
 <!DOCTYPE html>
@@ -34,95 +249,105 @@ template = """
         <button type="submit">Process</button>
     </form>
 
-    {% if output %}
+    {% if error %}
+    <p>Error: {{ error }}</p>
+    {% endif %}
+
+    {% if job %}
     <div class="output-container">
-        <h2>Processed Output</h2>
-        <pre>{{ output }}</pre>
-        
+        <h2>{{ job.input_path }}</h2>
+        <p id="status">Status: {{ job.state }}</p>
+        <pre id="output"></pre>
+
         <h3>Token Counts</h3>
-        <p>Uncompressed Tokens: {{ uncompressed_token_count }}<br>
-        Compressed Tokens: {{ compressed_token_count }}</p>
+        <p id="tokens"></p>
 
-        <div class="file-links">
-            <a href="/download?filename=uncompressed_output.txt">Download Uncompressed Output</a> |
-            <a href="/download?filename=compressed_output.txt">Download Compressed Output</a>
-        </div>
+        <div class="file-links" id="files"></div>
     </div>
+    <script>
+    const events = new EventSource("/jobs/{{ job.id }}/events");
+    const output = document.getElementById("output");
+    function showStatus(status) {
+        document.getElementById("status").textContent = "Status: " + status.state +
+            (status.error ? " (" + status.error + ")" : "") + ", " + status.chars_written + " characters written";
+        if (status.tokens) {
+            document.getElementById("tokens").innerHTML = "Uncompressed Tokens: " + status.tokens.uncompressed +
+                "<br>Compressed Tokens: " + status.tokens.compressed;
+        }
+        document.getElementById("files").innerHTML = status.files.map(name =>
+            '<a href="/jobs/{{ job.id }}/files/' + name + '">Download ' + name + '</a>').join(" | ");
+    }
+    events.addEventListener("status", event => showStatus(JSON.parse(event.data)));
+    events.addEventListener("output", event => { output.textContent += JSON.parse(event.data).text; });
+    events.addEventListener("end", event => { showStatus(JSON.parse(event.data)); events.close(); });
+    </script>
     {% endif %}
 </body>
 </html>
 """
 
+
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
         input_path = request.form.get("input_path", "").strip()
+        if not input_path:
+            return render_template_string(template, error="Enter a URL, path, DOI or PMID"), 400
+        try:
+            job = jobs.submit(input_path)
+        except QueueFull as e:
+            return render_template_string(template, error=str(e)), 503
+        # Post/redirect/get: the page follows the job through its event stream
+        return redirect(f"/?job={job.id}", code=303)
 
-        # Prepare filenames
-        output_file = "uncompressed_output.txt"
-        processed_file = "compressed_output.txt"
-        urls_list_file = "processed_urls.txt"
+    job = jobs.get(request.args.get("job", ""))
+    return render_template_string(template, job=job)
 
-        # Determine input type and process accordingly (mirroring logic from onefilellm.py main)
-        try:
-            from urllib.parse import urlparse
-            parsed = urlparse(input_path)
-
-            if "github.com" in input_path:
-                if "/pull/" in input_path:
-                    final_output = process_github_pull_request(input_path)
-                elif "/issues/" in input_path:
-                    final_output = process_github_issue(input_path)
-                else:
-                    final_output = process_github_repo(input_path)
-            elif parsed.scheme in ["http", "https"]:
-                if "youtube.com" in input_path or "youtu.be" in input_path:
-                    final_output = fetch_youtube_transcript(input_path)
-                elif "arxiv.org" in input_path:
-                    final_output = process_arxiv_pdf(input_path)
-                else:
-                    crawl_result = crawl_and_extract_text(input_path, max_depth=2, include_pdfs=True, ignore_epubs=True)
-                    final_output = crawl_result['content']
-                    with open(urls_list_file, 'w', encoding='utf-8') as urls_file:
-                        urls_file.write('\n'.join(crawl_result['processed_urls']))
-            elif (input_path.startswith("10.") and "/" in input_path) or input_path.isdigit():
-                final_output = process_doi_or_pmid(input_path)
-            else:
-                final_output = process_local_folder(input_path)
-
-            # Write the uncompressed output
-            with open(output_file, "w", encoding="utf-8") as file:
-                file.write(final_output)
-
-            # Process the compressed output
-            preprocess_text(output_file, processed_file)
-
-            compressed_text = safe_file_read(processed_file)
-            compressed_token_count = get_token_count(compressed_text)
-
-            uncompressed_text = safe_file_read(output_file)
-            uncompressed_token_count = get_token_count(uncompressed_text)
-
-            # Copy to clipboard
-            pyperclip.copy(uncompressed_text)
-
-            return render_template_string(template,
-                                          output=final_output,
-                                          uncompressed_token_count=uncompressed_token_count,
-                                          compressed_token_count=compressed_token_count)
-        except Exception as e:
-            return render_template_string(template, output=f"Error: {str(e)}")
 
-    return render_template_string(template)
+@app.route("/jobs", methods=["GET", "POST"])
+def job_list():
+    if request.method == "GET":
+        return jsonify([job.status() for job in jobs.list()])
+    data = request.get_json(silent=True) or request.form
+    input_path = (data.get("input_path") or "").strip()
+    if not input_path:
+        return jsonify({"error": "input_path is required"}), 400
+    try:
+        job = jobs.submit(input_path)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    return jsonify(job.status()), 202, {"Location": f"/jobs/{job.id}"}
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    return jsonify(get_job(job_id).status())
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = get_job(job_id)
+    output = request.args.get("output", "1") != "0"
+    return Response(iter_job_events(job, output), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 
+@app.route("/jobs/<job_id>/files/<filename>")
+def job_file(job_id, filename):
+    job = get_job(job_id)
+    if filename not in JOB_FILES or not job.done.is_set() or not os.path.exists(job.path(filename)):
+        return "File not found", 404
+    return send_file(job.path(filename), as_attachment=True)
 
-@app.route("/download")
-def download():
-    filename = request.args.get("filename")
-    if filename and os.path.exists(filename):
-        return send_file(filename, as_attachment=True)
-    return "File not found", 404
 
 if __name__ == "__main__":
+    configure_logging()
     # Run the app in debug mode for local development
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    app.run(debug=True, host="0.0.0.0", port=5000, threaded=True)